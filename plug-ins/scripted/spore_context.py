@@ -23,6 +23,8 @@ import message_utils
 import brush_state
 import event_filter
 import brush_utils
+import transform_utils
+import undo_store
 import logging_util
 
 
@@ -36,6 +38,9 @@ K_CONTEXT_NAME="sporeContext"
 
 K_TRACKING_DICTIONARY = {}
 
+# undo records of all tool commands, capped to 256 MB
+K_UNDO_STORE = undo_store.UndoStore(256 * 1024 * 1024)
+
 
 """ -------------------------------------------------------------------- """
 """ Sender """
@@ -70,10 +75,13 @@ class SporeToolCmd(ompx.MPxToolCommand):
         self.instance_data = None
         self.last_brush_position = None
 
-        self.last_undo_journal = ''
+        # points before they are modified during the stroke and the id of
+        # the undo record that is created from them on finalize
         self.last_count = 0
-        self.last_state = {}
-        self.next_redo_journal = ''
+        self.undo_index = []
+        self.undo_values = []
+        self.recorded = np.zeros(0, dtype=bool)
+        self.undo_id = None
 
         self.position = om.MVectorArray()
         self.scale = om.MVectorArray()
@@ -100,6 +108,8 @@ class SporeToolCmd(ompx.MPxToolCommand):
         except KeyError:
             pass
 
+        K_UNDO_STORE.remove(self.undo_id)
+
     @staticmethod
     def creator():
         return ompx.asMPxPtr(SporeToolCmd())
@@ -124,7 +134,13 @@ class SporeToolCmd(ompx.MPxToolCommand):
         flag = self.brush_state.action
         if flag == SporeToolCmd.k_click:
             self.last_count = len(self.instance_data)
-            self.last_state = {}
+            self.undo_index = []
+            self.undo_values = []
+            self.recorded = np.zeros(len(self.instance_data), dtype=bool)
+
+            # coalesce the viewport updates of the stroke
+            max_refresh_rate = sys._global_spore_dispatcher.spore_globals['MAX_REFRESH_RATE']
+            self.instance_data.begin_stroke(max_refresh_rate)
 
         # PLACE / SPRAY
         if self.brush_state.settings['mode'] == 'place'\
@@ -182,82 +198,74 @@ class SporeToolCmd(ompx.MPxToolCommand):
                 self.change_visibility(flag, 0)
 
     def redoIt(self):
-        self.logger.warn('Redo not implemented')
-        return
+
+        record = K_UNDO_STORE.get(self.undo_id)
+        if record is None:
+            self.logger.warn('Nothing to redo, the undo record has been dropped')
+            return
+
+        mode = record['mode']
+        index = record['index']
+        self.logger.info('Redo: {} {} points'.format(mode, len(index)))
+
+        if mode == 'place' or mode == 'spray':
+            self.instance_data.append_points(**record['new'])
+        else:
+            self.instance_data.set_points(index, **record['new'])
+
+            # the points had been removed before they were restored
+            if record.pop('restored', False):
+                self.instance_data.clean_up()
+
+        self.instance_data.set_state()
 
     def undoIt(self):
 
-        undo_command = self.last_undo_journal.split(' ')[2:]
-        self.logger.info('Undo: {}'.format(undo_command))
-        if not undo_command:
-            self.logger.warn('No more steps to undo')
+        record = K_UNDO_STORE.get(self.undo_id)
+        if record is None:
+            self.logger.warn('Nothing to undo, the undo record has been dropped')
             return
 
-        undo_mode = undo_command.pop(0)
-        if undo_mode == 'place' or undo_mode == 'spray':
-            self.undo_place_action(int(undo_command[0]), int(undo_command[1]))
-        elif undo_mode == 'scale':
-            self.undo_vector_action('scale', undo_command)
-        elif undo_mode == 'align':
-            self.undo_vector_action('rotation', undo_command)
-        elif undo_mode == 'move':
-            self.undo_vector_action('position', undo_command)
-        elif undo_mode == 'id':
-            self.undo_int_action('instance_id', undo_command)
-        elif undo_mode == 'remove':
-            self.undo_remove_action(undo_command)
-
-        self.last_undo_journal = cmds.undoInfo(q=True, un=True)
+        mode = record['mode']
+        index = record['index']
+        self.logger.info('Undo: {} {} points'.format(mode, len(index)))
+
+        if mode == 'place' or mode == 'spray':
+            self.undo_place_action(index)
+        elif mode == 'remove' and len(self.instance_data) < record['length']:
+            if self.undo_remove_action(index, record['old']):
+                record['restored'] = True
+            else:
+                self.logger.error('Failed to restore {} removed points'.format(len(index)))
+        else:
+            self.instance_data.set_points(index, **record['old'])
+
+        self.instance_data.set_state()
 
     def isUndoable(self):
         return True
 
     def finalize(self):
-        """ Command is finished, construct a string
-        for the command for journalling. """
+        """ Command is finished, store the undo record and construct
+        a string for the command for journalling. """
 
-        command = om.MArgList()
-        command.addArg(self.commandString())
-        command.addArg(self.brush_state.settings['mode'])
+        self.instance_data.end_stroke()
 
-        if self.brush_state.settings['mode'] == 'place'\
-        or self.brush_state.settings['mode'] == 'spray':
-            command.addArg(self.last_count)
-            command.addArg(len(self.instance_data) - 1)
+        # store the changes of the stroke as numpy deltas and only journal
+        # the mode and the number of changed points
+        record = self.create_undo_record()
+        self.undo_id = K_UNDO_STORE.add(record)
 
-        elif self.brush_state.settings['mode'] == 'scale'\
-        or self.brush_state.settings['mode'] == 'align'\
-        or self.brush_state.settings['mode'] == 'move'\
-        or self.brush_state.settings['mode'] == 'id':
-            for index, value in self.last_state.iteritems():
-                command.addArg(index)
-                command.addArg(value)
-
-        elif self.brush_state.settings['mode'] == 'remove':
-            for index, value in self.last_state.iteritems():
-                command.addArg(self.instance_data.position[index])
-                command.addArg(self.instance_data.scale[index])
-                command.addArg(self.instance_data.rotation[index])
-                command.addArg(self.instance_data.instance_id[index])
-                command.addArg(value) # self.instance_data.visibility[index])
-                command.addArg(self.instance_data.normal[index])
-                command.addArg(self.instance_data.tangent[index])
-                command.addArg(self.instance_data.u_coord[index])
-                command.addArg(self.instance_data.v_coord[index])
-                command.addArg(self.instance_data.poly_id[index])
-                command.addArg(self.instance_data.color[index])
-                command.addArg(self.instance_data.unique_id[index])
+        command = om.MArgList()
+        command.addArg(self.commandString())
+        command.addArg(record['mode'])
+        command.addArg(len(record['index']))
 
         # This call adds the command to the undo queue and sets
         # the journal string for the command.
-        self.logger.info('{}'.format(
-            str([str(command.asString(i)) for i in xrange(command.length())][1:]).strip('[]'))
-        )
+        self.logger.info('{} {} points'.format(record['mode'], len(record['index'])))
         ompx.MPxToolCommand._doFinalize(self, command)
 
-        for i in xrange(command.length()):
-            self.last_undo_journal += ' {}'.format(command.asString(i))
-
         # reset command variables
         self.position = om.MVectorArray()
         self.scale = om.MVectorArray()
@@ -277,6 +285,8 @@ class SporeToolCmd(ompx.MPxToolCommand):
         self.initial_offset = om.MDoubleArray()
         self.initial_id = om.MIntArray()
         self.spray_coords = []
+        self.undo_index = []
+        self.undo_values = []
 
     """ -------------------------------------------------------------------- """
     """ place """
@@ -302,25 +312,34 @@ class SporeToolCmd(ompx.MPxToolCommand):
         else:
             num_samples = 1
 
+        # in spray mode get random coords on the brush disk or get last values
+        # and project all samples onto the mesh at once
+        if self.brush_state.settings['mode'] == 'spray': # spray mode
+            if self.brush_state.shift_mod and flag != SporeToolCmd.k_click:
+                spray_coords = self.spray_coords[:num_samples]
+            else:
+                spray_coords = [(random.uniform(0, 2 * math.pi),
+                                 random.uniform(0, self.brush_state.radius))
+                                for i in xrange(num_samples)]
+                self.spray_coords.extend(spray_coords)
+            angle, distance = np.array(spray_coords).reshape(-1, 2).T
+
+            # place points on brush disk
+            axis = np.tile((b_normal.x, b_normal.y, b_normal.z), (num_samples, 1))
+            matrix = transform_utils.axis_angle_to_matrix(axis, angle)
+            tangential_vector = np.einsum('j,njk->nk', (b_tangent.x, b_tangent.y, b_tangent.z), matrix)
+            rand_pos = (b_position.x, b_position.y, b_position.z) + tangential_vector * distance[:, np.newaxis]
+            spray_position, spray_normal, _, _ = mesh_utils.project_points(self.brush_state.target, rand_pos)
+            spray_tangent = transform_utils.get_tangent(spray_normal)
+
         # set last placed points "cache" and begin to sample
         self.set_cache_length(num_samples)
         for i in xrange(num_samples):
 
-            # if in spay mode get random coords on the brush dist or get last values
             if self.brush_state.settings['mode'] == 'spray': # spray mode
-                if self.brush_state.shift_mod and flag != SporeToolCmd.k_click:
-                    angle, distance = self.spray_coords[i]
-                else:
-                    angle = random.uniform(0, 2 * math.pi)
-                    distance = random.uniform(0, self.brush_state.radius)
-                    self.spray_coords.append((angle, distance))
-
-                # place point on brush disk
-                rotation = om.MQuaternion(angle, b_normal)
-                tangential_vector = b_tangent.rotateBy(rotation)
-                rand_pos =  b_position + tangential_vector * distance
-                position, normal = mesh_utils.get_closest_point_and_normal(rand_pos, self.brush_state.target)
-                tangent = mesh_utils.get_tangent(normal)
+                position = om.MPoint(*spray_position[i])
+                normal = om.MVector(*spray_normal[i])
+                tangent = om.MVector(*spray_tangent[i])
 
             # get point data
             rotation = self.get_rotation(flag, normal, i)
@@ -385,24 +404,16 @@ class SporeToolCmd(ompx.MPxToolCommand):
         position, normal, tangent = self.get_brush_coords()
         radius = self.brush_state.radius
         neighbour = self.instance_data.get_closest_points(position, radius, self.brush_state.settings['ids'])
-        if neighbour:
-            self.set_cache_length(len(neighbour))
-        else:
+        if not len(neighbour):
             return
 
-        for i, index in enumerate(neighbour):
-            rotation = self.instance_data.rotation[index]
+        rotation = self.instance_data.rotation[neighbour]
+        self.add_undo_state(neighbour)
 
-            # add to undo stack
-            if not self.last_state.has_key(index):
-                self.last_state[index] = om.MVector(rotation.x, rotation.y, rotation.z)
+        direction = self.get_alignment_array(self.instance_data.normal[neighbour])
+        rotation = brush_utils.align_points(rotation, direction, self.brush_state.settings['strength'])
 
-            normal = self.instance_data.normal[index]
-            direction = self.get_alignment(normal)
-            rotation = self.rotate_into(direction, rotation)
-            self.rotation.set(rotation, i)
-
-        self.instance_data.set_points(neighbour, rotation=self.rotation)
+        self.instance_data.set_points(neighbour, rotation=rotation)
         self.instance_data.set_state()
 
     def smooth_align_action(self, flag):
@@ -410,26 +421,16 @@ class SporeToolCmd(ompx.MPxToolCommand):
         position, normal, tangent = self.get_brush_coords()
         radius = self.brush_state.radius
         neighbour = self.instance_data.get_closest_points(position, radius, self.brush_state.settings['ids'])
-        if neighbour:
-            average = self.instance_data.get_rotation_average(neighbour)
-            average = om.MVector(average[0], average[1], average[2])
-            self.set_cache_length(len(neighbour))
-        else:
+        if not len(neighbour):
             return
 
-        for i, index in enumerate(neighbour):
-            rotation = self.instance_data.rotation[index]
+        rotation = self.instance_data.rotation[neighbour]
+        self.add_undo_state(neighbour)
 
-            # add to undo stack
-            if not self.last_state.has_key(index):
-                self.last_state[index] = om.MVector(rotation.x, rotation.y, rotation.z)
+        average = self.instance_data.get_rotation_average(neighbour)
+        rotation = brush_utils.align_points(rotation, average, self.brush_state.settings['strength'])
 
-            normal = self.instance_data.normal[index]
-            #  direction = self.get_alignment(normal)
-            rotation = self.rotate_into(average, rotation)
-            self.rotation.set(rotation, i)
-
-        self.instance_data.set_points(neighbour, rotation=self.rotation)
+        self.instance_data.set_points(neighbour, rotation=rotation)
         self.instance_data.set_state()
 
 
@@ -439,28 +440,15 @@ class SporeToolCmd(ompx.MPxToolCommand):
         position, normal, tangent = self.get_brush_coords()
         radius = self.brush_state.radius
         neighbour = self.instance_data.get_closest_points(position, radius, self.brush_state.settings['ids'])
-        if neighbour:
-            #  average = self.instance_data.get_rotation_average(neighbour)
-            #  average = om.MVector(average[0], average[1], average[2])
-            self.set_cache_length(len(neighbour))
-        else:
+        if not len(neighbour):
             return
 
-        for i, index in enumerate(neighbour):
-            rotation = self.instance_data.rotation[index]
-
-            # add to undo stack
-            if not self.last_state.has_key(index):
-                self.last_state[index] = om.MVector(rotation.x, rotation.y, rotation.z)
+        rotation = self.instance_data.rotation[neighbour]
+        self.add_undo_state(neighbour)
 
-            normal = self.instance_data.normal[index]
-            direction = self.get_random_vector(normal)
-            #  direction = self.get_alignment(normal)
-            #  rotation = self.rotate_into(average, rotation)
-            rotation = self.randomize_rotation(rotation, self.brush_state.settings['strength'])
-            self.rotation.set(rotation, i)
+        rotation = brush_utils.random_rotate_points(rotation, self.brush_state.settings['strength'])
 
-        self.instance_data.set_points(neighbour, rotation=self.rotation)
+        self.instance_data.set_points(neighbour, rotation=rotation)
         self.instance_data.set_state()
 
     """ ------------------------------------------------------- """
@@ -471,24 +459,18 @@ class SporeToolCmd(ompx.MPxToolCommand):
         position, normal, tangent = self.get_brush_coords()
         radius = self.brush_state.radius
 
-        neighbour = self.instance_data.get_closest_points(position, radius, self.brush_state.settings['ids'])
-        if neighbour:
-            self.set_cache_length(len(neighbour))
-        else:
+        neighbour, distance = self.instance_data.get_closest_points(position, radius, self.brush_state.settings['ids'], True)
+        if not len(neighbour):
             return
 
-        for i, index in enumerate(neighbour):
-            value = self.instance_data.scale[index]
-            factor = self.brush_state.settings['scale_factor']
-            falloff_weight = self.get_falloff_weight(self.instance_data.position[index])
-            factor = (factor - 1) * falloff_weight + 1
-            self.scale.set(value * factor, i)
+        scale = self.instance_data.scale[neighbour]
+        self.add_undo_state(neighbour)
 
-            # add to undo stack
-            if not self.last_state.has_key(index):
-                self.last_state[index] = om.MVector(value.x, value.y, value.z)
+        factor = self.brush_state.settings['scale_factor']
+        falloff_weight = brush_utils.get_falloff_weight(distance, self.brush_state.radius, self.brush_state.settings['fall_off'])
+        scale = brush_utils.scale_points(scale, factor, falloff_weight)
 
-        self.instance_data.set_points(neighbour, scale=self.scale)
+        self.instance_data.set_points(neighbour, scale=scale)
         self.instance_data.set_state()
 
     def smooth_scale_action(self, flag):
@@ -496,31 +478,19 @@ class SporeToolCmd(ompx.MPxToolCommand):
 
         position, normal, tangent = self.get_brush_coords()
         radius = self.brush_state.radius
-        neighbour = self.instance_data.get_closest_points(position, radius, self.brush_state.settings['ids'])
-        if neighbour:
-            self.set_cache_length(len(neighbour))
-            average = self.instance_data.get_scale_average(neighbour)
-            amount = self.brush_state.settings['scale_amount']
-        else:
+        neighbour, distance = self.instance_data.get_closest_points(position, radius, self.brush_state.settings['ids'], True)
+        if not len(neighbour):
             return
 
-        for i, index in enumerate(neighbour):
-            falloff_weight = self.get_falloff_weight(self.instance_data.position[index])
-            value = self.instance_data.scale[index]
-
-            # add to undo stack
-            if not self.last_state.has_key(index):
-                self.last_state[index] = om.MVector(value.x, value.y, value.z)
+        scale = self.instance_data.scale[neighbour]
+        self.add_undo_state(neighbour)
 
-            value = [value.x, value.y, value.z]
-            delta = np.subtract(average, value)
-            step = np.multiply(np.multiply(delta, amount), falloff_weight)
-            new_scale = np.add(value, step)
-            # TODO - uniform scale
-            value = om.MVector(new_scale[0], new_scale[1], new_scale[2])
-            self.scale.set(value, i)
+        # TODO - uniform scale
+        amount = self.brush_state.settings['scale_amount']
+        falloff_weight = brush_utils.get_falloff_weight(distance, self.brush_state.radius, self.brush_state.settings['fall_off'])
+        scale = brush_utils.smooth_scale_points(scale, amount, falloff_weight)
 
-        self.instance_data.set_points(neighbour, scale=self.scale)
+        self.instance_data.set_points(neighbour, scale=scale)
         self.instance_data.set_state()
 
     def random_scale_action(self, flag):
@@ -529,31 +499,17 @@ class SporeToolCmd(ompx.MPxToolCommand):
         position, normal, tangent = self.get_brush_coords()
         radius = self.brush_state.radius
         neighbour = self.instance_data.get_closest_points(position, radius, self.brush_state.settings['ids'])
-        if neighbour:
-            self.set_cache_length(len(neighbour))
-            amount = self.brush_state.settings['scale_amount']
-        else:
+        if not len(neighbour):
             return
 
-        for i, index in enumerate(neighbour):
-            falloff_weight = self.get_falloff_weight(self.instance_data.position[index])
-            value = self.instance_data.scale[index]
+        scale = self.instance_data.scale[neighbour]
+        self.add_undo_state(neighbour)
 
-            # add to undo stack
-            if not self.last_state.has_key(index):
-                self.last_state[index] = om.MVector(value.x, value.y, value.z)
+        amount = self.brush_state.settings['scale_amount']
+        uniform = self.brush_state.settings['uni_scale']
+        scale = brush_utils.random_scale_points(scale, amount, uniform)
 
-            value = [value.x, value.y, value.z]
-            # get rand scale, rand * 2 -1 to distribute evenly between -1 and +1
-            if self.brush_state.settings['uni_scale']:
-                step = np.multiply(np.multiply(np.ones(3), np.random.rand() * 2 - 1), amount)
-            else:
-                step = np.multiply(np.subtract(np.multiply(np.random.sample(3), 2), 1), amount)
-            new_scale = np.add(value, step)
-            value = om.MVector(new_scale[0], new_scale[1], new_scale[2])
-            self.scale.set(value, i)
-
-        self.instance_data.set_points(neighbour, scale=self.scale)
+        self.instance_data.set_points(neighbour, scale=scale)
         self.instance_data.set_state()
 
 
@@ -564,37 +520,25 @@ class SporeToolCmd(ompx.MPxToolCommand):
     def move_action(self, flag):
         position, normal, tangent = self.get_brush_coords()
         radius = self.brush_state.radius
-        neighbour = self.instance_data.get_closest_points(position, radius)
-        if neighbour:
-            self.set_cache_length(len(neighbour))
-        else:
+        neighbour, distance = self.instance_data.get_closest_points(position, radius, return_distance=True)
+        if not len(neighbour):
             return
 
-        for i, index in enumerate(neighbour):
-            position = self.instance_data.position[index]
+        position = self.instance_data.position[neighbour]
+        self.add_undo_state(neighbour)
 
-            # add to undo stack
-            if not self.last_state.has_key(index):
-                self.last_state[index] = om.MVector(position)
+        falloff_weight = brush_utils.get_falloff_weight(distance, self.brush_state.radius, self.brush_state.settings['fall_off'])
+        weight = self.brush_state.settings['strength'] * falloff_weight
+        position = brush_utils.move_points(position, self.brush_state.stroke_direction, weight)
 
-            direction = om.MVector(self.brush_state.stroke_direction[0],
-                                    self.brush_state.stroke_direction[1],
-                                    self.brush_state.stroke_direction[2])
-            weight = self.brush_state.settings['strength']
-            falloff = self.get_falloff_weight(position)
-
-            position = om.MPoint(position + direction * weight * falloff)
-            position, normal = mesh_utils.get_closest_point_and_normal(position, self.brush_state.target)
-            self.position.set(om.MVector(position), i)
-            self.normal.set(normal, i)
+        # snap the moved points back onto the mesh
+        position, normal, _, _ = mesh_utils.project_points(self.brush_state.target, position)
 
         self.instance_data.set_points(neighbour,
-                                      position=self.position,
-                                      normal=self.normal)
+                                      position=position,
+                                      normal=normal)
         self.instance_data.set_state()
 
-        self.instance_data.build_kd_tree()
-
     """ ------------------------------------------------------- """
     """ index """
     """ ------------------------------------------------------- """
@@ -605,22 +549,13 @@ class SporeToolCmd(ompx.MPxToolCommand):
         position, normal, tangent = self.get_brush_coords()
         radius = self.brush_state.radius
         neighbour = self.instance_data.get_closest_points(position, radius)
-        if neighbour:
-            self.set_cache_length(len(neighbour))
-        else:
+        if not len(neighbour):
             return
 
-        for i, neighbour_id in enumerate(neighbour):
+        self.add_undo_state(neighbour)
 
-            # add to undo stack
-            old_id = self.instance_data.instance_id[neighbour_id]
-            if not self.last_state.has_key(neighbour_id):
-                self.last_state[neighbour_id] = old_id
-
-            object_index = random.choice(self.brush_state.settings['ids'])
-            self.instance_id.set(object_index, i)
-
-        self.instance_data.set_points(neighbour, instance_id=self.instance_id)
+        instance_id = np.random.choice(self.brush_state.settings['ids'], len(neighbour))
+        self.instance_data.set_points(neighbour, instance_id=instance_id)
         self.instance_data.set_state()
 
     def random_index_action(self, flag):
@@ -629,30 +564,15 @@ class SporeToolCmd(ompx.MPxToolCommand):
         position, normal, tangent = self.get_brush_coords()
         radius = self.brush_state.radius
         neighbour = self.instance_data.get_closest_points(position, radius)
-        num_samples = self.brush_state.settings['num_samples']
-        ids = self.brush_state.settings['ids']
-
-        changed_ids = []
-
-        if neighbour:
-            cache_len = num_samples if num_samples < len(neighbour) else len(neighbour)
-            self.set_cache_length(cache_len)
-        else:
+        if not len(neighbour):
             return
 
-        for i in xrange(cache_len):
-
-            # add to undo stack
-            old_id = self.instance_data.instance_id[neighbour_id]
-            if not self.last_state.has_key(neighbour_id):
-                self.last_state[neighbour_id] = old_id
-
-            object_index = random.choice(ids)
-            index = random.choice(neighbour)
-            changed_ids.append(index)
-            self.instance_id.set(object_index, i)
+        num_samples = min(self.brush_state.settings['num_samples'], len(neighbour))
+        changed_ids = np.random.choice(neighbour, num_samples, replace=False)
+        self.add_undo_state(changed_ids)
 
-        self.instance_data.set_points(changed_ids, instance_id=self.instance_id)
+        instance_id = np.random.choice(self.brush_state.settings['ids'], num_samples)
+        self.instance_data.set_points(changed_ids, instance_id=instance_id)
         self.instance_data.set_state()
 
     """ ------------------------------------------------------- """
@@ -667,22 +587,13 @@ class SporeToolCmd(ompx.MPxToolCommand):
         position, normal, tangent = self.get_brush_coords()
         radius = self.brush_state.radius
         neighbour = self.instance_data.get_closest_points(position, radius, self.brush_state.settings['ids'])
-
-        if neighbour:
-            self.set_cache_length(len(neighbour))
-        else:
+        if not len(neighbour):
             return
 
-        for i, index in enumerate(neighbour):
-
-            # add to undo stack
-            old_vis = self.instance_data.visibility[index]
-            if not self.last_state.has_key(index):
-                self.last_state[index] = old_vis
-
-            self.visibility.set(visibility, i)
+        self.add_undo_state(neighbour)
 
-        self.instance_data.set_points(neighbour, visibility=self.visibility)
+        visibility = np.full(len(neighbour), visibility)
+        self.instance_data.set_points(neighbour, visibility=visibility)
         self.instance_data.set_state()
 
     def delete_random(self, flag): #number_of_items):
@@ -691,138 +602,35 @@ class SporeToolCmd(ompx.MPxToolCommand):
         position, normal, tangent = self.get_brush_coords()
         radius = self.brush_state.radius
         neighbour = self.instance_data.get_closest_points(position, radius, self.brush_state.settings['ids'])
-        num_samples = self.brush_state.settings['num_samples']
-        changed_ids = []
-
-        if neighbour:
-            cache_len = num_samples if num_samples < len(neighbour) else len(neighbour)
-            self.set_cache_length(cache_len)
-        else:
+        if not len(neighbour):
             return
 
-        for i in xrange(cache_len):
-
-            rand_id = random.randint(0, len(neighbour) - 1)
-            index = neighbour.pop(rand_id)
-
-            if not self.last_state.has_key(index):
-                self.last_state[index] = 1
+        num_samples = min(self.brush_state.settings['num_samples'], len(neighbour))
+        changed_ids = np.random.choice(neighbour, num_samples, replace=False)
+        self.add_undo_state(changed_ids)
 
-            changed_ids.append(index)
-            self.visibility.set(0, i)
-
-        self.instance_data.set_points(changed_ids, visibility=self.visibility)
+        visibility = np.zeros(num_samples)
+        self.instance_data.set_points(changed_ids, visibility=visibility)
         self.instance_data.set_state()
 
     """ ------------------------------------------------------- """
     """ undo """
     """ ------------------------------------------------------- """
 
-    def undo_place_action(self, start, end):
-        """ undo the last place action
-        :param start: start index
-        :param end: end index
-        :return: """
+    def undo_place_action(self, index):
+        """ undo the last place action by removing the placed points
+        :param index np.array: indexes of the placed points """
 
-        visibility = om.MIntArray()
-        ids = range(start, end + 1)
-        [visibility.append(0) for i in ids]
-        self.instance_data.set_points(ids, visibility=visibility)
+        self.instance_data.set_points(index, visibility=np.zeros(len(index)))
         self.instance_data.clean_up()
-        self.instance_data.set_state()
-
-
-    def undo_vector_action(self, attr, undo_command):
-        """ undo transformation attributes.
-        scale, rotatio be undone with this method
-        :param attr: the instance data attribute that should changed
-        :type attr: string
-        :param undo_command: a list of index, x, y, z vale, repeating in this pattern
-        :type undo_command: list
-        :return: """
-
-        if not hasattr(self.instance_data, attr):
-            self.logger.error('Instance data has not attribute: {}'.format(attr))
-            return
-
-        ids = []
-        values = om.MVectorArray()
-        for i in range(len(undo_command) / 4):
-            ids.append(int(undo_command[i * 4]))
-            val_x = float(undo_command[i * 4 + 1])
-            val_y = float(undo_command[i * 4 + 2])
-            val_z = float(undo_command[i * 4 + 3])
-            values.append(om.MVector(val_x, val_y, val_z))
 
-        self.instance_data.set_points(ids, **{attr: values})
-        self.instance_data.set_state()
-
-    def undo_int_action(self, attr, undo_command):
-        """ undo the last action that modified an integer value on the
-        instance data object
-        :param attr:  the name of the attribute to undo
-        :type attr: str
-        :param undo_command: the commond built from the undo journal
-        :type undo_command: list
-        :return: """
-
-        if not hasattr(self.instance_data, attr):
-            self.logger.error('Instance data has not attribute: {}'.format(attr))
-            return
-
-        ids = []
-        values = om.MIntArray()
-        for i in range(len(undo_command) / 2):
-            ids.append(int(undo_command[i * 2]))
-            values.append(int(undo_command[i * 2 + 1]))
+    def undo_remove_action(self, index, values):
+        """ restore points that have been removed when the tool was left
+        :param index np.array: sorted indexes of the points before removal
+        :param values dict: column name, np.array of the removed points
+        :return bool: True on success, None on failure """
 
-        self.instance_data.set_points(ids, **{attr: values})
-        self.instance_data.set_state()
-
-    def undo_remove_action(self, undo_command):
-
-        # restore deleted points
-        if len(self.instance_data) < self.last_count:
-            for i in range(len(undo_command) / 24):
-                position = om.MVector(float(undo_command[i * 24]),
-                                      float(undo_command[i * 24 + 1]),
-                                      float(undo_command[i * 24 + 2]))
-                scale = om.MVector(float(undo_command[i * 24 + 3]),
-                                   float(undo_command[i * 24 + 4]),
-                                   float(undo_command[i * 24 + 5]))
-                rotation = om.MVector(float(undo_command[i * 24 + 6]),
-                                      float(undo_command[i * 24 + 7]),
-                                      float(undo_command[i * 24 + 8]))
-                instance_id = int(undo_command[i * 24 + 9])
-                visibility = int(undo_command[i * 24 + 10])
-                normal = om.MVector(float(undo_command[i * 24 + 11]),
-                                    float(undo_command[i * 24 + 12]),
-                                    float(undo_command[i * 24 + 13]))
-                tangent = om.MVector(float(undo_command[i * 24 + 14]),
-                                     float(undo_command[i * 24 + 15]),
-                                     float(undo_command[i * 24 + 16]))
-                u_coord = float(undo_command[i * 24 + 17])
-                v_coord = float(undo_command[i * 24 + 18])
-                poly_id = int(undo_command[i * 24 + 19])
-                color = om.MVector(float(undo_command[i * 24 + 20]),
-                                   float(undo_command[i * 24 + 21]),
-                                   float(undo_command[i * 24 + 22]))
-                unique_id = int(undo_command[i * 24 + 23])
-
-                self.instance_data.insert_point(unique_id, position, scale,
-                                                rotation, instance_id,
-                                                visibility, normal, tangent,
-                                                u_coord, v_coord, poly_id,
-                                                color)
-            self.instance_data.update_unique_id()
-            self.instance_data.set_state()
-        # show hidden points
-        else:
-            undo = []
-            for i in range(len(undo_command) / 24):
-                undo.extend([undo_command[i * 24 + 23],
-                             undo_command[i * 24 + 10]])
-            self.undo_int_action('visibility', undo)
+        return self.instance_data.insert_points(index, **values)
 
 
     """ -------------------------------------------------------------------- """
@@ -858,19 +666,6 @@ class SporeToolCmd(ompx.MPxToolCommand):
         self.last_brush_position = position
         return True
 
-    def get_falloff_weight(self, point):
-        """ return a weight based on the distance to the given point
-        to the brusch center. raise an AssertionError when the distance is
-        bigger than the brush radius """
-
-        if self.brush_state.settings['fall_off']:
-            pos = self.brush_state.position
-            distance = om.MPoint(pos[0], pos[1], pos[2]).distanceTo(om.MPoint(point))
-            falloff_weight = 1 - (distance / self.brush_state.radius)
-            return falloff_weight
-        else:
-            return 1
-
     def get_alignment(self, normal):
         """ get the alignment vector """
 
@@ -892,71 +687,73 @@ class SporeToolCmd(ompx.MPxToolCommand):
 
         return direction
 
-    #  def get_random_vector(self, vector, weight):
-    #
-    #      """ randomize the given vector between 0 and 90 degree by the given weight """
-    #
-    #      rando
-
-    def randomize_rotation(self, rotation, random_weight):
-        """ randomize the given rotation values by 10 degrees multiply
-        by the random_weight """
-
-        factor = 5 * random_weight
-        rand_x = np.radians(random.uniform(-factor, factor))
-        rand_y = np.radians(random.uniform(-factor, factor))
-        rand_z = np.radians(random.uniform(-factor, factor))
-
-        util = om.MScriptUtil()
-        util.createFromDouble(rand_x, rand_y, rand_z)
-        rand_rot_ptr = util.asDoublePtr()
+    def get_alignment_array(self, normal):
+        """ get the alignment vector for each of the given normals
+        :param normal np.array: array of shape (n, 3)
+        :return np.array: array of shape (n, 3) """
 
-        rand_mat = om.MTransformationMatrix()
-        rand_mat.setRotation(rand_rot_ptr, om.MTransformationMatrix.kXYZ)
+        if self.brush_state.settings['align_to'] == 'world': # align to world
+            direction = (0, 1, 0)
 
-        util.createFromDouble(np.radians(rotation.x),
-                              np.radians(rotation.y),
-                              np.radians(rotation.z))
-        rot_ptr = util.asDoublePtr()
+        # TODO - get object up vector
+        elif self.brush_state.settings['align_to'] == 'stroke'\
+        or self.brush_state.meta_mod: # align to stroke
+            direction = self.brush_state.stroke_direction
 
-        rot_mat = om.MTransformationMatrix()
-        rot_mat.setRotation(rot_ptr, om.MTransformationMatrix.kXYZ)
+        else:
+            return normal
 
-        result_mat = rot_mat.asMatrix() * rand_mat.asMatrix()
-        rotation = om.MTransformationMatrix(result_mat).rotation()
-        return om.MVector(math.degrees(rotation.asEulerRotation().x),
-                        math.degrees(rotation.asEulerRotation().y),
-                        math.degrees(rotation.asEulerRotation().z))
+        return np.tile(np.asarray(direction, np.float64), (len(normal), 1))
 
-    def rotate_into(self, direction, rotation):
-        """ slerp the given rotation values into the direction given
-        by the brush_state
-        @param direction MVector: the target direction
-        @param rotation MVector: current euler rotation """
+    def add_undo_state(self, index):
+        """ remember all columns of the given points before their first
+        modification during the current stroke
+        :param index np.array: indexes of the points about to be modified """
 
-        vector_weight = self.brush_state.settings['strength']
-        up_vector = om.MVector(0, 1, 0)
-        local_up = up_vector.rotateBy(om.MEulerRotation(math.radians(rotation.x),
-                                                        math.radians(rotation.y),
-                                                        math.radians(rotation.z)))
+        index = np.asarray(index, np.int64)
+        if len(index) and index.max() >= len(self.recorded):
+            missing = len(self.instance_data) - len(self.recorded)
+            self.recorded = np.r_[self.recorded, np.zeros(missing, dtype=bool)]
 
-        target_rotation = om.MQuaternion(local_up, direction, vector_weight)
+        index = np.unique(index[~self.recorded[index]])
+        if not len(index):
+            return
 
-        util = om.MScriptUtil()
-        x_rot = np.radians(rotation.x)
-        y_rot = np.radians(rotation.y)
-        z_rot = np.radians(rotation.z)
-        util.createFromDouble(x_rot, y_rot, z_rot)
-        rotation_ptr = util.asDoublePtr()
-        mat = om.MTransformationMatrix()
-        mat.setRotation(rotation_ptr, om.MTransformationMatrix.kXYZ)
+        self.recorded[index] = True
+        self.undo_index.append(index)
+        self.undo_values.append(self.instance_data.get_points(index))
+
+    def create_undo_record(self):
+        """ create the undo record of the current stroke. the record holds
+        the indexes of the changed points and their columns before (old)
+        and after (new) the stroke
+        :return dict: """
+
+        mode = self.brush_state.settings['mode']
+        if mode == 'place' or mode == 'spray':
+            index = np.arange(self.last_count, len(self.instance_data))
+            old = {}
+        elif self.undo_index:
+            index = np.concatenate(self.undo_index)
+            order = np.argsort(index)
+            index = index[order]
+            old = dict((name, np.concatenate([values[name] for values in self.undo_values])[order])
+                       for name in self.undo_values[0])
+        else:
+            index = np.empty(0, np.int64)
+            old = {}
 
-        mat = mat.asMatrix() * target_rotation.asMatrix()
-        rotation = om.MTransformationMatrix(mat).rotation()
+        return {'mode': mode,
+                'length': len(self.instance_data),
+                'index': index,
+                'old': old,
+                'new': self.instance_data.get_points(index)}
 
-        return om.MVector(math.degrees(rotation.asEulerRotation().x),
-                        math.degrees(rotation.asEulerRotation().y),
-                        math.degrees(rotation.asEulerRotation().z))
+    #  def get_random_vector(self, vector, weight):
+    #
+    #      """ randomize the given vector between 0 and 90 degree by the given weight """
+    #
+    #      rando
 
     def set_cache_length(self, length=0):
         """ set the length of the point arrays """
@@ -1180,11 +977,10 @@ class SporeContext(ompx.MPxContext):
         or self.state.settings['mode'] == 'move' \
         or self.state.settings['mode'] == 'id'\
         or self.state.settings['mode'] == 'remove':
-            try:
-                self.instance_data.build_kd_tree()
-            except ValueError: # the spore node is empty
+            if not len(self.instance_data): # the spore node is empty
                 self.msg_io.set_message('SporeNode is empty. Nothing to edit')
                 return
+            self.instance_data.build_index(self.state.radius)
 
         # install event filter
         view = window_utils.active_view_wdg()
@@ -1213,9 +1009,14 @@ class SporeContext(ompx.MPxContext):
         # brocken instance data caches inside the validation
         #  self.instance_data.is_valid()
 
+        # apply pending changes if the tool is left during a stroke
+        if self.instance_data is not None:
+            self.instance_data.end_stroke()
+
         mode = self.state.settings['mode']
         if mode == 'remove':
             self.instance_data.clean_up()
+            self.instance_data.set_state()
 
         if self.canvas:
             self.canvas.update()
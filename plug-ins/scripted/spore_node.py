@@ -1,3 +1,5 @@
+import os
+import re
 import sys
 import math
 
@@ -9,9 +11,12 @@ import maya.OpenMayaUI as omui
 import maya.OpenMayaRender as omr
 
 import node_utils
+import array_utils
 import instance_data
+import instance_cache
 import geo_cache
 import progress_bar
+import logging_util
 
 
 class SporeNode(ompx.MPxLocatorNode): #Node):
@@ -80,6 +85,10 @@ class SporeNode(ompx.MPxLocatorNode): #Node):
     a_poly_id = om.MObject()
     a_color = om.MObject()
     a_unique_id = om.MObject()
+    # external cache attributes
+    a_external_cache = om.MObject()
+    a_cache_file = om.MObject()
+    a_cache_checksum = om.MObject()
 
     context = None
 
@@ -104,6 +113,7 @@ class SporeNode(ompx.MPxLocatorNode): #Node):
         vect_array_attr = om.MFnVectorArrayData()
         int_array_attr = om.MFnIntArrayData()
         double_array_attr = om.MFnDoubleArrayData()
+        string_data = om.MFnStringData()
 
         # output attributes
         cls.a_instance_data = generic_attr_fn.create('instanceData', 'instanceData')
@@ -296,6 +306,7 @@ class SporeNode(ompx.MPxLocatorNode): #Node):
         enum_attr_fn.addField('jitter grid', 1)
         enum_attr_fn.addField('poisson 3d', 2)
         enum_attr_fn.addField('poisson 2d', 3)
+        enum_attr_fn.addField('poisson surface', 4)
         enum_attr_fn.setStorable(True)
         enum_attr_fn.setKeyable(False)
         enum_attr_fn.setConnectable(False)
@@ -510,6 +521,24 @@ class SporeNode(ompx.MPxLocatorNode): #Node):
         typed_attr_fn.setStorable(True)
         cls.addAttribute(cls.a_unique_id)
 
+        # external cache attributes
+        cls.a_external_cache = numeric_attr_fn.create('externalCache', 'externalCache', om.MFnNumericData.kBoolean, 0)
+        numeric_attr_fn.setStorable(True)
+        numeric_attr_fn.setKeyable(False)
+        numeric_attr_fn.setConnectable(False)
+        cls.addAttribute(cls.a_external_cache)
+
+        cls.a_cache_file = typed_attr_fn.create('cacheFile', 'cacheFile', om.MFnData.kString, string_data.create(''))
+        typed_attr_fn.setStorable(True)
+        typed_attr_fn.setKeyable(False)
+        cls.addAttribute(cls.a_cache_file)
+
+        cls.a_cache_checksum = typed_attr_fn.create('cacheChecksum', 'cacheChecksum', om.MFnData.kString, string_data.create(''))
+        typed_attr_fn.setHidden(True)
+        typed_attr_fn.setStorable(True)
+        typed_attr_fn.setKeyable(False)
+        cls.addAttribute(cls.a_cache_checksum)
+
         cls.attributeAffects(cls.a_geo_cached, cls.a_instance_data)
         cls.attributeAffects(cls.a_clear, cls.a_instance_data)
 
@@ -530,6 +559,18 @@ class SporeNode(ompx.MPxLocatorNode): #Node):
 
         self._state = None
         self.geo_cache = geo_cache.GeoCache()
+        self.logger = logging_util.SporeLogger(__name__)
+
+        # instance data column generations at the last write to the
+        # storage attributes, unchanged columns are skipped on save
+        self._saved_generation = {}
+        # where the points have been written to last: attributes or file.
+        # missing if the referenced cache file could not be loaded
+        self._storage_mode = None
+        # absolute path of the referenced cache file
+        self._cache_path = None
+        # the file the node is read from, cache file paths are relative to it
+        self._source_file = get_source_file_name()
 
         obj_handle = om.MObjectHandle(self.thisMObject())
         sys._global_spore_tracking_dir[obj_handle.hashCode()] = self
@@ -547,11 +588,21 @@ class SporeNode(ompx.MPxLocatorNode): #Node):
 
         for i in xrange(self.callbacks.length()):
             om.MMessage().removeCallback(self.callbacks[i])
+        self.release_geo_cache()
 
         obj_handle = om.MObjectHandle(self.thisMObject())
         if sys._global_spore_tracking_dir.has_key(obj_handle.hashCode()):
             del sys._global_spore_tracking_dir[obj_handle.hashCode()]
 
+    def release_geo_cache(self):
+        """ remove the mesh callbacks of the node's geo cache unless the
+        cache is shared with another spore node """
+
+        for node in sys._global_spore_tracking_dir.itervalues():
+            if node is not self and node.geo_cache is self.geo_cache:
+                return
+        self.geo_cache.remove_callbacks()
+
     def compute(self, plug, data):
 
         this_node = self.thisMObject()
@@ -560,7 +611,7 @@ class SporeNode(ompx.MPxLocatorNode): #Node):
 
             # if the node has yet not been in initialized create the instance
             # data attribute and read all point if some exist
-            if not self._state:
+            if self._state is None:
                 self.initialize_state(plug, data)
 
 
@@ -576,6 +627,8 @@ class SporeNode(ompx.MPxLocatorNode): #Node):
                     other_in_mesh = node_utils.get_connected_in_mesh(node.thisMObject())
                     in_mesh = node_utils.get_connected_in_mesh(self.thisMObject())
                     if in_mesh == other_in_mesh and node != self:
+                        if self.geo_cache is not node.geo_cache:
+                            self.release_geo_cache()
                         self.geo_cache = node.geo_cache
 
                         # check if the cache is still valid
@@ -620,75 +673,56 @@ class SporeNode(ompx.MPxLocatorNode): #Node):
         array_attr_fn = om.MFnArrayAttrsData()
         attr_array_obj = array_attr_fn.create()
 
-        out_position = array_attr_fn.vectorArray('position')
-        out_scale = array_attr_fn.vectorArray('scale')
-        out_rotation = array_attr_fn.vectorArray('rotation')
-        out_id = array_attr_fn.intArray('objectIndex')
-        out_visibility = array_attr_fn.intArray('visibility')
-        normal = array_attr_fn.vectorArray('normal')
-        tangent = array_attr_fn.vectorArray('tangent')
-        u_coord = array_attr_fn.doubleArray('u_coord')
-        v_coord = array_attr_fn.doubleArray('v_coord')
-        poly_id = array_attr_fn.intArray('poly_id')
-        color = array_attr_fn.vectorArray('color')
-        unique_id = array_attr_fn.intArray('unique_id')
-
-        # load points from stored attributes oand copy to instance data attr
+        for name, attr, array_type in instance_data.COLUMNS:
+            if array_type == 'vector':
+                array_attr_fn.vectorArray(attr)
+            elif array_type == 'int':
+                array_attr_fn.intArray(attr)
+            else:
+                array_attr_fn.doubleArray(attr)
+
+        self._state = instance_data.InstanceData(self.thisMObject())
+        self._state.initialize_data(attr_array_obj)
+        self._saved_generation = {}
+        self._storage_mode = None
+        self._cache_path = None
+
+        # load points from stored attributes and copy to instance data attr
         # this should happen only once when the scene is loaded
         is_point_cached = data.inputValue(self.a_points_cached).asBool()
         if not is_point_cached:
 
-            vect_array_fn = om.MFnVectorArrayData()
-            int_array_fn = om.MFnIntArrayData()
-            double_array_fn = om.MFnDoubleArrayData()
-
-            position_data = data.outputValue(self.a_position).data()
-            vect_array_fn.setObject(position_data)
-            vect_array_fn.copyTo(out_position)
-
-            rotation_data = data.outputValue(self.a_rotation).data()
-            vect_array_fn.setObject(rotation_data)
-            vect_array_fn.copyTo(out_rotation)
-
-            scale_data = data.outputValue(self.a_scale).data()
-            vect_array_fn.setObject(scale_data)
-            vect_array_fn.copyTo(out_scale)
-
-            instance_id_data = data.outputValue(self.a_instance_id).data()
-            int_array_fn.setObject(instance_id_data)
-            int_array_fn.copyTo(out_id)
-
-            visibility_data = data.outputValue(self.a_visibility).data()
-            int_array_fn.setObject(visibility_data)
-            int_array_fn.copyTo(out_visibility)
-
-            normal_data = data.outputValue(self.a_normal).data()
-            vect_array_fn.setObject(normal_data)
-            vect_array_fn.copyTo(normal)
-
-            tangent_data = data.outputValue(self.a_tangent).data()
-            vect_array_fn.setObject(tangent_data)
-            vect_array_fn.copyTo(tangent)
-
-            u_cood_data = data.outputValue(self.a_u_coord).data()
-            double_array_fn.setObject(u_cood_data)
-            double_array_fn.copyTo(u_coord)
-
-            v_cood_data = data.outputValue(self.a_v_coord).data()
-            double_array_fn.setObject(v_cood_data)
-            double_array_fn.copyTo(v_coord)
-
-            poly_id_data = data.outputValue(self.a_poly_id).data()
-            int_array_fn.setObject(poly_id_data)
-            int_array_fn.copyTo(poly_id)
-
-            color_data = data.outputValue(self.a_color).data()
-            vect_array_fn.setObject(color_data)
-            vect_array_fn.copyTo(color)
-
-            unique_id_data = data.outputValue(self.a_unique_id).data()
-            int_array_fn.setObject(unique_id_data)
-            int_array_fn.copyTo(unique_id)
+            # prefer the external cache file if the node references one
+            columns = None
+            cache_file = data.inputValue(self.a_cache_file).asString()
+            if cache_file:
+                checksum = data.inputValue(self.a_cache_checksum).asString()
+                self._cache_path = self.resolve_cache_file(cache_file)
+                columns = self.read_cache_file(self._cache_path, checksum)
+                self._storage_mode = 'file' if columns is not None else 'missing'
+
+            if columns is None:
+                columns = {}
+                storage_attributes = self.get_storage_attributes()
+                for name, attr, array_type in instance_data.COLUMNS:
+                    storage_data = data.outputValue(storage_attributes[name]).data()
+                    if array_type == 'vector':
+                        columns[name] = om.MFnVectorArrayData(storage_data).array()
+                    elif array_type == 'int':
+                        columns[name] = om.MFnIntArrayData(storage_data).array()
+                    else:
+                        columns[name] = om.MFnDoubleArrayData(storage_data).array()
+                if self._storage_mode != 'missing':
+                    self._storage_mode = 'attributes'
+
+            # copy each column with a single call to numpy and back
+            self._state.load_columns(columns)
+            self._state.set_dirty()
+            self._state.write_arrays()
+
+            # the storage already holds the loaded points
+            self._saved_generation = dict((name, self._state.get_generation(name))
+                                          for name, attr, array_type in instance_data.COLUMNS)
 
             # set points cached to true
             is_point_cached_handle = data.outputValue(self.a_points_cached)
@@ -697,87 +731,243 @@ class SporeNode(ompx.MPxLocatorNode): #Node):
         # set the instance data attribute
         output.setMObject(attr_array_obj)
 
-        self._state = instance_data.InstanceData(self.thisMObject())
-        self._state.initialize_data()
-
     def write_points(self, *args, **kwargs):
         """ write the instanceData attribute, that can't be saved with the
-        maya scene, to the node's storage attributes to make sure all points
-        are svaed with the maya file """
-
-        #  state = instance_data.SporeState(self.thisMObject())
-        node_fn = om.MFnDependencyNode(self.thisMObject())
-        data_plug = node_fn.findPlug('instanceData')
-        data_obj = data_plug.asMObject()
+        maya scene, to the node's storage attributes or the external cache
+        file to make sure all points are svaed with the maya file.
+        only columns that changed since the last write are copied.
+        :return int: number of bytes written """
+
+        # nothing has been loaded or changed since the scene was opened
+        if self._state is None:
+            return 0
+
+        # keep the reference to a cache file that failed to load as long
+        # as the points haven't been edited, the storage attributes are empty
+        if self._storage_mode == 'missing' and not self.is_modified():
+            node_name = om.MFnDependencyNode(self.thisMObject()).name()
+            om.MGlobal.displayWarning('Keeping reference to missing cache file {} for: {}'.format(
+                self._cache_path, node_name))
+            return 0
+
+        if om.MPlug(self.thisMObject(), self.a_external_cache).asBool():
+            num_bytes = self.write_cache_file()
+            if num_bytes is not None:
+                return num_bytes
+            self.logger.warn('Falling back to storage attributes')
+
+        return self.write_storage_attributes()
+
+    def write_storage_attributes(self):
+        """ write all columns that changed since the last save to the node's
+        storage attributes and drop the reference to an external cache file
+        :return int: number of bytes written """
+
+        if self._storage_mode != 'attributes':
+            self._saved_generation = {}
+            self._storage_mode = 'attributes'
+            self._cache_path = None
+            om.MPlug(self.thisMObject(), self.a_cache_file).setString('')
+            om.MPlug(self.thisMObject(), self.a_cache_checksum).setString('')
 
-        array_attr_fn = om.MFnArrayAttrsData(data_obj)
         vect_array_fn = om.MFnVectorArrayData()
         int_array_fn = om.MFnIntArrayData()
         double_array_fn = om.MFnDoubleArrayData()
 
-        # store position
-        position = array_attr_fn.vectorArray('position')
-        position_obj = vect_array_fn.create(position)
-        position_plug = node_fn.findPlug('position')
-        position_plug.setMObject(position_obj)
-
-        # store scale
-        scale = array_attr_fn.vectorArray('scale')
-        scale_obj = vect_array_fn.create(scale)
-        scale_plug = node_fn.findPlug('scale')
-        scale_plug.setMObject(scale_obj)
-
-        #store rotation
-        rotation = array_attr_fn.vectorArray('rotation')
-        rotation_obj = vect_array_fn.create(rotation)
-        rotation_plug = node_fn.findPlug('rotation')
-        rotation_plug.setMObject(rotation_obj)
-
-        # store instance id
-        instance_id = array_attr_fn.intArray('objectIndex')
-        instance_id_obj = int_array_fn.create(instance_id)
-        instance_id_plug = node_fn.findPlug('instanceId')
-        instance_id_plug.setMObject(instance_id_obj)
-
-        # store visibility
-        visibility = array_attr_fn.intArray('visibility')
-        visibility_obj = int_array_fn.create(visibility)
-        visibility_plug = node_fn.findPlug('visibility')
-        visibility_plug.setMObject(visibility_obj)
-
-        normal = array_attr_fn.vectorArray('normal')
-        normal_obj = vect_array_fn.create(normal)
-        normal_plug = node_fn.findPlug('normal')
-        normal_plug.setMObject(normal_obj)
-
-        tangent = array_attr_fn.vectorArray('tangent')
-        tangent_obj = vect_array_fn.create(tangent)
-        tangent_plug = node_fn.findPlug('tangent')
-        tangent_plug.setMObject(tangent_obj)
-
-        u_coord = array_attr_fn.doubleArray('u_coord')
-        u_coord_obj = double_array_fn.create(u_coord)
-        u_coord_plug = node_fn.findPlug('uCoord')
-        u_coord_plug.setMObject(u_coord_obj)
-
-        v_coord = array_attr_fn.doubleArray('v_coord')
-        v_coord_obj = double_array_fn.create(v_coord)
-        v_coord_plug = node_fn.findPlug('vCoord')
-        v_coord_plug.setMObject(v_coord_obj)
-
-        poly_id = array_attr_fn.intArray('poly_id')
-        poly_id_obj = int_array_fn.create(poly_id)
-        poly_id_plug = node_fn.findPlug('polyId')
-        poly_id_plug.setMObject(poly_id_obj)
-
-        color = array_attr_fn.vectorArray('color')
-        color_obj = vect_array_fn.create(color)
-        color_plug = node_fn.findPlug('color')
-        color_plug.setMObject(color_obj)
-
-        unique_id = array_attr_fn.intArray('unique_id')
-        unique_id_obj = int_array_fn.create(unique_id)
-        unique_id_plug = node_fn.findPlug('uniqueId')
-        unique_id_plug.setMObject(unique_id_obj)
-
-
+        num_bytes = 0
+        num_columns = 0
+        storage_attributes = self.get_storage_attributes()
+        for name, attr, array_type in instance_data.COLUMNS:
+            generation = self._state.get_generation(name)
+            if self._saved_generation.get(name) == generation:
+                continue
+
+            column = getattr(self._state, name)
+            if array_type == 'vector':
+                storage_obj = vect_array_fn.create(array_utils.np_to_vector_array(column))
+            elif array_type == 'int':
+                storage_obj = int_array_fn.create(array_utils.np_to_int_array(column))
+            else:
+                storage_obj = double_array_fn.create(array_utils.np_to_double_array(column))
+
+            storage_plug = om.MPlug(self.thisMObject(), storage_attributes[name])
+            storage_plug.setMObject(storage_obj)
+
+            self._saved_generation[name] = generation
+            num_bytes += column.nbytes
+            num_columns += 1
+
+        node_name = om.MFnDependencyNode(self.thisMObject()).name()
+        self.logger.debug('Wrote {} of {} columns ({} bytes) for: {}'.format(
+            num_columns, len(instance_data.COLUMNS), num_bytes, node_name))
+        return num_bytes
+
+    def write_cache_file(self):
+        """ write all columns to a cache file next to the scene that is
+        being saved and store the path and checksum on the node. the storage
+        attributes are emptied so the points aren't saved twice.
+        nothing is written if no column changed since the last save, in
+        that case the node keeps referencing its current cache file, which
+        may belong to another scene.
+        :return int: number of bytes written or None on failure """
+
+        scene = get_save_scene_name()
+        if not scene:
+            self.logger.warn('Can\'t write cache file for an untitled scene')
+            return
+
+        # the scene may be saved to another directory, update the relative
+        # path. it is only set when it changed to avoid reference edits
+        scene_dir, scene_file = os.path.split(scene)
+        base_dir = self.get_cache_base_dir(scene)
+        cache_plug = om.MPlug(self.thisMObject(), self.a_cache_file)
+        if self._storage_mode == 'file' and not self.is_modified():
+            cache_file = get_relative_path(self._cache_path, base_dir)
+            if cache_file != cache_plug.asString():
+                cache_plug.setString(cache_file)
+            return 0
+
+        node_name = om.MFnDependencyNode(self.thisMObject()).name()
+        cache_dir = '{}_spore'.format(os.path.splitext(scene_file)[0])
+        path = os.path.join(scene_dir, cache_dir, '{}.spore'.format(re.sub(r'\W', '_', node_name)))
+
+        # the loaded columns may still map the file that is replaced
+        self._state.detach_columns()
+        columns = [(name, getattr(self._state, name))
+                   for name, attr, array_type in instance_data.COLUMNS]
+        try:
+            # never overwrite the referenced file if it has been changed
+            # since it was loaded, e.g. when it failed to load
+            if self._cache_path and os.path.exists(path)\
+            and os.path.normpath(self._cache_path) == os.path.normpath(path):
+                expected = om.MPlug(self.thisMObject(), self.a_cache_checksum).asString()
+                if instance_cache.get_checksum(path) != expected:
+                    raise IOError('Cache file has been modified: {}'.format(path))
+
+            checksum = instance_cache.write_cache(path, columns)
+        except (IOError, OSError) as e:
+            self.logger.error('Failed to write cache file for {}: {}'.format(node_name, e))
+            return
+
+        # the path is stored relative to the scene so both can be moved
+        self._cache_path = path
+        cache_file = get_relative_path(path, base_dir)
+        cache_plug.setString(cache_file)
+        om.MPlug(self.thisMObject(), self.a_cache_checksum).setString(checksum)
+
+        if self._storage_mode != 'file':
+            storage_attributes = self.get_storage_attributes()
+            for name, attr, array_type in instance_data.COLUMNS:
+                if array_type == 'vector':
+                    storage_obj = om.MFnVectorArrayData().create(om.MVectorArray())
+                elif array_type == 'int':
+                    storage_obj = om.MFnIntArrayData().create(om.MIntArray())
+                else:
+                    storage_obj = om.MFnDoubleArrayData().create(om.MDoubleArray())
+                om.MPlug(self.thisMObject(), storage_attributes[name]).setMObject(storage_obj)
+
+        self._storage_mode = 'file'
+        self._saved_generation = dict((name, self._state.get_generation(name))
+                                      for name, attr, array_type in instance_data.COLUMNS)
+
+        num_bytes = sum(column.nbytes for name, column in columns)
+        self.logger.debug('Wrote cache file {} ({} bytes) for: {}'.format(
+            cache_file, num_bytes, node_name))
+        return num_bytes
+
+    def read_cache_file(self, path, checksum):
+        """ memory map the columns of the given cache file. warn the user
+        if the file can't be loaded
+        :param path str: absolute path to the cache file
+        :param checksum str: the checksum the file is expected to have
+        :return dict: column name, np.array or None on failure """
+
+        try:
+            return instance_cache.read_cache(path, checksum)
+        except (IOError, OSError, ValueError) as e:
+            node_name = om.MFnDependencyNode(self.thisMObject()).name()
+            self.logger.error('Failed to read cache file for {}: {}'.format(node_name, e))
+            om.MGlobal.displayWarning('Could not load cache file {} for: {}. '
+                                      'The reference is kept until the points are edited.'.format(path, node_name))
+
+    def resolve_cache_file(self, cache_file):
+        """ get the absolute path of the given cache file, see
+        get_cache_base_dir
+        :param cache_file str: the cacheFile attribute value
+        :return str: absolute path """
+
+        return os.path.normpath(os.path.join(self.get_cache_base_dir(), cache_file))
+
+    def get_cache_base_dir(self, scene=None):
+        """ get the directory the cacheFile attribute is relative to.
+        for referenced nodes this is the directory of the reference file,
+        for all other nodes the directory of the given scene or the file the
+        node has been read from
+        :param scene str: the scene that is being saved
+        :return str: """
+
+        node_name = om.MFnDependencyNode(self.thisMObject()).name()
+        if cmds.referenceQuery(node_name, isNodeReferenced=True):
+            source = cmds.referenceQuery(node_name, filename=True, withoutCopyNumber=True)
+        else:
+            source = scene or self._source_file or cmds.file(q=True, sceneName=True)
+        return os.path.dirname(source)
+
+    def is_modified(self):
+        """ check if any column changed since the points have been loaded or saved
+        :return bool: """
+
+        return any(self._saved_generation.get(name) != self._state.get_generation(name)
+                   for name, attr, array_type in instance_data.COLUMNS)
+
+    def get_storage_attributes(self):
+        """ get the storage attribute for each instance data column
+        :return dict: column name, attribute MObject """
+
+        return {'position': self.a_position,
+                'scale': self.a_scale,
+                'rotation': self.a_rotation,
+                'instance_id': self.a_instance_id,
+                'visibility': self.a_visibility,
+                'normal': self.a_normal,
+                'tangent': self.a_tangent,
+                'u_coord': self.a_u_coord,
+                'v_coord': self.a_v_coord,
+                'poly_id': self.a_poly_id,
+                'color': self.a_color,
+                'unique_id': self.a_unique_id}
+
+
+
+
+def get_source_file_name():
+    """ get the file that is being opened, imported or referenced or the
+    current scene if no file is being read """
+
+    if om.MFileIO.isReadingFile() and hasattr(om.MFileIO, 'currentlyReadingFileName'):
+        source = om.MFileIO.currentlyReadingFileName()
+        if source:
+            return source
+    return cmds.file(q=True, sceneName=True)
+
+
+def get_relative_path(path, start):
+    """ get the given path relative to the start directory. the path stays
+    absolute if it is on another drive """
+
+    try:
+        path = os.path.relpath(path, start)
+    except ValueError:
+        pass
+    return path.replace(os.sep, '/')
+
+
+def get_save_scene_name():
+    """ get the file name of the scene that is about to be saved. the scene
+    name is only updated after the save when saving with save as """
+
+    if hasattr(om.MFileIO, 'beforeSaveFilename'):
+        scene = om.MFileIO.beforeSaveFilename()
+        if scene:
+            return scene
+    return cmds.file(q=True, sceneName=True)
@@ -3,6 +3,8 @@ import time
 import math
 import random
 
+import numpy as np
+
 import maya.cmds as cmds
 import maya.OpenMaya as om
 import maya.OpenMayaRender as omr
@@ -12,6 +14,8 @@ import instance_data
 import node_utils
 import mesh_utils
 import render_utils
+import sample_utils
+import transform_utils
 import brush_state
 import logging_util
 #  reload(instance_data)
@@ -29,59 +33,75 @@ K_MIN_DISTANCE_LONG_FLAG = '-minimumRadius'
 
 class Points(object):
     """ conatainer for sampled points.
-    holds position, normal, polyid and uv coords """
+    holds position, normal, polyid and uv coords as numpy arrays """
 
-    def __init__(self):
+    def __init__(self, position=None, normal=None, poly_id=None, u_coord=None, v_coord=None):
+
+        length = 0 if position is None else len(position)
 
-        self.position = om.MPointArray()
-        self.normal = om.MVectorArray()
-        self.poly_id = om.MIntArray()
-        self.u_coord = [] # om.MDoubleArray()
-        self.v_coord = [] # om.MDoubleArray()
+        self.position = np.zeros((length, 3)) if position is None else np.asarray(position, np.float64)
+        self.normal = np.zeros((length, 3)) if normal is None else np.asarray(normal, np.float64)
+        self.poly_id = np.zeros(length, np.int32) if poly_id is None else np.asarray(poly_id, np.int32)
+        self.u_coord = np.zeros(length) if u_coord is None else np.asarray(u_coord, np.float64)
+        self.v_coord = np.zeros(length) if v_coord is None else np.asarray(v_coord, np.float64)
 
     def set_length(self, length):
-        """ set length for the point container """
+        """ set length for the point container.
+        existing points are kept, new points are initialized with zero """
 
-        self.position.setLength(length)
-        self.normal.setLength(length)
-        self.poly_id.setLength(length)
-        self.u_coord = [None] * length
-        self.v_coord = [None] * length
+        self.position = self._resize(self.position, length)
+        self.normal = self._resize(self.normal, length)
+        self.poly_id = self._resize(self.poly_id, length)
+        self.u_coord = self._resize(self.u_coord, length)
+        self.v_coord = self._resize(self.v_coord, length)
 
     def set(self, index, position, normal, poly_id, u_coord=None, v_coord=None):
         """ set data for the given index """
 
-        self.position.set(position, index)
-        self.normal.set(normal, index)
-        self.poly_id.set(poly_id, index)
+        self.position[index] = (position[0], position[1], position[2])
+        self.normal[index] = (normal[0], normal[1], normal[2])
+        self.poly_id[index] = poly_id
         if u_coord:
             self.u_coord[index] = u_coord
         if v_coord:
             self.v_coord[index] = v_coord
 
-    def remove(self, index):
-        self.position.remove(index)
-        self.normal.remove(index)
-        self.poly_id.remove(index)
-        self.u_coord.pop(index)
-        self.v_coord.pop(index)
+    def compact(self, index):
+        """ keep only the points selected by the given index.
+        :param index: boolean mask or array of indices into the container """
+
+        self.position = self.position[index]
+        self.normal = self.normal[index]
+        self.poly_id = self.poly_id[index]
+        self.u_coord = self.u_coord[index]
+        self.v_coord = self.v_coord[index]
+
+    def _resize(self, array, length):
+        """ return a copy of the given array with the given length """
+
+        resized = np.zeros((length,) + array.shape[1:], array.dtype)
+        num_items = min(length, len(array))
+        resized[:num_items] = array[:num_items]
+        return resized
 
     def __iter__(self):
         """ iterate overer the sampled points """
 
-        for i in xrange(self.position.length()):
-            yield ((self.position[i].x, # position
-                    self.position[i].y,
-                    self.position[i].z),
-                   (self.normal[i].x, # normal
-                    self.normal[i].y,
-                    self.normal[i].z),
-                   self.poly_id[i], # poly id
-                   self.u_coord[i], # u coord
-                   self.v_coord[i]) # v coord
+        position = self.position.tolist()
+        normal = self.normal.tolist()
+        poly_id = self.poly_id.tolist()
+        u_coord = self.u_coord.tolist()
+        v_coord = self.v_coord.tolist()
+
+        for i in xrange(len(self)):
+            yield (tuple(position[i]), # position
+                   tuple(normal[i]), # normal
+                   poly_id[i], # poly id
+                   u_coord[i], # u coord
+                   v_coord[i]) # v coord
 
     def __len__(self):
-        return self.position.length()
+        return len(self.position)
 
 
 # command
@@ -158,10 +178,7 @@ class SporeSampler(ompx.MPxCommand):
         #  ompx.MPxCommand.setResult(['foo', 'bar', 1, 2,])
 
     def undoIt(self):
-        visibility = om.MIntArray()
-        for i in range(*self.undo_range):
-            self.instance_data.visibility.set(0, i)
-            #  visibility.append(0)
+        self.instance_data.visibility[slice(*self.undo_range)] = 0
 
         self.instance_data.clean_up()
         self.instance_data.set_state()
@@ -187,27 +204,25 @@ class SporeSampler(ompx.MPxCommand):
             self.random_sampling(self.num_samples)
             self.cell_size = self.min_radius / math.sqrt(3)
             grid_partition = self.voxelize(self.cell_size)
-            valid_points = self.disk_sampling_3d(self.min_radius, grid_partition, self.cell_size)
+            valid_points = self.disk_sampling_3d(self.min_radius, grid_partition)
 
         elif self.mode == 3: #'poisson2d':
             self.geo_cache.create_uv_lookup()
             self.disk_sampling_2d(self.min_radius_2d)
 
+        elif self.mode == 4: #'poisson surface':
+            self.surface_sampling(self.num_samples)
+
         # get sampled points from disk or grid sampling
         if self.mode == 1 or self.mode == 2:
-            point_data = Points()
-            point_data.set_length(len(valid_points))
-            for i, index in enumerate(valid_points):
-                point_data.set(i,
-                               self.point_data.position[index],
-                               self.point_data.normal[index],
-                               self.point_data.poly_id[index],
-                               self.point_data.u_coord[index],
-                               self.point_data.v_coord[index])
-
-            self.point_data = point_data
+            self.point_data.compact(valid_points)
 
     def initialize_filtering(self):
+        """ run all active filters. each filter returns a mask of points
+        to keep, the point data is compacted only once at the end """
+
+        keep = np.ones(len(self.point_data), dtype=bool)
+
         # texture filter
         if self.use_tex:
             try:
@@ -217,60 +232,46 @@ class SporeSampler(ompx.MPxCommand):
 
             if texture:
                 self.evaluate_uvs()
-                self.texture_filter(texture, 0) # TODO - Filter size
+                keep &= self.texture_filter(texture, 0) # TODO - Filter size
 
         # altitude filter
         if self.min_altitude != 0 or self.max_altitude != 1:
-            self.altitude_filter(self.min_altitude, self.max_altitude, self.min_altitude_fuzz, self.max_altitude_fuzz)
+            keep &= self.altitude_filter(self.min_altitude, self.max_altitude, self.min_altitude_fuzz, self.max_altitude_fuzz)
 
         # slope filter
         if self.min_slope != 0 or self.max_slope != 180:
-            self.slope_filter(self.min_slope, self.max_slope, self.slope_fuzz)
+            keep &= self.slope_filter(self.min_slope, self.max_slope, self.slope_fuzz)
+
+        if not keep.all():
+            self.point_data.compact(keep)
 
     def append_points(self):
+        """ get final rotation, scale and position values for all sampled
+        points at once and append them to the instance data object """
+
+        num_points = len(self.point_data)
+        normal = self.point_data.normal
+
+        direction = self.get_alignment(self.align_modes[self.align_id], normal)
+        rotation = self.get_rotation(direction, self.strength, self.min_rot, self.max_rot)
+        scale = self.get_scale(self.min_scale, self.max_scale, self.uni_scale, num_points)
+        position = self.get_offset(self.point_data.position, self.min_offset, self.max_offset, normal)
+        tangent = transform_utils.get_tangent(normal)
+        instance_id = self.instance_id(self.ids, num_points)
 
-        # get final rotation, scale and position values
         # append the sampled points to the instance data object
         old_len = len(self.instance_data)
-        self.instance_data.set_length(old_len + len(self.point_data))
-        for i, (position, normal, poly_id, u_coord, v_coord) in enumerate(self.point_data):
-            position = om.MPoint(position[0], position[1], position[2])
-            normal = om.MVector(normal[0], normal[1], normal[2])
-            direction = self.get_alignment(self.align_modes[self.align_id], normal)
-            rotation = self.get_rotation(direction, self.strength, self.min_rot, self.max_rot)
-            scale = self.get_scale(self.min_scale, self.max_scale, self.uni_scale)
-            position = self.get_offset(position, self.min_offset, self.max_offset, normal)
-            tangent = mesh_utils.get_tangent(normal)
-            instance_id = random.choice(self.ids)
-            index = old_len + i
-
-            if not u_coord:
-                u_coord = 0
-            if not v_coord:
-                v_coord = 0
-
-            # set points
-            self.instance_data.set_point(index,
-                                    om.MVector(position),
-                                    scale,
-                                    rotation,
-                                    instance_id,
-                                    1,
-                                    normal,
-                                    tangent,
-                                    u_coord,
-                                    v_coord,
-                                    poly_id,
-                                    om.MVector(0, 0, 0))
-
+        self.instance_data.append_points(position, scale, rotation,
+                                         instance_id, np.ones(num_points),
+                                         normal, tangent,
+                                         self.point_data.u_coord,
+                                         self.point_data.v_coord,
+                                         self.point_data.poly_id,
+                                         np.zeros((num_points, 3)))
         self.instance_data.set_state()
 
         self.undo_range = (old_len, len(self.instance_data))
 
-        #  t_result = time.time() - t1
-        #  self.logger.debug('Sampling {} points in self.mode {} took {}s.'.format(i+1, self.mode, t_result))
-
-
     def get_settings(self):
         """ get emit attributes from node """
 
@@ -322,8 +323,10 @@ class SporeSampler(ompx.MPxCommand):
         :return: """
         if seed == -1:
             random.seed(None)
+            np.random.seed(None)
         else:
             random.seed(seed)
+            np.random.seed(seed)
 
     """ ---------------------------------------------------------------- """
     """ random sampler """
@@ -337,31 +340,30 @@ class SporeSampler(ompx.MPxCommand):
             in_mesh = node_utils.get_connected_in_mesh(self.target, False)
             self.geo_cache.cache_geometry(in_mesh)
 
-        self.point_data.set_length(num_points)
-        [self.sample_triangle(random.choice(self.geo_cache.weighted_ids), i) for i in xrange(num_points)]
-
-    def sample_triangle(self,triangle_id, point_id):
-        """ sample a random point on a the given triangle """
-
-        r = random.random()
-        s = random.random()
+        triangle_ids = self.geo_cache.sample_triangle_ids(num_points)
+        self.point_data = self.sample_triangles(triangle_ids)
 
-        if r + s >= 1:
-            r = 1 - r
-            s = 1 - s
+    def sample_triangles(self, triangle_ids):
+        """ sample one random point on each of the given triangles
+        :param triangle_ids np.array: ids of the triangles to sample
+        :return Points: point data object containing the sampled points """
 
-        r = om.MScriptUtil(r).asFloat()
-        s = om.MScriptUtil(s).asFloat()
+        num_points = len(triangle_ids)
+        r = np.random.random(num_points)
+        s = np.random.random(num_points)
 
-        r = self.geo_cache.AB[triangle_id] * r
-        s = self.geo_cache.AC[triangle_id] * s
+        # fold points of the parallelogram back into the triangle
+        fold = r + s >= 1
+        r[fold] = 1 - r[fold]
+        s[fold] = 1 - s[fold]
 
-        p = om.MPoint(r + s + om.MVector(self.geo_cache.p0[triangle_id]))
-        u = 0
-        v = 0
+        position = self.geo_cache.p0[triangle_ids]\
+                 + self.geo_cache.AB[triangle_ids] * r[:, np.newaxis]\
+                 + self.geo_cache.AC[triangle_ids] * s[:, np.newaxis]
 
-        self.point_data.set(point_id, p, self.geo_cache.normals[triangle_id],
-                            self.geo_cache.poly_id[triangle_id], u, v)
+        return Points(position,
+                      self.geo_cache.normals[triangle_ids],
+                      self.geo_cache.poly_id[triangle_ids])
 
     """ ---------------------------------------------------------------- """
     """ grid sampling """
@@ -371,166 +373,40 @@ class SporeSampler(ompx.MPxCommand):
         """ randomly choose one point from each grid cell and
         return a list of ids that associate a point in the point_data obj """
 
-        #  point_data = Points()
-        #  point_data.set_length(len(grid_partition))
-
-        ids = []
-        for key, val in grid_partition.iteritems():
-            ids.append(random.choice(val))
-
-        return sorted(ids)
+        return sample_utils.grid_sampling(grid_partition)
 
     """ ---------------------------------------------------------------- """
     """ disk sampling 3d """
     """ ---------------------------------------------------------------- """
 
-    def disk_sampling_3d(self, min_radius, grid_partition, cell_size):
-
-        in_mesh = node_utils.get_connected_in_mesh(self.target, False)
-        bb = om.MFnDagNode(in_mesh).boundingBox()
-
-        # pick randomly an initial point from where we start sampling
-        initial_key = random.choice(grid_partition.keys())
-        init_p_ref = random.choice(grid_partition[initial_key])
-
-        # create two list for active (not yet processed) and valid (sampled) points
-        active = []
-        valid_points = [None] * self.w_count * self.h_count * self.d_count
-
-        # append the first point to both lists
-        active.append(init_p_ref)
-        valid_points[initial_key] = init_p_ref
-
-        while len(active) > 0:
-
-            # pick a random point from the active points list
-            p_active_index = int(len(active) * random.random())
-            p_active = active[p_active_index]
-            # TODO - get each active point only once?
-
-            # normalize the point and get it's x,y,z index in the grid
-            p_normalized = self.point_data.position[p_active] - bb.min()
-            p_grid_x = int(p_normalized.x / cell_size)
-            p_grid_y = int(p_normalized.y / cell_size)
-            p_grid_z = int(p_normalized.z / cell_size)
-
-            # assume no point will be found
-            found = False
-
-            # try k times to find a new sample
-            k = 30
-            for i in xrange(k):
-
-                # get neighboring cell
-                new_p_x, new_p_y, new_p_z = self.get_valid_neighbouring_cell(p_grid_x, p_grid_y, p_grid_z)
-
-                # get liear index from x,y,z position.
-                key = new_p_x + new_p_y * self.w_count + new_p_z * self.w_count * self.h_count
-
-                # check if key is valid and if there isnt already a valid point...
-                if grid_partition.has_key(key)\
-                and not valid_points[key]:
-
-                    # get a random point from the list associated with the key
-                    new_index = int(len(grid_partition[key]) * random.random())
-                    point_index = grid_partition[key][new_index]
-                    point = self.point_data.position[point_index]
-
-                # ...otherwise try again
-                else:
-                    continue
-
-                valid = True
-                # check against all nearby cells if the sample is valid
-                for x in xrange(new_p_x - 1, new_p_x + 2):
-                    for y in xrange(new_p_y - 1, new_p_y + 2):
-                        for z in xrange(new_p_z - 1, new_p_z + 2):
-
-                            # ignore invalid cells
-                            if x < 0 or y < 0 or z < 0:
-                                continue
-                            elif x > self.w_count - 1 or y > self.h_count - 1 or z > self.d_count -1:
-                                continue
-
-                            # get the index for the current cell
-                            index = x + y * self.w_count + z * self.w_count * self.h_count
-
-                            # check if there is already a valid point in the cell
-                            if index >= 0 and index <= len(valid_points) - 1:
-                                if valid_points[index]:
-                                    neighbor = self.point_data.position[valid_points[index]]
+    def disk_sampling_3d(self, min_radius, grid_partition):
+        """ get a poisson disk distributed subset of the sampled points
+        :param min_radius float: minimum distance between two points
+        :param grid_partition tuple: offsets and indices from voxelize
+        :return np.array: ids of the points in the point_data obj """
 
-                                else:
-                                    continue
-                            else:
-                                raise RuntimeError
-                                continue
-
-                            # check distance to the next neighbour
-                            # if it conflicts tag the point invalid and break
-                            # out of the loop
-                            distance = point.distanceTo(neighbor)# + min_radius / 10
-                            if distance < min_radius: # - (min_radius / 10) :
-                                valid = False
-                                break
-
-                        if valid is False:
-                            break
-                    if valid is False:
-                        break
-
-                if valid:
-                    found = True
-                    valid_points[key] = point_index
-                    active.append(point_index)
+        return sample_utils.disk_sampling_3d(self.point_data.position,
+                                             min_radius, grid_partition)
 
-            if not found:
-                active.remove(p_active)
-                #  active.pop(p_active_index)
-
-        return [i for i in valid_points if i is not None]
-
-    def get_valid_neighbouring_cell(self, p_grid_x, p_grid_y, p_grid_z):
-        """ return a neighbouring cell within the range of p-2 to p+2 where
-        0 < x/y/z < h/w/d - 1. This ensures that only valid cell will be returned.
-        :param p_grid_x: cell x position
-        :param p_grid_y: cell y position
-        :param p_grid_z: cell z posiiton
-        :return: """
+    """ ---------------------------------------------------------------- """
+    """ surface sampling """
+    """ ---------------------------------------------------------------- """
 
-        if self.w_count < 5:
-            new_p_x = random.randint(0, self.w_count - 1)
-        elif p_grid_x <= 2:
-            new_p_x = random.randint(0, p_grid_x + 2)
-        elif p_grid_x >= self.w_count - 2:
-            new_p_x = random.randint(p_grid_x - 2, self.w_count - 1)
-        else:
-            new_p_x = random.randint(p_grid_x - 2, p_grid_x + 2)
-
-        if self.h_count < 5:
-            new_p_y = random.randint(0, self.h_count - 1)
-        elif p_grid_y <= 2:
-            new_p_y = random.randint(0, p_grid_y + 2)
-        elif p_grid_y >= self.h_count - 2:
-            new_p_y = random.randint(p_grid_y - 2, self.h_count - 1)
-        else:
-            new_p_y = random.randint(p_grid_y - 2, p_grid_y + 2)
-
-        if self.d_count < 5:
-            new_p_z = random.randint(0, self.d_count - 1)
-        elif p_grid_z <= 2:
-            new_p_z = random.randint(0, p_grid_z + 2)
-        elif p_grid_z >= self.d_count - 2:
-            new_p_z = random.randint(p_grid_z - 2, self.d_count - 1)
-        else:
-            new_p_z = random.randint(p_grid_z - 2, p_grid_z + 2)
+    def surface_sampling(self, num_samples, oversampling=5):
+        """ sample blue noise points directly on the cached triangles.
+        an area weighted candidate set is reduced to the given number of
+        points by weighted sample elimination. no uvs are involved so the
+        result doesn't depend on the uv layout and has no seams.
+        :param num_samples int: number of points to sample
+        :param oversampling int: number of candidates per sample """
 
-        if new_p_x < 0 or new_p_y < 0 or new_p_z < 0:
-            raise RuntimeError
-        elif new_p_x > self.w_count - 1 or new_p_y > self.h_count - 1 or new_p_z > self.w_count - 1:
-            raise RuntimeError
+        self.random_sampling(num_samples * oversampling)
 
-        return new_p_x, new_p_y, new_p_z
+        # the cached triangle area is twice the actual area
+        area = self.geo_cache.area.sum() / 2
+        valid_points = sample_utils.sample_elimination(self.point_data.position,
+                                                       num_samples, area)
+        self.point_data.compact(valid_points)
 
     """ ---------------------------------------------------------------- """
     """ disk sampling 2d """
@@ -664,32 +540,14 @@ class SporeSampler(ompx.MPxCommand):
     def voxelize(self, cell_size):
         """ partition the spatial domain with the given cellsize.
         than assign each point to the cell is spatialy belongs to.
-        :return dict: where:
-                      key == the cell index
-                      value == list of points indexes from the point_data obj """
-
-        partition = {}
+        :return tuple: csr like (offsets, indices) where the points of
+                       cell i are indices[offsets[i]:offsets[i + 1]] """
 
         in_mesh = node_utils.get_connected_in_mesh(self.target, False)
         bb = om.MFnDagNode(in_mesh).boundingBox()
+        bb_min = np.array([bb.min().x, bb.min().y, bb.min().z])
 
-        self.w_count = int(math.ceil(bb.width() / cell_size))
-        self.h_count = int(math.ceil(bb.height() / cell_size))
-        self.d_count = int(math.ceil(bb.depth() / cell_size))
-
-        bb_min = bb.min()
-        for i in xrange(self.point_data.position.length()):
-            p_normalized = self.point_data.position[i] - bb_min
-            p_x = int(p_normalized.x / cell_size)
-            p_y = int(p_normalized.y / cell_size)
-            p_z = int(p_normalized.z / cell_size)
-
-            index = p_x + p_y * self.w_count + p_z * self.w_count * self.h_count
-
-
-            partition.setdefault(index, []).append(i)
-
-        return partition
+        return sample_utils.voxelize(self.point_data.position, cell_size, bb_min)
 
     def evaluate_uvs(self):
         """ evaluate uv coords for all points in point data.
@@ -711,135 +569,113 @@ class SporeSampler(ompx.MPxCommand):
     """ ---------------------------------------------------------------- """
 
     def texture_filter(self, node, filter_size):
-        """ filter points based on the input texture attribute """
+        """ filter points based on the input texture attribute
+        :return np.array: boolean mask of points to keep """
 
         if not node:
             raise RuntimeError('No input shading node given')
 
         color, alpha = render_utils.sample_shading_node(node, self.point_data)
-        invalid_ids = []
         gamma = 2.2
-        for i, val in enumerate(color):
-            val = val[0]
-            if val < 0 or val > 1:
-                val = max(min(1, val), 0)
-
-            if val ** (1/gamma) < random.random():
-                invalid_ids.append(i)
+        value = np.array(color, np.float64).reshape(-1, 3)[:, 0]
+        value = np.clip(value, 0, 1)
 
-        invalid_ids = sorted(invalid_ids, reverse=True)
-        [self.point_data.remove(index) for index in invalid_ids]
+        return value ** (1 / gamma) >= np.random.random(len(value))
 
     def altitude_filter(self, min_altitude, max_altitude, min_fuzziness, max_fuzziness):
-        """ filter points based on y position relative to bounding box """
+        """ filter points based on y position relative to bounding box.
+        points within the fuzz range are rejected randomly with a
+        probability growing with the distance to the altitude limit
+        :return np.array: boolean mask of points to keep """
 
         in_mesh = node_utils.get_connected_in_mesh(self.target, False)
         dag_fn = om.MFnDagNode(in_mesh)
 
         bb = dag_fn.boundingBox()
         bb_y_min = bb.min().y
-        height = bb.height()
+        height = bb.height() or 1.0
 
-        invalid_ids = []
-        for i, (position, _, _, _, _) in enumerate(self.point_data):
-            y_normalized = position[1] - bb_y_min
-            pos_rel = y_normalized / height
+        num_points = len(self.point_data)
+        pos_rel = (self.point_data.position[:, 1] - bb_y_min) / height
+        min_fuzz = np.random.uniform(0, min_fuzziness, num_points)
+        max_fuzz = np.random.uniform(0, max_fuzziness, num_points)
 
-            if pos_rel < min_altitude:
-                if pos_rel < min_altitude - min_fuzziness:
-                    invalid_ids.append(i)
+        below = (pos_rel < min_altitude) & (min_altitude - pos_rel > min_fuzz)
+        above = (pos_rel > max_altitude) & (pos_rel - max_altitude > max_fuzz)
 
-                elif min_altitude - pos_rel > random.uniform(0, min_fuzziness):
-                    invalid_ids.append(i)
-
-            elif pos_rel > max_altitude:
-                if pos_rel > max_altitude + max_fuzziness:
-                    invalid_ids.append(i)
-
-                elif abs(max_altitude - pos_rel) > random.uniform(0, max_fuzziness):
-                    invalid_ids.append(i)
-
-        invalid_ids = sorted(invalid_ids, reverse=True)
-        [self.point_data.remove(index) for index in invalid_ids]
+        return ~(below | above)
 
     def slope_filter(self, min_slope, max_slope, fuzz):
+        """ filter points based on the angle between normal and world up
+        :return np.array: boolean mask of points to keep """
 
-        world = om.MVector(0, 1, 0)
-
-        invalid_ids = []
-        for i, (_, normal, _, _, _) in enumerate(self.point_data):
-            normal = om.MVector(normal[0], normal[1], normal[2])
-            angle = math.degrees(normal.angle(world)) + 45 * random.uniform(-fuzz, fuzz)
-
-            if angle < min_slope or angle > max_slope:
-                invalid_ids.append(i)
+        normal = self.point_data.normal
+        length = np.sqrt(np.einsum('ij,ij->i', normal, normal))
+        length[length == 0] = 1.0
 
-        invalid_ids = sorted(invalid_ids, reverse=True)
-        [self.point_data.remove(index) for index in invalid_ids]
+        cos_angle = np.clip(normal[:, 1] / length, -1, 1)
+        angle = np.degrees(np.arccos(cos_angle))\
+              + 45 * np.random.uniform(-fuzz, fuzz, len(normal))
 
-
-        pass
+        return (angle >= min_slope) & (angle <= max_slope)
 
     """ ---------------------------------------------------------------- """
     """ transformation utils """
     """ ---------------------------------------------------------------- """
 
     def get_alignment(self, alignment, normal):
-        """ get a vector representing th current alignment mdoe """
+        """ get the vectors representing the current alignment mode
+        :param alignment str: the alignment mode
+        :param normal np.array: array of shape (n, 3) of sampled normals
+        :return np.array: array of shape (n, 3) """
 
-        if alignment == 'normal':
-            return normal
-        elif alignment == 'world':
-            return om.MVector(0, 1, 0)
+        if alignment == 'world':
+            return np.tile((0.0, 1.0, 0.0), (len(normal), 1))
         elif alignment == 'object':
-            return node_utils.get_local_rotation(self.target)
-
+            rotation = node_utils.get_local_rotation(self.target)
+            return np.tile((rotation.x, rotation.y, rotation.z), (len(normal), 1))
+        else:
+            return normal
 
     def get_rotation(self, direction, weight, min_rot, max_rot):
-        """ get rotation from a matrix pointing towards the given direction
+        """ get rotations from matrices pointing towards the given directions
         slerped by the given weight into the world up vector and added a random
-        rotation between min and max rotation """
+        rotation between min and max rotation
+        :param direction np.array: array of shape (n, 3)
+        :return np.array: array of shape (n, 3) of euler angles in degrees """
 
-        r_x = math.radians(random.uniform(min_rot[0], max_rot[0]))
-        r_y = math.radians(random.uniform(min_rot[1], max_rot[1]))
-        r_z = math.radians(random.uniform(min_rot[2], max_rot[2]))
-        util = om.MScriptUtil()
-        util.createFromDouble(r_x, r_y, r_z)
-        rotation_ptr = util.asDoublePtr()
-
-        matrix = om.MTransformationMatrix()
-        matrix.setRotation(rotation_ptr, om.MTransformationMatrix.kXYZ)
-        world_up = om.MVector(0, 1, 0)
-        rotation = om.MQuaternion(world_up, direction, weight)
-        matrix = matrix.asMatrix() * rotation.asMatrix()
-        rotation = om.MTransformationMatrix(matrix).rotation().asEulerRotation()
+        random_rotation = np.radians(np.random.uniform(min_rot, max_rot, (len(direction), 3)))
+        matrix = transform_utils.euler_to_matrix(random_rotation)
+        rotation = transform_utils.rotate_into((0, 1, 0), direction, weight)
+        matrix = np.einsum('nij,njk->nik', matrix, rotation)
 
-        return om.MVector(math.degrees(rotation.x),
-                          math.degrees(rotation.y),
-                          math.degrees(rotation.z))
+        return np.degrees(transform_utils.matrix_to_euler(matrix))
 
-    def get_scale(self, min_scale, max_scale, uniform=True):
-        """ get scale values between min and max scale """
+    def get_scale(self, min_scale, max_scale, uniform=True, num_points=1):
+        """ get scale values between min and max scale
+        :return np.array: array of shape (n, 3) """
 
         if uniform:
-            scale_x = scale_y = scale_z = random.uniform(min_scale[0], max_scale[0])
+            scale = np.random.uniform(min_scale[0], max_scale[0], num_points)
+            return np.repeat(scale[:, np.newaxis], 3, axis=1)
         else:
-            scale_x = random.uniform(min_scale[0], max_scale[0])
-            scale_y = random.uniform(min_scale[1], max_scale[1])
-            scale_z = random.uniform(min_scale[2], max_scale[2])
-
-        return om.MVector(scale_x, scale_y, scale_z)
+            return np.random.uniform(min_scale, max_scale, (num_points, 3))
 
     def get_offset(self, position, min_offset, max_offset, direction):
-        """ get position offest between min and max in a given direction """
+        """ get position offest between min and max in the given directions
+        :return np.array: array of shape (n, 3) """
+
         if min_offset != 0 and max_offset != 0:
-            offset = random.uniform(min_offset, max_offset)
-            return position + direction * offset
+            offset = np.random.uniform(min_offset, max_offset, len(position))
+            return position + direction * offset[:, np.newaxis]
         else:
             return position
 
-    def instance_id(self, ids):
-        return random.choice(ids)
+    def instance_id(self, ids, num_points=1):
+        """ get random instance ids from the given ids
+        :return np.array: array of shape (n,) """
+
+        return np.asarray(ids)[np.random.randint(0, len(ids), num_points)]
 
     def parse_args(self, args):
         """ parse command arguments """
@@ -847,7 +683,8 @@ class SporeSampler(ompx.MPxCommand):
         mode_map = {0: 'random',
                     1: 'jitter',
                     2: 'poisson3d',
-                    3: 'poisson2d'}
+                    3: 'poisson2d',
+                    4: 'poissonsurface'}
 
         arg_data = om.MArgDatabase(self.syntax(), args)
 
@@ -200,6 +200,12 @@ class AEsporeNodeTemplate(AETemplate):
         self.addControl('geoCached', label='Geo Cached')
         self.endLayout()
 
+        # point storage layout
+        self.beginLayout('Storage', collapse=True)
+        self.addControl('externalCache', label='External Cache File')
+        self.addControl('cacheFile', label='Cache File')
+        self.endLayout()
+
         self.endLayout()
 
     # ------------------------------------------------------------------------ #
@@ -524,6 +530,11 @@ class AEsporeNodeTemplate(AETemplate):
             self.dimControl(node, 'cellSize', True)
             self.dimControl(node, 'minRadius', True)
             self.dimControl(node, 'minRadius2d', False)
+        elif emit_type == 4:
+            self.dimControl(node, 'numSamples', False)
+            self.dimControl(node, 'cellSize', True)
+            self.dimControl(node, 'minRadius', True)
+            self.dimControl(node, 'minRadius2d', True)
 
     def estimate_num_samples(self, node):
         """ estimate how many random samples we need for grid or disk sampling """
@@ -0,0 +1,344 @@
+"""
+module provides a bounding volume hierarchy over triangles for batched
+ray intersection and closest point queries.
+the hierarchy is a complete binary tree stored in flat numpy arrays where
+the children of node i are 2i + 1 and 2i + 2. the triangles are sorted
+along a morton curve and split into leaves of leaf_size triangles.
+all queries are processed together, one tree level at a time.
+"""
+
+import numpy as np
+
+
+# number of bits per axis used for the morton codes
+MORTON_BITS = 10
+
+
+class BVH(object):
+    """ linear bounding volume hierarchy over triangles.
+    the tree only depends on the triangle vertices, results refer to the
+    triangle ids of the given arrays """
+
+    def __init__(self, p0, p1, p2, leaf_size=8):
+
+        self.p0 = np.asarray(p0, np.float64).reshape(-1, 3)
+        self.p1 = np.asarray(p1, np.float64).reshape(-1, 3)
+        self.p2 = np.asarray(p2, np.float64).reshape(-1, 3)
+        self.leaf_size = int(leaf_size)
+        self.build()
+
+    def build(self):
+        """ sort the triangles into leaves and compute the node bounds """
+
+        num_triangles = len(self.p0)
+        tri_min = np.minimum(np.minimum(self.p0, self.p1), self.p2)
+        tri_max = np.maximum(np.maximum(self.p0, self.p1), self.p2)
+
+        # sort the triangles by the morton code of their centroid
+        centroid = (self.p0 + self.p1 + self.p2) / 3.0
+        self.order = np.argsort(get_morton_code(centroid), kind='mergesort')
+
+        # number of leaves padded to the next power of two
+        num_leaves = -(-num_triangles // self.leaf_size)
+        self.num_leaves = 1 << int(np.ceil(np.log2(num_leaves))) if num_leaves else 0
+        self.depth = int(np.log2(self.num_leaves)) if num_leaves else 0
+        num_nodes = max(2 * self.num_leaves - 1, 0)
+
+        # empty nodes keep inverted bounds and a count of zero
+        self.node_min = np.full((num_nodes, 3), np.inf)
+        self.node_max = np.full((num_nodes, 3), -np.inf)
+        self.node_count = np.zeros(num_nodes, np.int64)
+        if not num_nodes:
+            return
+
+        first_leaf = self.num_leaves - 1
+        start = np.arange(0, num_triangles, self.leaf_size)
+        leaves = first_leaf + np.arange(len(start))
+        self.node_min[leaves] = np.minimum.reduceat(tri_min[self.order], start)
+        self.node_max[leaves] = np.maximum.reduceat(tri_max[self.order], start)
+        self.node_count[leaves] = np.diff(np.r_[start, num_triangles])
+
+        # merge the bounds bottom up, one level at a time
+        for level in xrange(self.depth - 1, -1, -1):
+            parent = np.arange((1 << level) - 1, (1 << (level + 1)) - 1)
+            left = 2 * parent + 1
+            right = left + 1
+            self.node_min[parent] = np.minimum(self.node_min[left], self.node_min[right])
+            self.node_max[parent] = np.maximum(self.node_max[left], self.node_max[right])
+            self.node_count[parent] = self.node_count[left] + self.node_count[right]
+
+    def intersect(self, origin, direction):
+        """ get the closest intersection of each ray with the triangles.
+        triangles are hit from both sides
+        :param origin np.array: ray origins of shape (n, 3)
+        :param direction np.array: ray directions of shape (n, 3)
+        :return: hit points of shape (n, 3)
+                 distances along the rays of shape (n,), inf if nothing was hit
+                 triangle ids of shape (n,), -1 if nothing was hit
+                 barycentric coords of shape (n, 2) """
+
+        origin = np.asarray(origin, np.float64).reshape(-1, 3)
+        direction = np.asarray(direction, np.float64).reshape(-1, 3)
+        with np.errstate(divide='ignore'):
+            inv_direction = 1.0 / direction
+
+        def box_test(query, node):
+            t1 = (self.node_min[node] - origin[query]) * inv_direction[query]
+            t2 = (self.node_max[node] - origin[query]) * inv_direction[query]
+            t_near = np.fmin(t1, t2).max(axis=1)
+            t_far = np.fmax(t1, t2).min(axis=1)
+            return t_far >= np.maximum(t_near, 0)
+
+        query, triangle = self.traverse(len(origin), box_test)
+        t, u, v = intersect_triangles(origin[query],
+                                      direction[query],
+                                      self.p0[triangle],
+                                      self.p1[triangle],
+                                      self.p2[triangle])
+        return self.get_nearest(len(origin), query, triangle, t, u, v, origin, direction)
+
+    def closest_points(self, position, max_distance=np.inf):
+        """ get the closest point on the triangles for each given point
+        :param position np.array: query points of shape (n, 3)
+        :param max_distance float: ignore triangles further away
+        :return: closest points of shape (n, 3)
+                 distances of shape (n,), inf if nothing was found
+                 triangle ids of shape (n,), -1 if nothing was found
+                 barycentric coords of shape (n, 2) """
+
+        position = np.asarray(position, np.float64).reshape(-1, 3)
+        bound = np.full(len(position), float(max_distance) ** 2)
+
+        def box_distance(query, node):
+            lower = np.maximum(self.node_min[node] - position[query], 0)
+            lower = np.maximum(lower, position[query] - self.node_max[node])
+            return np.einsum('ij,ij->i', lower, lower)
+
+        def box_test(query, node):
+            # every face of a node touches a triangle, so the distance to
+            # the furthest point of the closest face bounds the result
+            # (minmaxdist from the r-tree nearest neighbour search)
+            p = position[query]
+            low = self.node_min[node]
+            high = self.node_max[node]
+            center = (low + high) * 0.5
+            near = np.where(p <= center, low, high) - p
+            far = np.where(p >= center, low, high) - p
+            far = far * far
+            min_max = (far.sum(axis=1)[:, np.newaxis] - far + near * near).min(axis=1)
+            np.minimum.at(bound, query, min_max)
+            return box_distance(query, node) <= bound[query]
+
+        # seed the bound with the triangles of the leaf that is found by
+        # descending into the closer child so most nodes can be skipped
+        if len(self.node_count) and len(position):
+            query = np.arange(len(position))
+            node = np.zeros(len(position), np.int64)
+            for level in xrange(self.depth):
+                left = 2 * node + 1
+                right = left + 1
+                distance_left = box_distance(query, left)
+                distance_right = box_distance(query, right)
+
+                # the query is often inside both boxes, prefer the closer center
+                with np.errstate(invalid='ignore'):
+                    center_left = self.node_min[left] + self.node_max[left] - 2 * position
+                    center_right = self.node_min[right] + self.node_max[right] - 2 * position
+                    closer = (distance_right < distance_left) | (
+                        (distance_right == distance_left) &
+                        (np.einsum('ij,ij->i', center_right, center_right) <
+                         np.einsum('ij,ij->i', center_left, center_left)))
+                node = np.where((self.node_count[right] > 0) & closer, right, left)
+
+            query, triangle = self.get_leaf_triangles(query, node)
+            u, v = closest_point_on_triangles(position[query],
+                                              self.p0[triangle],
+                                              self.p1[triangle],
+                                              self.p2[triangle])
+            delta = self.get_points(triangle, u, v) - position[query]
+            np.minimum.at(bound, query, np.einsum('ij,ij->i', delta, delta))
+
+        query, triangle = self.traverse(len(position), box_test)
+        u, v = closest_point_on_triangles(position[query],
+                                          self.p0[triangle],
+                                          self.p1[triangle],
+                                          self.p2[triangle])
+        point = self.get_points(triangle, u, v)
+        distance = np.linalg.norm(point - position[query], axis=1)
+        distance[distance > max_distance] = np.inf
+        return self.get_nearest(len(position), query, triangle, distance, u, v)
+
+    def traverse(self, num_queries, box_test):
+        """ collect candidate triangles for all queries by walking down the
+        tree level by level
+        :param num_queries int: number of queries
+        :param box_test function: takes query and node ids and returns a
+                                  mask of the nodes that should be visited
+        :return: query ids and triangle ids of all candidate pairs """
+
+        if not len(self.node_count) or not num_queries:
+            return np.empty(0, np.int64), np.empty(0, np.int64)
+
+        query = np.arange(num_queries)
+        node = np.zeros(num_queries, np.int64)
+        for level in xrange(self.depth + 1):
+            inside = box_test(query, node)
+            query = query[inside]
+            node = node[inside]
+            if level == self.depth:
+                break
+
+            # descend into all non empty children
+            query = np.repeat(query, 2)
+            node = np.repeat(2 * node + 1, 2)
+            node[1::2] += 1
+            valid = self.node_count[node] > 0
+            query = query[valid]
+            node = node[valid]
+
+        return self.get_leaf_triangles(query, node)
+
+    def get_leaf_triangles(self, query, node):
+        """ expand pairs of queries and leaf nodes to pairs of queries and
+        the triangles inside the leaves """
+
+        count = self.node_count[node]
+        start = (node - (self.num_leaves - 1)) * self.leaf_size
+        shift = np.repeat(start - np.r_[0, np.cumsum(count)[:-1]], count)
+        triangle = self.order[shift + np.arange(count.sum())]
+        return np.repeat(query, count), triangle
+
+    def get_nearest(self, num_queries, query, triangle, distance, u, v, origin=None, direction=None):
+        """ reduce the candidate pairs to the nearest result of each query """
+
+        result_id = np.full(num_queries, -1, np.int64)
+        result_distance = np.full(num_queries, np.inf)
+        barycentric = np.zeros((num_queries, 2))
+
+        found = np.isfinite(distance)
+        query, triangle, distance = query[found], triangle[found], distance[found]
+        u, v = u[found], v[found]
+
+        # sort by query and distance and take the first pair of each query
+        order = np.lexsort((distance, query))
+        first = order[np.r_[True, query[order][1:] != query[order][:-1]]] if len(order) else order
+        nearest = query[first]
+        result_id[nearest] = triangle[first]
+        result_distance[nearest] = distance[first]
+        barycentric[nearest] = np.c_[u[first], v[first]]
+
+        points = np.zeros((num_queries, 3))
+        if origin is not None:
+            points[nearest] = origin[nearest] + direction[nearest] * distance[first][:, np.newaxis]
+        else:
+            points[nearest] = self.get_points(triangle[first], u[first], v[first])
+        return points, result_distance, result_id, barycentric
+
+    def get_points(self, triangle, u, v):
+        """ get the points for the given triangles and barycentric coords
+        where point = p0 + u * (p1 - p0) + v * (p2 - p0) """
+
+        p0 = self.p0[triangle]
+        return p0 + (self.p1[triangle] - p0) * u[:, np.newaxis] + (self.p2[triangle] - p0) * v[:, np.newaxis]
+
+
+def get_morton_code(position):
+    """ get the morton code of the given points within their bounding box
+    :param position np.array: array of shape (n, 3)
+    :return np.array: array of shape (n,) """
+
+    if not len(position):
+        return np.empty(0, np.int64)
+
+    low = position.min(axis=0)
+    extent = position.max(axis=0) - low
+    extent[extent == 0] = 1
+    scale = (1 << MORTON_BITS) - 1
+    cell = ((position - low) / extent * scale).astype(np.int64)
+
+    code = np.zeros(len(position), np.int64)
+    for bit in xrange(MORTON_BITS):
+        for axis in xrange(3):
+            code |= ((cell[:, axis] >> bit) & 1) << (3 * bit + axis)
+    return code
+
+
+def intersect_triangles(origin, direction, p0, p1, p2, epsilon=1e-12):
+    """ moeller trumbore ray triangle intersection for pairs of rays and
+    triangles.
+    :return: distance along the ray, inf if there is no hit, and the
+             barycentric coords u and v of the hit """
+
+    edge1 = p1 - p0
+    edge2 = p2 - p0
+    p_vec = np.cross(direction, edge2)
+    det = np.einsum('ij,ij->i', edge1, p_vec)
+    parallel = np.abs(det) < epsilon
+    inv_det = 1.0 / np.where(parallel, 1.0, det)
+
+    t_vec = origin - p0
+    u = np.einsum('ij,ij->i', t_vec, p_vec) * inv_det
+    q_vec = np.cross(t_vec, edge1)
+    v = np.einsum('ij,ij->i', direction, q_vec) * inv_det
+    t = np.einsum('ij,ij->i', edge2, q_vec) * inv_det
+
+    hit = ~parallel & (u >= 0) & (v >= 0) & (u + v <= 1) & (t >= 0)
+    return np.where(hit, t, np.inf), u, v
+
+
+def closest_point_on_triangles(position, p0, p1, p2):
+    """ get the closest point on pairs of points and triangles.
+    vectorized version of the voronoi region test from
+    real-time collision detection, chapter 5.1.5.
+    :return: barycentric coords u and v of the closest points """
+
+    ab = p1 - p0
+    ac = p2 - p0
+    d1 = np.einsum('ij,ij->i', ab, position - p0)
+    d2 = np.einsum('ij,ij->i', ac, position - p0)
+    d3 = np.einsum('ij,ij->i', ab, position - p1)
+    d4 = np.einsum('ij,ij->i', ac, position - p1)
+    d5 = np.einsum('ij,ij->i', ab, position - p2)
+    d6 = np.einsum('ij,ij->i', ac, position - p2)
+    va = d3 * d6 - d5 * d4
+    vb = d5 * d2 - d1 * d6
+    vc = d1 * d4 - d3 * d2
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # the point projects inside the face
+        denom = va + vb + vc
+        u = vb / denom
+        v = vc / denom
+
+        # the regions are tested in reverse order so the first
+        # matching region of the scalar version wins
+        region = (va <= 0) & (d4 - d3 >= 0) & (d5 - d6 >= 0) # edge p1 p2
+        w = (d4 - d3) / ((d4 - d3) + (d5 - d6))
+        u = np.where(region, 1 - w, u)
+        v = np.where(region, w, v)
+
+        region = (vb <= 0) & (d2 >= 0) & (d6 <= 0) # edge p0 p2
+        u = np.where(region, 0, u)
+        v = np.where(region, d2 / (d2 - d6), v)
+
+        region = (d6 >= 0) & (d5 <= d6) # vertex p2
+        u = np.where(region, 0, u)
+        v = np.where(region, 1, v)
+
+        region = (vc <= 0) & (d1 >= 0) & (d3 <= 0) # edge p0 p1
+        u = np.where(region, d1 / (d1 - d3), u)
+        v = np.where(region, 0, v)
+
+        region = (d3 >= 0) & (d4 <= d3) # vertex p1
+        u = np.where(region, 1, u)
+        v = np.where(region, 0, v)
+
+        region = (d1 <= 0) & (d2 <= 0) # vertex p0
+        u = np.where(region, 0, u)
+        v = np.where(region, 0, v)
+
+    # degenerated triangles fall back to their first vertex
+    invalid = ~(np.isfinite(u) & np.isfinite(v))
+    u[invalid] = 0
+    v[invalid] = 0
+    return u, v
@@ -1,5 +1,5 @@
 import sys
-import math
+import hashlib
 import numpy as np
 
 try:
@@ -9,6 +9,8 @@ except ImportError:
 
 import maya.OpenMaya as om
 
+import bvh
+import array_utils
 import logging_util
 #  import progress_bar
 
@@ -16,6 +18,8 @@ import logging_util
 class GeoCache(object):
     """
     container for cached triangulated geometry
+    triangle data is stored as structure of arrays in contiguous numpy
+    arrays where each row represents one triangle.
     note: no extra type checking or error handling is done!
     """
 
@@ -24,22 +28,30 @@ class GeoCache(object):
         log_lvl = sys._global_spore_dispatcher.spore_globals['LOG_LEVEL']
         self.logger = logging_util.SporeLogger(__name__, log_lvl)
 
-        self.p0 = om.MPointArray()
-        self.p1 = om.MPointArray()
-        self.p2 = om.MPointArray()
-        self.normals = om.MVectorArray()
-        self.poly_id = om.MIntArray()
-        self.AB = om.MVectorArray()
-        self.AC = om.MVectorArray()
-
-        self.poly_verts = om.MPointArray()
+        self.p0 = np.empty((0, 3), np.float64)
+        self.p1 = np.empty((0, 3), np.float64)
+        self.p2 = np.empty((0, 3), np.float64)
+        self.normals = np.empty((0, 3), np.float64)
+        self.poly_id = np.empty(0, np.int32)
+        self.AB = np.empty((0, 3), np.float64)
+        self.AC = np.empty((0, 3), np.float64)
+        self.area = np.empty(0, np.float64)
+
+        # fingerprint of the cached mesh. it is only compared when the mesh
+        # has been dirtied since the last successful validation
+        self.fingerprint = None
+        self.dirty = True
+        self.callbacks = om.MCallbackIdArray()
 
         self.uv_kd_tree = None
         self.neighbor_lookup = {}
 
+        # optional acceleration structure for ray and closest point queries
+        self.bvh = None
+
         self.mesh = None
         self.cached = True
-        self.weighted_ids = []
+        self.cumulative_area = np.empty(0, np.float64)
 
     #  @progress_bar.ProgressBar('Caching Geometry...')
     def cache_geometry(self, mesh):
@@ -52,79 +64,125 @@ class GeoCache(object):
 
         self.logger.debug('Cache geometry: {}'.format(mesh.fullPathName())) # TODO - get node name
 
-        #  in_mesh = node_utils.get_connected_in_mesh(self.thisMObject(), False)
         mesh_fn = om.MFnMesh(self.mesh)
-        #  num_polys = mesh_fn.numPolygons() # TODO - get in mesh fn
-        #  num_iter = num_polys / 100
-
-        # store ferts for validating the cache later
-        mesh_fn.getPoints(self.poly_verts)
-
-        # get bb in world space
-        dag_fn = om.MFnDagNode(self.mesh)
-        bb = dag_fn.boundingBox()
-        inv_matrix = self.mesh.exclusiveMatrix()
-        bb.transformUsing(inv_matrix)
-
-        # initialize triangle data
-        tri_points = om.MPointArray()
-        vert_ids = om.MIntArray()
-        tris_area = []
-        smallest_tri = None
-
-        # iter mesh
-        poly_iter = om.MItMeshPolygon(self.mesh)
-        while not poly_iter.isDone():
-
-            # get face triangles
-            poly_index = poly_iter.index()
-            poly_iter.getTriangles(tri_points, vert_ids, om.MSpace.kWorld)
-
-            # get triangle data
-            for i in xrange(tri_points.length() / 3):
-                p0 = tri_points[i * 3]
-                p1 = tri_points[i * 3 + 1]
-                p2 = tri_points[i * 3 + 2]
-                area, AB, AC, normal = self.get_triangle_area(p0, p1, p2)
 
-                if area < smallest_tri or smallest_tri is None:
-                    smallest_tri = area
+        # store a fingerprint for validating the cache later
+        self.fingerprint = self.get_fingerprint(self.mesh)
+        self.add_callbacks()
+        self.dirty = False
 
-                tris_area.append(area)
-                self.cache = (p0, p1, p2, normal, poly_index, AB, AC)
-
-            # update progressbar
-            #  if poly_index >= num_iter:
-            #      self.cache_geometry.increment()
-            #      num_iter += num_polys / 100
-
-            poly_iter.next()
-
-        probability = [int(math.ceil(area / smallest_tri)) for area in tris_area]
-        [self.weighted_ids.extend([idx] * chance) for idx, chance in enumerate(probability)]
+        # get the vertex buffer in one go and move it to world space
+        num_verts = mesh_fn.numVertices()
+        points = array_utils.ptr_to_np(mesh_fn.getRawPoints(), num_verts * 3)
+        points = points.reshape(num_verts, 3).astype(np.float64)
+        points = array_utils.transform_points(points, self.mesh.inclusiveMatrix())
+
+        # get the triangle index buffer
+        tri_counts = om.MIntArray()
+        tri_verts = om.MIntArray()
+        mesh_fn.getTriangles(tri_counts, tri_verts)
+        tri_counts = array_utils.int_array_to_np(tri_counts)
+        tri_verts = array_utils.int_array_to_np(tri_verts).reshape(-1, 3)
+
+        # get triangle data
+        self.p0 = points[tri_verts[:, 0]]
+        self.p1 = points[tri_verts[:, 1]]
+        self.p2 = points[tri_verts[:, 2]]
+        self.poly_id = np.repeat(np.arange(tri_counts.size, dtype=np.int32), tri_counts)
+        self.area, self.AB, self.AC, self.normals = self.get_triangle_area(self.p0, self.p1, self.p2)
+
+        # cumulative area table used to draw area weighted triangle ids
+        self.cumulative_area = np.cumsum(self.area)
 
         self.cached = True
 
+    def sample_triangle_ids(self, num_samples):
+        """ draw the given number of triangle ids where the probability
+        of each triangle to be chosen is proportional to its area.
+        :param num_samples int: number of ids to draw
+        :return np.array: array of triangle ids """
+
+        if not self.cumulative_area.size or self.cumulative_area[-1] <= 0:
+            return np.empty(0, np.int64)
+
+        # each triangle covers the interval [cdf[i-1], cdf[i]) so
+        # triangles without area can never be hit
+        rand = np.random.random(num_samples) * self.cumulative_area[-1]
+        triangle_ids = np.searchsorted(self.cumulative_area, rand, side='right')
+        return np.minimum(triangle_ids, self.cumulative_area.size - 1)
+
+    def build_bvh(self, leaf_size=8):
+        """ build a bounding volume hierarchy over the cached triangles
+        :param leaf_size int: number of triangles per leaf """
+
+        self.logger.debug('Build BVH for {} triangles'.format(len(self.p0)))
+        self.bvh = bvh.BVH(self.p0, self.p1, self.p2, leaf_size)
+
+    def intersect(self, origin, direction):
+        """ intersect the given rays with the cached triangles.
+        the bvh is built on the first query
+        :param origin np.array: ray origins of shape (n, 3)
+        :param direction np.array: ray directions of shape (n, 3)
+        :return: hit points of shape (n, 3)
+                 normals of shape (n, 3)
+                 poly ids of shape (n,), -1 if nothing was hit
+                 barycentric coords of shape (n, 2) """
+
+        if self.bvh is None:
+            self.build_bvh()
+
+        points, distance, triangle_id, barycentric = self.bvh.intersect(origin, direction)
+        return (points,) + self.get_triangle_data(triangle_id) + (barycentric,)
+
+    def get_closest_points(self, position, max_distance=np.inf):
+        """ get the closest points on the cached triangles.
+        the bvh is built on the first query
+        :param position np.array: points of shape (n, 3)
+        :param max_distance float: ignore triangles further away
+        :return: closest points of shape (n, 3)
+                 normals of shape (n, 3)
+                 poly ids of shape (n,), -1 if nothing was found
+                 barycentric coords of shape (n, 2) """
+
+        if self.bvh is None:
+            self.build_bvh()
+
+        points, distance, triangle_id, barycentric = self.bvh.closest_points(position, max_distance)
+        return (points,) + self.get_triangle_data(triangle_id) + (barycentric,)
+
+    def get_triangle_data(self, triangle_id):
+        """ get normals and poly ids for the given triangle ids where
+        missing triangles (-1) get a zero normal and a poly id of -1 """
+
+        found = triangle_id >= 0
+        normals = np.zeros((len(triangle_id), 3))
+        normals[found] = self.normals[triangle_id[found]]
+        poly_id = np.full(len(triangle_id), -1, np.int32)
+        poly_id[found] = self.poly_id[triangle_id[found]]
+        return normals, poly_id
+
     def get_triangle_area(self, p0, p1, p2):
         """
-        return size of a triangle and the vector p1-p0 and p2-p0
-        :param p0: MPoint 1
-        :param p1: MPoint 2
-        :param p2: MPoint 3
-        :return: triangle area, vector AB, vector AC, and the normalized triangle normal
+        return size of triangles and the vectors p1-p0 and p2-p0
+        :param p0: np.array of shape (n, 3) holding the first vertices
+        :param p1: np.array of shape (n, 3) holding the second vertices
+        :param p2: np.array of shape (n, 3) holding the third vertices
+        :return: triangle areas, vectors AB, vectors AC, and the normalized triangle normals
         """
 
-        AB = om.MVector(p1 - p0)
-        AC = om.MVector(p2 - p0)
+        AB = p1 - p0
+        AC = p2 - p0
 
-        normal = (AB ^ AC)
+        normal = np.cross(AB, AC)
 
         # actually the real surface area is area/2
         # but since all tris are handled the same way it does not make any difference
         # hence I can save computation by omitting area/2
-        area = math.sqrt(normal[0] ** 2 + normal[1] ** 2 + normal[2] ** 2)
+        area = np.sqrt(np.einsum('ij,ij->i', normal, normal))
 
-        normal.normalize()
+        # degenerated triangles keep a zero normal
+        length = np.where(area > 0, area, 1.0)
+        normal /= length[:, np.newaxis]
 
         return area, AB, AC, normal
 
@@ -167,60 +225,68 @@ class GeoCache(object):
 
 
     def validate_cache(self):
-        """ check if the current cache is valid """
-
-        points = om.MPointArray()
-        mesh_fn = om.MFnMesh(self.mesh)
-        mesh_fn.getPoints(points)
+        """ check if the current cache is valid. the fingerprint of the mesh
+        is only compared if the mesh has been dirtied since the last check """
 
-        if points.length() != self.poly_verts.length():
-            self.logger.debug('Validate GeoCache succeded')
+        if not self.cached or self.fingerprint is None or not self.mesh.isValid():
             return False
 
-        for i in xrange(points.length()):
-            if points[i] != self.poly_verts[i]:
-                self.logger.debug('Validate GeoCache failed')
-                return False
+        if not self.dirty:
+            return True
+
+        if self.get_fingerprint(self.mesh) != self.fingerprint:
+            self.logger.debug('Validate GeoCache failed')
+            return False
 
+        self.logger.debug('Validate GeoCache succeded')
+        self.dirty = False
         return True
 
+    def get_fingerprint(self, mesh):
+        """ get a cheap fingerprint of the given mesh made of the vertex and
+        polygon count, digests of the topology and the raw vertex buffer
+        and the world matrix.
+        :param mesh MDagPath: path to the mesh
+        :return tuple: """
 
-        """
-        index = 0
-        tri_points = om.MPointArray()
-        tri_ids = om.MIntArray()
-        poly_iter = om.MItMeshPolygon(self.mesh)
-        while not poly_iter.isDone():
-
-            # get face triangles
-            poly_index = poly_iter.index()
-            poly_iter.getTriangles(tri_points, tri_ids, om.MSpace.kWorld)
-
-            # get triangle data
-            for i in xrange(tri_points.length() / 3):
-                #  assert self.p0[i * 3] == tri_points[i * 3]
-                #  assert self.p1[i * 3 + 1] == tri_points[i * 3 + 1]
-                #  assert self.p2[i * 3 + 2] == tri_points[i * 3 + 2]
-                print self.p0[i*3].x, tri_points[i*3].x
-                print self.p0[i*3].y, tri_points[i*3].y
-                print self.p0[i*3].z, tri_points[i*3].z
-                print '-'
-                print self.p0[i*3+1].x, tri_points[i*3+1].x
-                print self.p0[i*3+1].y, tri_points[i*3+1].y
-                print self.p0[i*3+1].z, tri_points[i*3+1].z
-                print '-'
-                print self.p0[i*3+2].x, tri_points[i*3+2].x
-                print self.p0[i*3+2].y, tri_points[i*3+2].y
-                print self.p0[i*3+2].z, tri_points[i*3+2].z
-                #  except AssertionError:
-                #      return False
-
-                index += 1
-
-            poly_iter.next()
+        mesh_fn = om.MFnMesh(mesh)
+        num_verts = mesh_fn.numVertices()
+        points = array_utils.ptr_to_np(mesh_fn.getRawPoints(), num_verts * 3)
 
-        return True
-        """
+        poly_counts = om.MIntArray()
+        poly_verts = om.MIntArray()
+        mesh_fn.getVertices(poly_counts, poly_verts)
+        topology = hashlib.md5(array_utils.int_array_to_np(poly_counts).tobytes())
+        topology.update(array_utils.int_array_to_np(poly_verts).tobytes())
+
+        matrix = array_utils.matrix_to_np(mesh.inclusiveMatrix())
+        return (num_verts,
+                poly_counts.length(),
+                topology.hexdigest(),
+                hashlib.md5(points.tobytes()).hexdigest(),
+                matrix.tobytes())
+
+    def add_callbacks(self):
+        """ add callbacks to flag the cache dirty when the mesh changes """
+
+        self.remove_callbacks()
+        path = om.MDagPath(self.mesh)
+        if path.node().hasFn(om.MFn.kTransform):
+            path.extendToShape()
+        self.callbacks.append(om.MNodeMessage.addNodeDirtyCallback(path.node(), self.set_dirty))
+        self.callbacks.append(om.MDagMessage.addWorldMatrixModifiedCallback(path, self.set_dirty))
+
+    def remove_callbacks(self):
+        """ remove the mesh callbacks. without callbacks the cache can't
+        know if the mesh changed and compares the fingerprint every time """
+
+        for i in xrange(self.callbacks.length()):
+            om.MMessage.removeCallback(self.callbacks[i])
+        self.callbacks.clear()
+        self.dirty = True
+
+    def set_dirty(self, *args):
+        self.dirty = True
 
 
 
@@ -233,13 +299,13 @@ class GeoCache(object):
         """ cache getter
         :return:    tuple of entire geo cache:
         id  content           data type
-        0 - p0              - MPointArray
-        1 - p2              - MPointArray
-        2 - p1              - MPointArray
-        3 - face normal     - MVectorArray
-        4 - polygon id      - MIntArray
-        5 - vector AB       - MVectorArray
-        6 - vector AC       - MvectorArray
+        0 - p0              - np.array (n, 3) float64
+        1 - p2              - np.array (n, 3) float64
+        2 - p1              - np.array (n, 3) float64
+        3 - face normal     - np.array (n, 3) float64
+        4 - polygon id      - np.array (n) int32
+        5 - vector AB       - np.array (n, 3) float64
+        6 - vector AC       - np.array (n, 3) float64
         """
 
         return self.p0,\
@@ -250,44 +316,23 @@ class GeoCache(object):
                 self.AB,\
                 self.AC
 
-    @cache.setter
-    def cache(self, triangle):
-        """ cache setter
-        append one triangle to the end of the current cache
-        :param triangle:    argument must be of type tuple or list
-        it must consist of the following items in the exact same order:
-        id  content           data type
-        0 - p0              - MPointArray
-        1 - p2              - MPointArray
-        2 - p1              - MPointArray
-        3 - face normal     - MVectorArray
-        4 - polygon id      - MIntArray
-        5 - vector AB       - MVectorArray
-        6 - vector AC       - MvectorArray
-        note: no error or type checking is done!
-        """
-
-        self.p0.append(triangle[0])
-        self.p1.append(triangle[1])
-        self.p2.append(triangle[2])
-        self.normals.append(triangle[3])
-        self.poly_id.append(int(triangle[4]))
-        self.AB.append(triangle[5])
-        self.AC.append(triangle[6])
-
     def flush_cache(self):
 
         self.logger.debug('Flush GeoCache')
-        self.p0 = om.MPointArray()
-        self.p1 = om.MPointArray()
-        self.p2 = om.MPointArray()
-        self.normals = om.MVectorArray()
-        self.poly_id = om.MIntArray()
-        self.AB = om.MVectorArray()
-        self.AC = om.MVectorArray()
+        self.p0 = np.empty((0, 3), np.float64)
+        self.p1 = np.empty((0, 3), np.float64)
+        self.p2 = np.empty((0, 3), np.float64)
+        self.normals = np.empty((0, 3), np.float64)
+        self.poly_id = np.empty(0, np.int32)
+        self.AB = np.empty((0, 3), np.float64)
+        self.AC = np.empty((0, 3), np.float64)
+        self.area = np.empty(0, np.float64)
+        self.cumulative_area = np.empty(0, np.float64)
+        self.bvh = None
+        self.fingerprint = None
+        self.remove_callbacks()
         self.cached = False
 
 
     def __len__(self):
-        return p0.length()
-
+        return len(self.p0)
@@ -0,0 +1,132 @@
+"""
+module provides reading and writing of instance cache files. a cache file
+stores the instance data columns of a single spore node next to the maya
+scene so the points don't have to be saved in the scene itself.
+
+the file starts with a fixed size header followed by a table with one
+entry per column. each column is stored as a fixed width little endian
+array that starts at an aligned offset so it can be memory mapped.
+"""
+
+import os
+import struct
+import hashlib
+
+import numpy as np
+
+
+MAGIC = 'SPORECCH'
+VERSION = 1
+
+# magic, version, number of columns, number of points, md5 hex digest
+HEADER = struct.Struct('<8sIIQ32s')
+# column name, numpy dtype string, values per point, byte offset
+COLUMN = struct.Struct('<16s4sIQ')
+ALIGNMENT = 64
+
+
+def write_cache(path, columns):
+    """ write the given columns to the given path. the file is written to
+    a temporary file first and moved in place once it is complete.
+    :param path str: the cache file path
+    :param columns list: tuples of column name and np.array. all arrays
+                         must have the same length
+    :return str: the checksum of the written data """
+
+    columns = [(name, np.ascontiguousarray(array, array.dtype.newbyteorder('<')))
+               for name, array in columns]
+    length = len(columns[0][1]) if columns else 0
+    if any(len(array) != length for name, array in columns):
+        raise ValueError('Could not write cache: Array length does not match')
+
+    # the column table determines the offset of each column
+    table = []
+    offset = HEADER.size + COLUMN.size * len(columns)
+    for name, array in columns:
+        offset = get_aligned(offset)
+        width = array.shape[1] if array.ndim > 1 else 1
+        table.append((name, array.dtype.str, width, offset))
+        offset += array.nbytes
+
+    directory = os.path.dirname(path)
+    if directory and not os.path.isdir(directory):
+        os.makedirs(directory)
+
+    temp_path = path + '.tmp'
+    md5 = hashlib.md5()
+    with open(temp_path, 'wb') as cache_file:
+        cache_file.write(HEADER.pack(MAGIC, VERSION, len(columns), length, '0' * 32))
+        for name, dtype, width, offset in table:
+            cache_file.write(COLUMN.pack(name, dtype, width, offset))
+
+        for (name, array), (_, _, _, offset) in zip(columns, table):
+            cache_file.seek(offset)
+            cache_file.write(array.data)
+            md5.update(array.data)
+
+        checksum = md5.hexdigest()
+        cache_file.seek(0)
+        cache_file.write(HEADER.pack(MAGIC, VERSION, len(columns), length, checksum))
+
+    # windows can't rename onto an existing file
+    if os.name == 'nt' and os.path.exists(path):
+        os.remove(path)
+    os.rename(temp_path, path)
+
+    return checksum
+
+
+def read_cache(path, checksum=None):
+    """ memory map all columns of the given cache file. the maps are
+    copy on write so the returned arrays can be modified without changing
+    the file.
+    :param path str: the cache file path
+    :param checksum str: the expected checksum. the file is rejected if
+                         the checksum stored in its header differs
+    :return dict: column name, np.array """
+
+    header, table = read_header(path)
+    magic, version, num_columns, length, file_checksum = header
+    if checksum and checksum != file_checksum:
+        raise IOError('Cache file has been modified: {}'.format(path))
+
+    columns = {}
+    for name, dtype, width, offset in table:
+        shape = (length, width) if width > 1 else (length, )
+        if length:
+            columns[name] = np.memmap(path, dtype, 'c', offset, shape)
+        else:
+            columns[name] = np.empty(shape, dtype)
+    return columns
+
+
+def read_header(path):
+    """ read the header and the column table of the given cache file
+    :param path str: the cache file path
+    :return tuple: header values and a list of column table entries """
+
+    with open(path, 'rb') as cache_file:
+        header = HEADER.unpack(cache_file.read(HEADER.size))
+        magic, version, num_columns, length, checksum = header
+        if magic != MAGIC or version != VERSION:
+            raise IOError('Not a valid spore cache file: {}'.format(path))
+
+        table = []
+        for i in xrange(num_columns):
+            name, dtype, width, offset = COLUMN.unpack(cache_file.read(COLUMN.size))
+            table.append((name.rstrip('\0'), dtype.rstrip('\0'), width, offset))
+
+    return header, table
+
+
+def get_checksum(path):
+    """ get the checksum stored in the header of the given cache file """
+
+    header, table = read_header(path)
+    return header[-1]
+
+
+def get_aligned(offset):
+    """ round the given byte offset up to the next aligned offset """
+
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
@@ -1,25 +1,91 @@
 import sys
 import time
 
+from PySide2.QtCore import QTimer
+
 import maya.cmds as cmds
 import maya.OpenMaya as om
 
 import numpy as np
 
-try:
-    from scipy.spatial import cKDTree as kd_tree
-except ImportError:
-    from scipy.spatial import cKDTree as kd_tree
-
 import node_utils
 import window_utils
+import array_utils
+import spatial_index
 import logging_util
 
 
+# column name, instanceData attribute name and maya array type
+COLUMNS = (('position', 'position', 'vector'),
+           ('scale', 'scale', 'vector'),
+           ('rotation', 'rotation', 'vector'),
+           ('instance_id', 'objectIndex', 'int'),
+           ('visibility', 'visibility', 'int'),
+           ('normal', 'normal', 'vector'),
+           ('tangent', 'tangent', 'vector'),
+           ('u_coord', 'u_coord', 'double'),
+           ('v_coord', 'v_coord', 'double'),
+           ('poly_id', 'poly_id', 'int'),
+           ('color', 'color', 'vector'),
+           ('unique_id', 'unique_id', 'int'))
+
+
+def column(name):
+    """ create a property that returns a view on the used part of the
+    given column. the view can be modified in place but the changes will
+    only be visible in maya after calling set_dirty and set_state """
+
+    def get_column(self):
+        return self._data[name][:self._length]
+    return property(get_column)
+
+
+def to_np(array, array_type):
+    """ convert the given maya array, list or numpy array to a numpy array
+    of the given instance data array type
+    :param array: MVectorArray, MIntArray, MDoubleArray, list or np.array
+    :param array_type str: vector, int or double
+    :return np.array: array of shape (n, 3) for vectors or (n,) """
+
+    if isinstance(array, om.MVectorArray):
+        array = array_utils.vector_array_to_np(array)
+    elif isinstance(array, om.MIntArray):
+        array = array_utils.int_array_to_np(array)
+    elif isinstance(array, om.MDoubleArray):
+        array = array_utils.double_array_to_np(array)
+    elif array_type == 'vector' and not isinstance(array, np.ndarray):
+        array = [(vector[0], vector[1], vector[2]) for vector in array]
+
+    if array_type == 'vector':
+        return np.asarray(array, np.float64).reshape(-1, 3)
+    elif array_type == 'int':
+        return np.asarray(array, np.int32).ravel()
+    else:
+        return np.asarray(array, np.float64).ravel()
+
 
 class InstanceData(object):
     """ the spore node's internal instance data object keeps track of
-    scattered points and allows to set, add, modify or query points """
+    scattered points and allows to set, add, modify or query points.
+    all points are stored in numpy arrays that grow by doubling their
+    capacity. the maya arrays of the instanceData attribute are only
+    written when set_state is called """
+
+    position = column('position')
+    scale = column('scale')
+    rotation = column('rotation')
+    instance_id = column('instance_id')
+    visibility = column('visibility')
+    normal = column('normal')
+    tangent = column('tangent')
+    u_coord = column('u_coord')
+    v_coord = column('v_coord')
+    poly_id = column('poly_id')
+    color = column('color')
+    unique_id = column('unique_id')
+
+    # the position used to be copied to a separate array for the kd tree
+    np_position = position
 
     def __init__(self, node):
 
@@ -35,63 +101,106 @@ class InstanceData(object):
         self.data_plug = om.MPlug()
         self.data_object = om.MObject()
 
-        # instance data attributes
-        self.position = om.MVectorArray()
-        self.scale = om.MVectorArray()
-        self.rotation = om.MVectorArray()
-        self.instance_id = om.MIntArray()
-        self.visibility = om.MIntArray()
-        self.normal = om.MVectorArray()
-        self.tangent = om.MVectorArray()
-        self.u_coord = om.MDoubleArray()
-        self.v_coord = om.MDoubleArray()
-        self.poly_id = om.MIntArray()
-        self.color = om.MVectorArray()
-        self.unique_id = om.MIntArray()
+        # instance data columns and the number of used rows
+        self._data = {}
+        for name, attr, array_type in COLUMNS:
+            shape = (0, 3) if array_type == 'vector' else (0,)
+            dtype = np.int32 if array_type == 'int' else np.float64
+            self._data[name] = np.empty(shape, dtype)
+        self._length = 0
+
+        # columns that changed since the last set_state
+        self._dirty = set()
+
+        # modification counter per column. bumped whenever a column is
+        # marked dirty so consumers can tell if a column changed since
+        # they last looked at it, see get_generation
+        self._generation = dict((name, 0) for name in self._data)
+
+        # stroke mode, set_state calls are coalesced into a single update
+        # per refresh interval, see begin_stroke
+        self._in_stroke = False
+        self._refresh_interval = 0.0
+        self._last_refresh = 0.0
+        self._pending = False
+        self._flush_scheduled = False
 
         self.exclusive_paint = []
 
-        # collect points for kd tree
-        self.np_position = np.empty((0,3), float)
-        self.tree = None
+        # spatial index for radius queries, built on the first query
+        self.index = None
 
         self.logger.info('Instanciate new InstanceData object for: {}'.format(self.node_name))
 
-    def initialize_data(self):
-        """ get cache data from the sporeNode's instanceData plug/
-        :param instance_data_plug MPlug: instanceData plug """
+    def initialize_data(self, data_object=None):
+        """ get cache data from the sporeNode's instanceData plug.
+        each column is copied with a single call.
+        :param data_object MObject: the instanceData attribute's data,
+                                    read from the plug if not given """
 
         node_fn = om.MFnDependencyNode(self.node)
         self.data_plug = node_fn.findPlug('instanceData')
-        self.data_object = self.data_plug.asMObject()
+        if data_object is None:
+            data_object = self.data_plug.asMObject()
+        self.data_object = data_object
         array_attr_fn = om.MFnArrayAttrsData(self.data_object)
 
-        self.position = array_attr_fn.vectorArray('position')
-        self.scale = array_attr_fn.vectorArray('scale')
-        self.rotation = array_attr_fn.vectorArray('rotation')
-        self.instance_id = array_attr_fn.intArray('objectIndex')
-        self.visibility = array_attr_fn.intArray('visibility')
-        self.normal = array_attr_fn.vectorArray('normal')
-        self.tangent = array_attr_fn.vectorArray('tangent')
-        self.u_coord = array_attr_fn.doubleArray('u_coord')
-        self.v_coord = array_attr_fn.doubleArray('v_coord')
-        self.poly_id = array_attr_fn.intArray('poly_id')
-        self.color = array_attr_fn.vectorArray('color')
-        self.unique_id = array_attr_fn.intArray('unique_id')
+        columns = {}
+        for name, attr, array_type in COLUMNS:
+            if array_type == 'vector':
+                array = array_attr_fn.vectorArray(attr)
+            elif array_type == 'int':
+                array = array_attr_fn.intArray(attr)
+            else:
+                array = array_attr_fn.doubleArray(attr)
+            columns[name] = array
+        self._dirty.clear()
+        self.load_columns(columns)
 
         # TODO - set bb
 
-        # get position as numpy array
-        for i in xrange(self.position.length()):
-            position = [[self.position[i].x, self.position[i].y, self.position[i].z]]
-            self.np_position = np.append(self.np_position, position, axis=0)
-
         self.logger.debug('Initialize InstanceData object for: {}'.format(self.node_name))
 
-    def set_state(self):
+    def load_columns(self, columns):
+        """ replace all points with the given columns.
+        missing or short columns are repaired. only repaired columns are
+        marked dirty, call set_dirty to write all columns on set_state.
+        :param columns dict: column name, maya array or np.array """
+
+        for name, attr, array_type in COLUMNS:
+            self._data[name] = to_np(columns.get(name, []), array_type)
+        self._length = len(self._data['position'])
+        self.index = None
+        self.repair()
+
+    def detach_columns(self):
+        """ copy all columns that are views on a buffer the object doesn't
+        own, e.g. the memory mapped columns of a cache file passed to
+        load_columns. this releases the buffer so the file can be replaced """
+
+        for name, data in self._data.iteritems():
+            if data.base is not None:
+                self._data[name] = data.copy()
+
+    def set_state(self, force=False):
         """ set the currently cached point data as node instanceData attribute
-        and refresh the view to make changes visible """
+        and refresh the view to make changes visible.
+        during a stroke the update is deferred until the refresh interval
+        has passed and maya processes its events again
+        :param force bool: update immediately even during a stroke """
+
+        if self._in_stroke and not force:
+            self._pending = True
+            if not self._flush_scheduled:
+                self._flush_scheduled = True
+                delay = self._refresh_interval - (time.time() - self._last_refresh)
+                QTimer.singleShot(max(int(delay * 1000), 0), self.flush_state)
+            return
+
+        self._pending = False
+        self._last_refresh = time.time()
 
+        self.write_arrays()
         self.data_plug.setMObject(self.data_object)
         view = window_utils.active_view()
         view.refresh(True, False)
@@ -100,17 +209,84 @@ class InstanceData(object):
         num_spores_plug = node_fn.findPlug('numSpores')
         num_spores_plug.setInt(len(self))
 
+    def begin_stroke(self, max_refresh_rate=None):
+        """ start coalescing set_state calls. all calls until maya processes
+        its events again are merged into a single update and updates are at
+        least 1 / max_refresh_rate seconds apart
+        :param max_refresh_rate int: max updates per second, None for no limit """
+
+        self._in_stroke = True
+        self._refresh_interval = 1.0 / max_refresh_rate if max_refresh_rate else 0.0
+        self._last_refresh = 0.0
+
+    def end_stroke(self):
+        """ stop coalescing and apply pending changes """
+
+        self._in_stroke = False
+        if self._pending:
+            self.set_state()
+
+    def flush_state(self):
+        """ apply pending changes of the current stroke.
+        called by a timer scheduled in set_state """
+
+        self._flush_scheduled = False
+        if self._in_stroke and self._pending:
+            self.set_state(True)
+
+    def write_arrays(self):
+        """ copy all columns that changed since the last call to the maya
+        arrays of the instanceData attribute """
+
+        if not self._dirty:
+            return
+
+        array_attr_fn = om.MFnArrayAttrsData(self.data_object)
+        for name, attr, array_type in COLUMNS:
+            if name not in self._dirty:
+                continue
+
+            if array_type == 'vector':
+                array = array_utils.np_to_vector_array(getattr(self, name))
+                array_attr_fn.vectorArray(attr).copy(array)
+            elif array_type == 'int':
+                array = array_utils.np_to_int_array(getattr(self, name))
+                array_attr_fn.intArray(attr).copy(array)
+            else:
+                array = array_utils.np_to_double_array(getattr(self, name))
+                array_attr_fn.doubleArray(attr).copy(array)
+
+        self._dirty.clear()
+
+    def set_dirty(self, *names):
+        """ mark the given columns as modified. this is only necessary
+        when a column has been modified in place. if no name is given
+        all columns are marked """
+
+        names = names or self._data.keys()
+        self._dirty.update(names)
+        for name in names:
+            self._generation[name] += 1
+
+    def get_generation(self, name):
+        """ get the modification counter of the given column. the counter
+        changes whenever the column is marked dirty
+        :param name str: the column name
+        :return int: """
+
+        return self._generation[name]
 
     def get_data_object(self):
         """ return the mObject containing instanceData attribute
         :return mObject: """
 
+        self.write_arrays()
         return self.data_object
 
 
     def append_points(self, position, scale, rotation, instance_id, visibility, normal, tangent, u_coord, v_coord, poly_id, color):
         """ append the given array to the instance data object
-        :param position:
+        :param position MVectorArray or np.array:
         :param scale:
         :param rotation:
         :param instance_id:
@@ -121,28 +297,25 @@ class InstanceData(object):
         :param v_coord:
         :param poly_id:
         :param color:
-        :return: """
-
-        appended_ids = om.MIntArray()
-        for i in xrange(position.length()):
-            self.position.append(position[i])
-            self.scale.append(scale[i])
-            self.rotation.append(rotation[i])
-            self.instance_id.append(instance_id[i])
-            self.visibility.append(visibility[i])
-            self.normal.append(normal[i])
-            self.tangent.append(tangent[i])
-            self.u_coord.append(u_coord[i])
-            self.v_coord.append(v_coord[i])
-            self.poly_id.append(poly_id[i])
-            self.color.append(color[i])
-
-            # append position to numpy array
-            np_position = [[position[i].x, position[i].y, position[i].z]]
-            self.np_position = np.append(self.np_position, np_position, axis=0)
-
-            self.unique_id.append(self.position.length() - 1)
-            appended_ids.append(self.position.length() - 1)
+        :return np.array: the ids of the appended points """
+
+        values = self._get_values(position=position, scale=scale,
+                                  rotation=rotation, instance_id=instance_id,
+                                  visibility=visibility, normal=normal,
+                                  tangent=tangent, u_coord=u_coord,
+                                  v_coord=v_coord, poly_id=poly_id,
+                                  color=color)
+        num_points = len(values['position'])
+        if any(len(value) != num_points for value in values.itervalues()):
+            self.logger.error('Could not append points: Array length does not match')
+            return
+
+        start = len(self)
+        self.set_length(start + num_points)
+        appended_ids = np.arange(start, len(self))
+        for name, value in values.iteritems():
+            self._data[name][start:len(self)] = value
+        self._data['unique_id'][start:len(self)] = appended_ids
 
         return appended_ids
 
@@ -156,7 +329,7 @@ class InstanceData(object):
         the operation will fail. if length of the given arrays is not the same
         the operation will fail.
         :param index list: list in indexes to set
-        :param position MVectorArray: array of position data
+        :param position MVectorArray or np.array: array of position data
         :param scalae MVectorArray:
         :param rotation MVectorArray:
         :param instance_id MIntArray
@@ -168,113 +341,100 @@ class InstanceData(object):
         :param poly_id MIntArray
         :param color MVectorArray """
 
+        if isinstance(index, om.MIntArray):
+            index = array_utils.int_array_to_np(index)
+        index = np.asarray(index, np.int64).ravel()
+
         # check input
-        try:
-            if position:
-                assert len(index) == position.length()
-            if scale:
-                assert len(index) == scale.length()
-            if rotation:
-                assert len(index) == rotation.length()
-            if instance_id:
-                assert len(index) == instance_id.length()
-            if visibility:
-                assert len(index) == visibility.length()
-            if normal:
-                assert len(index) == normal.length()
-            if tangent:
-                assert len(index) == tangent.length()
-            if u_coord:
-                assert len(index) == u_coord.length()
-            if v_coord:
-                assert len(index) == v_coord.length()
-            if poly_id:
-                assert len(index) == poly_id.length()
-            if color:
-                assert len(index) == color.length()
-        except AssertionError:
+        values = self._get_values(position=position, scale=scale,
+                                  rotation=rotation, instance_id=instance_id,
+                                  visibility=visibility, normal=normal,
+                                  tangent=tangent, u_coord=u_coord,
+                                  v_coord=v_coord, poly_id=poly_id,
+                                  color=color)
+        if any(len(value) != len(index) for value in values.itervalues()):
             self.logger.error('Could not set points: Array length does not match'.format(self.node_name))
             return
 
-        if index:
-            if sorted(index)[-1] >= len(self):
+        if len(index):
+            if index.max() >= len(self) or index.min() < 0:
                 self.logger.error('Could not set points: Operation would generate null pointer')
                 return
 
         # set points
-        for i in xrange(len(index)):
-            if position:
-                self.position.set(position[i], index[i])
-                self.np_position.itemset((index[i], 0), position[i].x)
-                self.np_position.itemset((index[i], 1), position[i].y)
-                self.np_position.itemset((index[i], 2), position[i].z)
-            if scale:
-                self.scale.set(scale[i], index[i])
-            if rotation:
-                self.rotation.set(rotation[i], index[i])
-            if instance_id:
-                self.instance_id.set(instance_id[i], index[i])
-            if visibility:
-                self.visibility.set(visibility[i], index[i])
-            if normal:
-                self.normal.set(normal[i], index[i])
-            if tangent:
-                self.tangent.set(tangent[i], index[i])
-            if u_coord:
-                self.u_coord.set(u_coord[i], index[i])
-            if v_coord:
-                self.v_coord.set(v_coord[i], index[i])
-            if poly_id:
-                self.poly_id.set(poly_id[i], index[i])
-            if color:
-                self.color.set(color[i], index[i])
-
-            self.unique_id.set(index[i], index[i])
+        for name, value in values.iteritems():
+            getattr(self, name)[index] = value
+        self.set_dirty(*values.keys())
+
+        # unique ids are only written if they are out of sync
+        if np.any(self.unique_id[index] != index):
+            self.unique_id[index] = index
+            self.set_dirty('unique_id')
+
+        if self.index is not None and 'position' in values:
+            self.index.move(index)
+        return True
+
+    def get_points(self, index):
+        """ get a copy of all columns for the given indexes. the result
+        can be passed on to set_points or append_points as keyword arguments
+        :param index np.array: indexes of the points
+        :return dict: column name, np.array """
+
+        index = np.asarray(index, np.int64)
+        return dict((name, getattr(self, name)[index])
+                    for name, attr, array_type in COLUMNS
+                    if name != 'unique_id')
+
+    def _get_values(self, **kwargs):
+        """ convert all given arrays that are not None to numpy arrays
+        :return dict: column name, np.array """
+
+        values = {}
+        for name, attr, array_type in COLUMNS:
+            if kwargs.get(name) is not None:
+                values[name] = to_np(kwargs[name], array_type)
+        return values
 
     def set_length(self, length):
         """ set the instance data arrays to the given length
         do nothing when the given length is shorter than the current
-        arrays since this would destroy instance data """
+        arrays since this would destroy instance data.
+        the capacity is doubled if needed so appending is amortized O(1) """
 
         if len(self) > length:
             self.logger.warn('Set length would destroy instance Data. Skipped...')
             return
+        elif len(self) == length:
+            return
 
-        self.position.setLength(length)
-        self.rotation.setLength(length)
-        self.scale.setLength(length)
-        self.instance_id.setLength(length)
-        self.visibility.setLength(length)
-        self.normal.setLength(length)
-        self.tangent.setLength(length)
-        self.u_coord.setLength(length)
-        self.v_coord.setLength(length)
-        self.poly_id.setLength(length)
-        self.color.setLength(length)
-        self.unique_id.setLength(length)
-        self.np_position.resize(length, 3, refcheck=False)
+        capacity = len(self._data['position'])
+        if length > capacity:
+            capacity = max(length, capacity * 2)
+            for name, data in self._data.iteritems():
+                new_data = np.empty((capacity, ) + data.shape[1:], data.dtype)
+                new_data[:len(self)] = data[:len(self)]
+                self._data[name] = new_data
+
+        for data in self._data.itervalues():
+            data[len(self):length] = 0
+        if self.index is not None:
+            self.index.insert(np.arange(len(self), length))
+        self._length = length
+        self.set_dirty()
 
     def set_point(self, index, position, scale, rotation, instance_id,
                   visibility, normal, tangent, u_coord, v_coord, poly_id, color):
         """ set the given index of the array to the given data """
 
-        if index >= self.position.length():
+        if index >= len(self):
             self.logger.error('Can\'t set point data: Index out of range')
             return
 
-        self.position.set(position, index)
-        self.rotation.set(rotation, index)
-        self.scale.set(scale, index)
-        self.instance_id.set(instance_id, index)
-        self.visibility.set(visibility, index)
-        self.normal.set(normal, index)
-        self.tangent.set(tangent, index)
-        self.u_coord.set(u_coord, index)
-        self.v_coord.set(v_coord, index)
-        self.poly_id.set(poly_id, index)
-        self.color.set(color, index)
-        self.unique_id.set(index, index)
-        self.np_position[index] = [position.x, position.y, position.z]
+        return self.set_points([index], [position], [scale], [rotation],
+                               [instance_id], [visibility], [normal],
+                               [tangent], [u_coord], [v_coord], [poly_id],
+                               [color])
 
     def insert_point(self, index, position, scale, rotation, instance_id,
                      visibility, normal, tangent, u_coord, v_coord, poly_id,
@@ -284,184 +444,177 @@ class InstanceData(object):
             self.logger.error('Failed to insert point: index out of range')
             return
 
-        self.position.insert(position, index)
-        self.scale.insert(scale, index)
-        self.rotation.insert(rotation, index)
-        self.instance_id.insert(instance_id, index)
-        self.visibility.insert(visibility, index)
-        self.normal.insert(normal, index)
-        self.tangent.insert(tangent, index)
-        self.u_coord.insert(u_coord, index)
-        self.v_coord.insert(v_coord, index)
-        self.poly_id.insert(poly_id, index)
-        self.color.insert(color, index)
-        self.unique_id.insert(index, index)
-        self.np_position = np.insert(self.np_position, index, [position.x,
-                                                               position.y,
-                                                               position.z],
-                                    axis=0)
+        return self.insert_points([index], [position], [scale], [rotation],
+                                  [instance_id], [visibility], [normal],
+                                  [tangent], [u_coord], [v_coord], [poly_id],
+                                  [color])
+
+    def insert_points(self, index, position, scale, rotation, instance_id,
+                      visibility, normal, tangent, u_coord, v_coord, poly_id,
+                      color):
+        """ insert the given points so they end up at the given indexes.
+        existing and new rows are merged in a single pass per column and
+        the unique ids are updated afterwards.
+        :param index np.array: sorted indexes of the new points in the
+                               resulting arrays
+        :return bool: True on success, None on failure """
+
+        index = np.asarray(index, np.int64).ravel()
+        values = self._get_values(position=position, scale=scale,
+                                  rotation=rotation, instance_id=instance_id,
+                                  visibility=visibility, normal=normal,
+                                  tangent=tangent, u_coord=u_coord,
+                                  v_coord=v_coord, poly_id=poly_id,
+                                  color=color)
+
+        if any(len(value) != len(index) for value in values.itervalues()):
+            self.logger.error('Failed to insert points: length of arrays not matching')
+            return
+
+        old_length = len(self)
+        length = old_length + len(index)
+        if len(index) and (index[0] < 0 or index[-1] >= length or np.any(np.diff(index) <= 0)):
+            self.logger.error('Failed to insert points: index out of range or not sorted')
+            return
+
+        inserted = np.zeros(length, dtype=bool)
+        inserted[index] = True
+
+        # all following ids change
+        self.index = None
+        self.set_length(length)
+        for name, data in self._data.iteritems():
+            column = data[:length]
+            column[~inserted] = column[:old_length].copy()
+            if name in values:
+                column[inserted] = values[name]
+
+        self.update_unique_id()
+        return True
 
     def update_unique_id(self):
         """ make sure each point has a unique id.
         this method should be called after inserting or deleting points """
 
-        for i in xrange(len(self) - 1):
-            self.unique_id[i] = i
+        self.unique_id[:] = np.arange(len(self))
+        self.set_dirty('unique_id')
 
     def length(self):
-        # TODO - do some checking if all the array are the same length?
         # TODO - this should be deprecated since we can use len()
         return len(self)
 
-    def build_kd_tree(self, refresh_position=False):
-        """ build the kd tree """
+    def build_index(self, cell_size=None):
+        """ build the spatial index used to query neighbouring points.
+        points that are added or moved afterwards are tracked by the index
+        so it only needs to be rebuilt after points have been removed.
+        :param cell_size float: grid cell size, should be about the size
+                                of the query radius. if not given the
+                                previous cell size or an estimate from
+                                the point density is used """
 
         t1 = time.time()
 
-        if refresh_position:
-            self.np_position = np.empty((0, 3), float)
-            for i in xrange(self.position.length()):
-                position = [[self.position[i].x, self.position[i].y, self.position[i].z]]
-                self.np_position = np.append(self.np_position, position, axis=0)
+        if cell_size is None and self.index is not None:
+            cell_size = self.index.cell_size
+        elif cell_size is None and len(self):
+            extent = np.ptp(self.position, axis=0).max()
+            cell_size = extent / np.sqrt(len(self))
+        if not cell_size:
+            cell_size = 1.0
 
-        self.tree = kd_tree(self.np_position)
+        self.index = spatial_index.HashGrid(self.position, cell_size)
 
         t_result = round(time.time() - t1, 5)
-        #  self.logger.debug('Built KDTree ({}) for {} points in: {}s'.format(self.node_name, len(self), t_result))
+        #  self.logger.debug('Built spatial index ({}) for {} points in: {}s'.format(self.node_name, len(self), t_result))
 
     def get_scale_average(self, index):
         """ get the average scale value for the given list of indexes
         @param index list: list of indexes
         @return x, y, z scale mean """
 
-        scale_values = np.empty((0,3), float)
-        for i in index:
-            scale_values = np.append(scale_values, [[self.scale[i].x,
-                                                     self.scale[i].y,
-                                                     self.scale[i].z]],
-                                     axis=0)
-
-        scale_mean = np.mean(scale_values, axis=0)
-        return scale_mean
+        return np.mean(self.scale[index], axis=0)
 
     def get_rotation_average(self, index):
         """ get the average scale value for the given list of indexes
         @param index list: list of indexes
         @return x, y, z scale mean """
 
-        rotation_value = np.empty((0,3), float)
-        for i in index:
-            rotation_value = np.append(rotation_value, [[self.rotation[i].x,
-                                                         self.rotation[i].y,
-                                                         self.rotation[i].z]],
-                                     axis=0)
+        return np.mean(self.rotation[index], axis=0)
 
-        rotation_value = np.mean(rotation_value, axis=0)
-        return rotation_value
-
-    def get_closest_points(self, position, radius, exclude=[]):
-        """ get a list of all indexes within the given radius from the
-        given position
+    def get_closest_points(self, position, radius, exclude=None, return_distance=False):
+        """ get all indexes within the given radius from the given position
         :param position: MPoint, List, tupe or np.array
         :param radius
         :param exclude: list of instance ids to exclude from nearest
-                        neighbour search """
+                        neighbour search. note: only points with one of
+                        the given instance ids are returned
+        :param return_distance bool: also return the distance of each point
+        :return np.array: indexes and optionally distances of the points """
 
         if isinstance(position, om.MPoint):
             position = (position.x, position.y, position.z)
-        neighbours = self.tree.query_ball_point(position, radius, eps=radius/10)
-
-        if exclude:
-            instance_ids = np.array([])
-            for index in neighbours:
-                instance_ids = np.append(instance_ids, self.instance_id[index])
 
-            valid_index = np.array([])
-            for index in exclude:
-                valid_index = np.append(valid_index, np.where(instance_ids==index))
+        # keep the cell size close to the radius to limit the visited cells
+        if self.index is None\
+        or not self.index.cell_size / 4 <= radius <= self.index.cell_size * 4:
+            self.build_index(radius)
+        neighbours, distance = self.index.query(self.position, position, radius, True)
 
-            neighbours = [neighbours[int(i)] for i in valid_index]
-            return neighbours
+        if exclude is not None and len(exclude):
+            valid = np.isin(self.instance_id[neighbours], exclude)
+            neighbours = neighbours[valid]
+            distance = distance[valid]
 
-        else:
-            return list(neighbours)
+        if return_distance:
+            return neighbours, distance
+        return neighbours
 
     def is_valid(self):
-        """ check if the internal data is in sync. otherwise try to
-        repair some of the arrays if possible. """
+        """ check if the internal data is in sync. all columns share the
+        same length so only the capacity of each column is checked """
 
         try:
-            assert len(self) == self.rotation.length()
-            assert len(self) == self.scale.length()
-            assert len(self) == self.instance_id.length()
-            assert len(self) == self.normal.length()
-            assert len(self) == self.tangent.length()
-            assert len(self) == len(self.np_position)
+            for name, data in self._data.iteritems():
+                assert len(data) >= len(self)
         except AssertionError:
             self.logger.error('InstanceData validation failed!')
             return False
 
-        try:
-            assert len(self) == self.visibility.length()
-        except AssertionError:
-            self.logger.warn(
-                'InstanceData validation faild. Trying to repair visibility...'
-            )
-            self.visibility.setLength(len(self))
-            [self.visibility.set(1, i) for i in range(len(self))]
-        try:
-            assert len(self) == self.u_coord.length()
-        except AssertionError:
-            self.logger.warn(
-                'InstanceData validation faild. Trying to repair u coords...'
-            )
-            self.u_coord.setLength(len(self))
-            [self.u_coord.set(0, i) for i in range(len(self))]
-        try:
-            assert len(self) == self.v_coord.length()
-        except AssertionError:
-            self.logger.warn(
-                'InstanceData validation faild. Trying to repair v coords...'
-            )
-            self.v_coord.setLength(len(self))
-            [self.v_coord.set(0, i) for i in range(len(self))]
-        try:
-            assert len(self) == self.poly_id.length()
-        except AssertionError:
-            self.logger.warn(
-                'InstanceData validation faild. Trying to repair poly id...'
-            )
-            self.poly_id.setLength(len(self))
-            [self.poly_id.set(0, i) for i in range(len(self))]
-        try:
-            assert len(self) == self.color.length()
-        except AssertionError:
-            self.logger.warn(
-                'InstanceData validation faild. Trying to repair color...'
-            )
-            self.color.setLength(len(self))
-            [self.color.set(1, i) for i in range(len(self))]
-        try:
-            assert len(self) == self.unique_id.length()
-        except AssertionError:
+        return True
+
+    def repair(self):
+        """ make sure all columns have the same length as the position
+        column. missing points are visible and get a unique id """
+
+        for name, data in self._data.iteritems():
+            num_points = min(len(data), len(self))
+            if len(data) == len(self):
+                continue
+
             self.logger.warn(
-                'InstanceData validation faild. Trying to repair point id...'
+                'InstanceData validation faild. Trying to repair {}...'.format(name)
             )
-            self.unique_id.setLength(len(self))
-            [self.unique_id.set(i, i) for i in range(len(self))]
-
-        return True
+            self._data[name] = np.zeros((len(self), ) + data.shape[1:], data.dtype)
+            self._data[name][:num_points] = data[:num_points]
+            if name == 'visibility':
+                self._data[name][num_points:] = 1
+            elif name == 'unique_id':
+                self._data[name][num_points:] = np.arange(num_points, len(self))
+            self.set_dirty(name)
 
     def clear(self):
         """ remove all points from the object """
 
-        [self.visibility.set(0, i) for i in xrange(self.visibility.length())]
+        self.visibility[:] = 0
         self.clean_up()
         self.set_state()
 
     def clean_up(self):
         """ remove all points that a invisible after the delete brush
-        has initially hidden them and is tearn down when the has been context left """
+        has initially hidden them and is tearn down when the has been context left.
+        invisible points act as tombstones: all columns are compacted in
+        place with a single keep mask and the spatial index is invalidated once.
+        :return bool: True if any point has been removed """
 
         self.logger.debug('Cleaning up InstanceData...')
 
@@ -469,32 +622,27 @@ class InstanceData(object):
             self.logger.error('Cleanup operation failed, Instance Data is out of sync.')
             return
 
-        invalid_ids = sorted([i for i in xrange(self.visibility.length()) if self.visibility[i] == 0],
-                             reverse=True)
-
-        if invalid_ids:
-            for index in invalid_ids:
-                self.position.remove(index)
-                self.scale.remove(index)
-                self.rotation.remove(index)
-                self.instance_id.remove(index)
-                self.visibility.remove(index)
-                self.normal.remove(index)
-                self.tangent.remove(index)
-                self.u_coord.remove(index)
-                self.v_coord.remove(index)
-                self.poly_id.remove(index)
-                self.color.remove(index)
-                self.unique_id.remove(index)
-                self.np_position = np.delete(self.np_position, index, 0)
-            self.update_unique_id()
+        keep = self.visibility != 0
+        if keep.all():
+            return False
+
+        num_points = np.count_nonzero(keep)
+        for name in self._data:
+            data = getattr(self, name)
+            data[:num_points] = data[keep]
+        self._length = num_points
+        self.update_unique_id()
+        self.set_dirty()
 
+        # the index is rebuilt on the next query
+        self.index = None
+        return True
 
     def __len__(self):
-        return self.position.length()
+        return self._length
 
     def __iter__(self):
-        for i in xrange(self.position.length()):
+        for i in xrange(len(self)):
             point = {'position': self.position[i],
                      'scale': self.scale[i],
                      'rotation': self.rotation[i],
@@ -521,12 +669,10 @@ class InstanceData(object):
             if not len(other):
                 return
 
-            ids = range(len(self), len(self) + len(other))
-            self.set_length(len(self) + len(other))
-            self.set_points(ids, other.position, other.rotation, other.scale,
-                            other.instance_id, other.visibility, other.normal,
-                            other.tangent, other.u_coord, other.v_coord,
-                            other.poly_id, other.color)
+            self.append_points(other.position, other.scale, other.rotation,
+                               other.instance_id, other.visibility,
+                               other.normal, other.tangent, other.u_coord,
+                               other.v_coord, other.poly_id, other.color)
             return self
 
         else:
@@ -539,4 +685,3 @@ class InstanceData(object):
     def __del__(self):
         #  print 'del ptc'
         pass
-
@@ -0,0 +1,145 @@
+"""
+module provides a dynamic spatial index for radius queries on points
+that are inserted, moved and removed while painting.
+the index only keeps point ids, positions are always passed in so the
+index works directly on the instance data columns.
+"""
+
+import numpy as np
+
+
+# number of bits per axis in the cell key. cells that are further apart
+# than 2 ** CELL_BITS wrap around and share a key which only adds some
+# candidates that are discarded by the distance test
+CELL_BITS = 21
+CELL_MASK = (1 << CELL_BITS) - 1
+
+
+class HashGrid(object):
+    """ uniform grid that supports radius queries, inserting, moving and
+    removing points without rebuilding the whole index.
+    the points are sorted by their cell key when the grid is built.
+    inserted or moved points are marked outdated and go into an overflow
+    buffer that is searched brute force. the buffer is merged by
+    rebuilding the grid once it exceeds max_overflow of the points """
+
+    def __init__(self, position, cell_size, max_overflow=0.05, min_overflow=1024):
+
+        self.cell_size = float(cell_size)
+        self.max_overflow = max_overflow
+        self.min_overflow = min_overflow
+        self.build(position)
+
+    def build(self, position):
+        """ sort all given points into the grid and clear the overflow
+        :param position np.array: array of shape (n, 3) """
+
+        num_points = len(position)
+        key = self.get_cell_key(self.get_cell(position))
+
+        # csr like grid: points of cell i are indices[offsets[i]:offsets[i + 1]]
+        self.indices = np.argsort(key, kind='mergesort')
+        key = key[self.indices]
+        start = np.flatnonzero(np.r_[True, key[1:] != key[:-1]])[:len(key)]
+        self.keys = key[start]
+        self.offsets = np.r_[start, num_points].astype(np.int64)
+
+        self.outdated = np.zeros(num_points, dtype=bool)
+        self.removed = np.zeros(num_points, dtype=bool)
+        self.overflow = np.empty(0, dtype=np.int64)
+        self.num_points = num_points
+
+    def insert(self, ids):
+        """ add new points to the index. the ids must directly follow the
+        ids already in the index.
+        :param ids np.array: ids of the new points """
+
+        ids = np.asarray(ids, np.int64).ravel()
+        if not len(ids):
+            return
+
+        length = max(self.num_points, ids.max() + 1)
+        if length > len(self.outdated):
+            capacity = max(length, len(self.outdated) * 2)
+            self.outdated = np.resize(self.outdated, capacity)
+            self.removed = np.resize(self.removed, capacity)
+        self.outdated[self.num_points:length] = True
+        self.removed[self.num_points:length] = False
+        self.num_points = length
+        self.overflow = np.r_[self.overflow, ids]
+
+    def move(self, ids):
+        """ mark the given points as moved. their new position will be
+        taken from the position array passed to the next query
+        :param ids np.array: ids of the moved points """
+
+        ids = np.unique(np.asarray(ids, np.int64))
+        ids = ids[~self.outdated[ids]]
+        self.outdated[ids] = True
+        self.overflow = np.r_[self.overflow, ids]
+
+    def remove(self, ids):
+        """ remove the given points from the index
+        :param ids np.array: ids of the removed points """
+
+        ids = np.asarray(ids, np.int64)
+        self.removed[ids] = True
+        self.outdated[ids] = True
+
+    def query(self, position, center, radius, return_distance=False):
+        """ get all points within the given radius around the center
+        :param position np.array: array of shape (n, 3) of all points
+        :param center np.array: query point
+        :param radius float: query radius
+        :param return_distance bool: return the distances as well
+        :return np.array: ids and optionally distances of the points """
+
+        overflow = self.overflow[~self.removed[self.overflow]]
+        if len(overflow) > max(self.min_overflow, self.max_overflow * self.num_points):
+            removed = np.flatnonzero(self.removed[:self.num_points])
+            self.build(position)
+            self.remove(removed)
+            overflow = self.overflow
+
+        center = np.asarray(center, np.float64).ravel()[:3]
+        low = self.get_cell(center - radius)
+        high = self.get_cell(center + radius)
+
+        # look up all cells overlapping the query sphere's bounding box
+        # or take all points if this would touch more cells than exist
+        if np.prod(high - low + 1) > len(self.keys):
+            candidates = self.indices
+        else:
+            axes = [np.arange(low[i], high[i] + 1) for i in xrange(3)]
+            cells = np.stack(np.meshgrid(*axes, indexing='ij'), -1).reshape(-1, 3)
+            keys = self.get_cell_key(cells)
+            slot = np.searchsorted(self.keys, keys)
+            found = slot < len(self.keys)
+            slot = slot[found]
+            slot = slot[self.keys[slot] == keys[found]]
+
+            # gather the point ranges of all found cells
+            start = self.offsets[slot]
+            count = self.offsets[slot + 1] - start
+            shift = np.repeat(start - np.r_[0, np.cumsum(count)[:-1]], count)
+            candidates = self.indices[shift + np.arange(count.sum())]
+
+        candidates = candidates[~self.outdated[candidates]]
+        candidates = np.r_[candidates, overflow]
+
+        distance = np.linalg.norm(position[candidates] - center, axis=1)
+        inside = distance <= radius
+        if return_distance:
+            return candidates[inside], distance[inside]
+        return candidates[inside]
+
+    def get_cell(self, position):
+        """ get the integer cell coordinates of the given positions """
+
+        return np.floor(np.asarray(position) / self.cell_size).astype(np.int64)
+
+    def get_cell_key(self, cell):
+        """ hash the given cell coordinates to a single integer """
+
+        cell = cell & CELL_MASK
+        return cell[..., 0] | (cell[..., 1] << CELL_BITS) | (cell[..., 2] << 2 * CELL_BITS)
@@ -0,0 +1,73 @@
+"""
+module provides a memory capped store for undo records. a record is a
+dict of numpy arrays (or dicts of numpy arrays) that is kept outside of
+maya's undo queue. when the store exceeds its memory limit the oldest
+records are dropped and can't be undone anymore.
+"""
+
+import itertools
+from collections import OrderedDict
+
+import numpy as np
+
+
+class UndoStore(object):
+    """ records keyed by an increasing id, ordered from old to new """
+
+    def __init__(self, max_bytes):
+
+        self.max_bytes = max_bytes
+        self.num_bytes = 0
+        self.records = OrderedDict()
+        self._ids = itertools.count(1)
+
+    def add(self, record):
+        """ add the given record and drop the oldest records if the store
+        exceeds its memory limit. the newest record is always kept.
+        :param record dict: the record to store
+        :return int: the id of the record """
+
+        key = next(self._ids)
+        self.records[key] = record
+        self.num_bytes += get_size(record)
+
+        while self.num_bytes > self.max_bytes and len(self.records) > 1:
+            old_key, old_record = self.records.popitem(last=False)
+            self.num_bytes -= get_size(old_record)
+
+        return key
+
+    def get(self, key):
+        """ get the record for the given id or None if it has been dropped """
+
+        return self.records.get(key)
+
+    def remove(self, key):
+        """ remove the record with the given id if it exists """
+
+        record = self.records.pop(key, None)
+        if record is not None:
+            self.num_bytes -= get_size(record)
+
+    def clear(self):
+
+        self.records.clear()
+        self.num_bytes = 0
+
+    def __len__(self):
+        return len(self.records)
+
+    def __contains__(self, key):
+        return key in self.records
+
+
+def get_size(record):
+    """ get the number of bytes of all numpy arrays in the given record """
+
+    size = 0
+    for value in record.itervalues():
+        if isinstance(value, dict):
+            size += get_size(value)
+        elif isinstance(value, np.ndarray):
+            size += value.nbytes
+    return size
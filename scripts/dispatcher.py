@@ -16,6 +16,7 @@ import maya.utils as utils
 import maya.OpenMaya as om
 
 import logging_util
+import mesh_utils
 import manager
 import settings
 import reporter
@@ -122,13 +123,15 @@ class GlobalSporeDispatcher(object):
         pm.deleteUI(self.menu)
 
     def add_callbacks(self):
-        """ add scene callbacks to reset the global tracking dir when a new
-        scene is opened """
+        """ add scene callbacks to reset the global tracking dir and the
+        cached mesh handles when a new scene is opened """
 
         self.logger.debug('Add global scene callbacks...')
         callbacks = om.MCallbackIdArray()
         callbacks.append(om.MSceneMessage.addCallback(om.MSceneMessage.kBeforeOpen, self.set_tracking_dir))
         callbacks.append(om.MSceneMessage.addCallback(om.MSceneMessage.kBeforeNew, self.set_tracking_dir))
+        callbacks.append(om.MSceneMessage.addCallback(om.MSceneMessage.kBeforeOpen, mesh_utils.clear_mesh_handles))
+        callbacks.append(om.MSceneMessage.addCallback(om.MSceneMessage.kBeforeNew, mesh_utils.clear_mesh_handles))
         return callbacks
 
     def remove_callbacks(self):
@@ -143,8 +146,15 @@ class GlobalSporeDispatcher(object):
         """ initialize the global spore tracking dir """
 
         self.logger.debug('Reset global tracking dir')
+        self.remove_geo_cache_callbacks()
         sys._global_spore_tracking_dir = {}
 
+    def remove_geo_cache_callbacks(self):
+        """ remove the mesh callbacks of all tracked spore nodes' geo caches """
+
+        for node in getattr(sys, '_global_spore_tracking_dir', {}).itervalues():
+            node.geo_cache.remove_callbacks()
+
     def set_pref(self, pref, value):
         """ set the given pref option to the given value.
         :param pref: must match the a valid option
@@ -160,8 +170,10 @@ class GlobalSporeDispatcher(object):
         return self.spore_globals.spore_globals[pref]
 
     def clean_up(self):
+        self.remove_geo_cache_callbacks()
         del sys._global_spore_tracking_dir
         self.remove_callbacks()
+        mesh_utils.clear_mesh_handles()
         self.remove_menu()
         self.logger.debug('Unload Spore, Good bye!')
 
@@ -21,6 +21,7 @@ class SporeGlobals(QObject):
                      'AUTOMATIC_REPORT': False, # Submit reports automatically
                      'REPORT': True, # Enable/Disabel reporting
                      'SENDER': ' ', # Store sender email address
+                     'MAX_REFRESH_RATE': 30, # Max viewport updates per second while painting
                      }
 
     def __init__(self):
@@ -73,6 +74,10 @@ class SporeGlobals(QObject):
                 msg = 'Could not load preference file from: {}\nMaybe badly formatted. Try to delete it...'.format(pref_file)
                 raise RuntimeError(msg)
 
+        # add prefs that are missing in files written by older versions
+        for key, value in self.default_prefs.iteritems():
+            spore_globals.setdefault(key, value)
+
         return spore_globals
 
     def fill_prefs_ui(self):
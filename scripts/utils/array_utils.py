@@ -0,0 +1,132 @@
+"""
+module provides bulk conversion between maya api arrays and numpy arrays.
+data is copied through a single buffer instead of touching each element
+from python which is what makes the per element api calls so slow.
+"""
+
+import ctypes
+
+import numpy as np
+
+import maya.OpenMaya as om
+
+
+def ptr_to_np(ptr, count, c_type=ctypes.c_float):
+    """ copy the memory the given swig pointer points to into a numpy array.
+    :param ptr: swig pointer as returned by the maya api
+    :param count int: number of elements the pointer points to
+    :param c_type: ctypes type of a single element
+    :return np.array: flat array holding a copy of the data """
+
+    if not count:
+        return np.empty(0, c_type)
+
+    buf = (c_type * count).from_address(long(ptr))
+    return np.ctypeslib.as_array(buf).copy()
+
+
+def int_array_to_np(int_array):
+    """ convert the given MIntArray to a numpy array
+    :param int_array MIntArray:
+    :return np.array: array of type int32 """
+
+    length = int_array.length()
+    if not length:
+        return np.empty(0, np.int32)
+
+    util = om.MScriptUtil()
+    util.createFromList([0] * length, length)
+    ptr = util.asIntPtr()
+    int_array.get(ptr)
+    return ptr_to_np(ptr, length, ctypes.c_int).astype(np.int32)
+
+
+def double_array_to_np(double_array):
+    """ convert the given MDoubleArray to a numpy array
+    :param double_array MDoubleArray:
+    :return np.array: array of type float64 """
+
+    length = double_array.length()
+    if not length:
+        return np.empty(0, np.float64)
+
+    util = om.MScriptUtil()
+    util.createFromList([0.0] * length, length)
+    ptr = util.asDoublePtr()
+    double_array.get(ptr)
+    return ptr_to_np(ptr, length, ctypes.c_double)
+
+
+def vector_array_to_np(vector_array):
+    """ convert the given MVectorArray to a numpy array
+    :param vector_array MVectorArray:
+    :return np.array: array of shape (n, 3) """
+
+    length = vector_array.length()
+    if not length:
+        return np.empty((0, 3), np.float64)
+
+    util = om.MScriptUtil()
+    util.createFromList([0.0] * length * 3, length * 3)
+    ptr = util.asDouble3Ptr()
+    vector_array.get(ptr)
+    return ptr_to_np(ptr, length * 3, ctypes.c_double).reshape(-1, 3)
+
+
+def matrix_to_np(matrix):
+    """ convert the given MMatrix to a 4x4 numpy array """
+
+    return np.array([[matrix(i, j) for j in xrange(4)] for i in xrange(4)])
+
+
+def transform_points(points, matrix):
+    """ transform the given points by the given matrix.
+    maya uses row vectors, hence the point is multiplied from the left
+    :param points np.array: array of shape (n, 3)
+    :param matrix MMatrix or np.array: 4x4 transformation matrix
+    :return np.array: transformed points of shape (n, 3) """
+
+    if isinstance(matrix, om.MMatrix):
+        matrix = matrix_to_np(matrix)
+
+    return np.dot(points, matrix[:3, :3]) + matrix[3, :3]
+
+
+def np_to_vector_array(array):
+    """ convert the given numpy array to a MVectorArray
+    :param array np.array: array of shape (n, 3)
+    :return MVectorArray: """
+
+    array = np.asarray(array, np.float64).reshape(-1, 3)
+    if not len(array):
+        return om.MVectorArray()
+
+    util = om.MScriptUtil()
+    util.createFromList(array.ravel().tolist(), array.size)
+    return om.MVectorArray(util.asDouble3Ptr(), len(array))
+
+
+def np_to_double_array(array):
+    """ convert the given numpy array to a MDoubleArray
+    :param array np.array: flat array
+    :return MDoubleArray: """
+
+    array = np.asarray(array, np.float64).ravel()
+    if not len(array):
+        return om.MDoubleArray()
+
+    util = om.MScriptUtil()
+    util.createFromList(array.tolist(), len(array))
+    return om.MDoubleArray(util.asDoublePtr(), len(array))
+
+
+def np_to_int_array(array):
+    """ convert the given numpy array to a MIntArray
+    :param array np.array: flat array
+    :return MIntArray: """
+
+    int_array = om.MIntArray()
+    array = np.asarray(array, np.int64).ravel()
+    if len(array):
+        om.MScriptUtil.createIntArrayFromList(array.tolist(), int_array)
+    return int_array
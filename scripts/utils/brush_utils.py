@@ -1,8 +1,11 @@
 import math
 import random
 
+import numpy as np
+
 import maya.OpenMaya as om
 
+import transform_utils
 
 
 
@@ -65,3 +68,92 @@ def get_offset(min_offset, max_offset, position, normal):
 
     rand_o = random.uniform(min_offset, max_offset)
     return om.MVector(position + normal * rand_o)
+
+
+""" ------------------------------------------------------- """
+""" batched brush kernels, working on all points within the brush """
+""" ------------------------------------------------------- """
+
+
+def get_falloff_weight(distance, radius, fall_off=True):
+    """ get a linear falloff weight for each point
+    :param distance np.array: distance of each point to the brush center
+    :param radius float: brush radius
+    :param fall_off bool: if False all weights are 1
+    :return np.array: weight of each point """
+
+    distance = np.asarray(distance, np.float64)
+    if not fall_off:
+        return np.ones(len(distance))
+    return 1 - distance / radius
+
+def scale_points(scale, factor, weight=1.0):
+    """ multiply the given scale values by the weighted factor
+    :param scale np.array: array of shape (n, 3)
+    :param factor float: scale factor at full weight
+    :param weight float or np.array: weight of each point
+    :return np.array: new scale values """
+
+    weight = np.reshape(weight, (-1, 1))
+    return scale * ((factor - 1) * weight + 1)
+
+def smooth_scale_points(scale, amount, weight=1.0):
+    """ move the given scale values towards their average
+    :param scale np.array: array of shape (n, 3)
+    :param amount float: step towards the average at full weight
+    :param weight float or np.array: weight of each point
+    :return np.array: new scale values """
+
+    weight = np.reshape(weight, (-1, 1))
+    average = scale.mean(axis=0)
+    return scale + (average - scale) * amount * weight
+
+def random_scale_points(scale, amount, uniform=True):
+    """ add a random value between -amount and amount to the given scales
+    :param scale np.array: array of shape (n, 3)
+    :param amount float: max random offset
+    :param uniform bool: if True all axes get the same offset
+    :return np.array: new scale values """
+
+    if uniform:
+        step = np.random.uniform(-1, 1, (len(scale), 1))
+    else:
+        step = np.random.uniform(-1, 1, (len(scale), 3))
+    return scale + step * amount
+
+def align_points(rotation, direction, weight=1.0):
+    """ rotate the local up axis of each point into the given direction
+    :param rotation np.array: array of shape (n, 3) of euler angles in degree
+    :param direction np.array: vector or array of shape (n, 3)
+    :param weight float: 0 = no rotation, 1 = full rotation
+    :return np.array: new euler angles in degree """
+
+    matrix = transform_utils.euler_to_matrix(np.radians(rotation))
+    local_up = matrix[:, 1, :]
+    target = transform_utils.rotate_into(local_up, direction, weight)
+    matrix = np.einsum('nij,njk->nik', matrix, target)
+    return np.degrees(transform_utils.matrix_to_euler(matrix))
+
+def random_rotate_points(rotation, weight=1.0):
+    """ rotate each point by a random angle between -5 and 5 degree
+    around each axis multiplied by the given weight
+    :param rotation np.array: array of shape (n, 3) of euler angles in degree
+    :param weight float: random weight
+    :return np.array: new euler angles in degree """
+
+    factor = 5 * weight
+    random_rotation = np.random.uniform(-factor, factor, (len(rotation), 3))
+    matrix = np.einsum('nij,njk->nik',
+                       transform_utils.euler_to_matrix(np.radians(rotation)),
+                       transform_utils.euler_to_matrix(np.radians(random_rotation)))
+    return np.degrees(transform_utils.matrix_to_euler(matrix))
+
+def move_points(position, direction, weight=1.0):
+    """ move the given points along the direction
+    :param position np.array: array of shape (n, 3)
+    :param direction np.array: vector or array of shape (n, 3)
+    :param weight float or np.array: distance to move each point
+    :return np.array: new positions """
+
+    weight = np.reshape(weight, (-1, 1))
+    return position + np.asarray(direction, np.float64) * weight
@@ -1,7 +1,87 @@
+import numpy as np
+
 import maya.OpenMaya as om
 
+import array_utils
 import window_utils
 
+
+# mesh handles by the name or full path name they have been requested with
+_mesh_handles = {}
+
+
+class MeshHandle(object):
+    """ function set, intersector and acceleration structure of a mesh.
+    the handle is invalidated by callbacks when the mesh is modified,
+    moved or deleted and recreated the next time it is requested """
+
+    def __init__(self, path):
+
+        self.path = om.MDagPath(path)
+        if self.path.node().hasFn(om.MFn.kTransform):
+            self.path.extendToShape()
+        self.mesh_fn = om.MFnMesh(self.path)
+        self.matrix = self.path.inclusiveMatrix()
+        self.accel_params = self.mesh_fn.autoUniformGridParams()
+        self.intersector = om.MMeshIntersector()
+        self.intersector.create(self.path.node(), self.matrix)
+        self.valid = True
+
+        node = self.path.node()
+        self.callbacks = om.MCallbackIdArray()
+        self.callbacks.append(om.MNodeMessage.addNodeDirtyCallback(node, self.invalidate))
+        self.callbacks.append(om.MPolyMessage.addPolyTopologyChangedCallback(node, self.invalidate))
+        self.callbacks.append(om.MDagMessage.addWorldMatrixModifiedCallback(self.path, self.invalidate))
+        self.callbacks.append(om.MNodeMessage.addNodePreRemovalCallback(node, self.invalidate))
+
+    def invalidate(self, *args):
+        """ mark the handle as outdated. the callbacks are removed when the
+        handle is replaced since they can't be removed from within themself """
+
+        self.valid = False
+
+    def remove_callbacks(self):
+        """ remove all callbacks of the handle """
+
+        for i in xrange(self.callbacks.length()):
+            om.MMessage.removeCallback(self.callbacks[i])
+        self.callbacks.clear()
+
+    def is_valid(self):
+        return self.valid and self.path.isValid()
+
+
+def get_mesh_handle(target):
+    """ get the cached mesh handle for the given target or create a new one
+    :param target: name or dag path of the mesh
+    :return MeshHandle: """
+
+    if isinstance(target, om.MDagPath):
+        key = target.fullPathName()
+    elif isinstance(target, str) or isinstance(target, unicode):
+        key = target
+    else:
+        raise TypeError('Must be of type str or MDagPath, is type: {}'.format(type(target)))
+
+    handle = _mesh_handles.get(key)
+    if handle and handle.is_valid():
+        return handle
+
+    if handle:
+        handle.remove_callbacks()
+    handle = MeshHandle(get_mesh_fn(target, False).dagPath())
+    _mesh_handles[key] = handle
+    return handle
+
+
+def clear_mesh_handles(*args):
+    """ remove all cached mesh handles and their callbacks """
+
+    for handle in _mesh_handles.itervalues():
+        handle.remove_callbacks()
+    _mesh_handles.clear()
+
+
 def hit_test(target, x, y, invert_y=True):
 
     origin = om.MPoint()
@@ -12,28 +92,34 @@ def hit_test(target, x, y, invert_y=True):
         y = view.portHeight() - y
 
     view.viewToWorld(x, y, origin, direction)
-    mesh_fn = get_mesh_fn(target)
+    handle = get_mesh_handle(target)
 
-    if mesh_fn:
-        points = om.MPointArray()
-        intersect = mesh_fn.intersect(origin, direction, points, 1.0e-3, om.MSpace.kWorld)
-        if intersect:
-            point = points[0]
-            normal = om.MVector()
-            mesh_fn.getClosestNormal(point, normal, om.MSpace.kWorld)
-            tangent = get_tangent(normal)
+    hit_point = om.MFloatPoint()
+    intersect = handle.mesh_fn.closestIntersection(om.MFloatPoint(origin.x, origin.y, origin.z),
+                                                   om.MFloatVector(direction.x, direction.y, direction.z),
+                                                   None, None, False, om.MSpace.kWorld,
+                                                   1.0e+9, False, handle.accel_params,
+                                                   hit_point, None, None, None, None, None, 1.0e-3)
+    if intersect:
+        point = om.MPoint(hit_point.x, hit_point.y, hit_point.z)
+        normal = get_closest_point_and_normal(point, target)[1]
+        tangent = get_tangent(normal)
 
-            position = (point.x, point.y, point.z)
-            tangent = (tangent.x, tangent.y, tangent.z)
-            normal = (normal.x, normal.y, normal.z)
-            return (position, normal, tangent)
+        position = (point.x, point.y, point.z)
+        tangent = (tangent.x, tangent.y, tangent.z)
+        normal = (normal.x, normal.y, normal.z)
+        return (position, normal, tangent)
 
 
-def get_mesh_fn(target):
+def get_mesh_fn(target, cached=True):
     """ get mesh function set for the given target
     :param target: dag path of the mesh
+    :param cached bool: use the cached function set of names and dag paths
     :return MFnMesh """
 
+    if cached and not isinstance(target, om.MObject):
+        return get_mesh_handle(target).mesh_fn
+
     if isinstance(target, str) or isinstance(target, unicode):
         slls = om.MSelectionList()
         slls.add(target)
@@ -67,13 +153,70 @@ def get_closest_point_and_normal(point, target):
     #  shortest_distance = None
 
     #  for target in targets:
-    mesh_fn = get_mesh_fn(target)
-    out_point = om.MPoint()
-    out_normal = om.MVector()
-    mesh_fn.getClosestPointAndNormal(point, out_point, out_normal, om.MSpace.kWorld)
+    if isinstance(target, om.MObject):
+        mesh_fn = get_mesh_fn(target)
+        out_point = om.MPoint()
+        out_normal = om.MVector()
+        mesh_fn.getClosestPointAndNormal(point, out_point, out_normal, om.MSpace.kWorld)
+        return out_point, out_normal
+
+    # the intersector works in the object space of the mesh
+    handle = get_mesh_handle(target)
+    point_on_mesh = om.MPointOnMesh()
+    handle.intersector.getClosestPoint(point, point_on_mesh)
+    point = point_on_mesh.getPoint()
+    normal = point_on_mesh.getNormal()
+    out_point = om.MPoint(point.x, point.y, point.z) * handle.matrix
+    out_normal = om.MVector(normal.x, normal.y, normal.z) * handle.matrix.inverse().transpose()
     #  out_tangent = get_tangent(normal)
 
-    return out_point, out_normal
+    return out_point, out_normal.normal()
+
+
+def project_points(target, position):
+    """ find the closest point on the target mesh for each given point
+    using the cached intersector of the target
+    :param target: dag path of the mesh
+    :param position np.array: array of shape (n, 3) of world space points
+    :return: closest points of shape (n, 3)
+             normals of shape (n, 3)
+             poly ids of shape (n,)
+             barycentric coords of shape (n, 2) """
+
+    position = np.asarray(position, np.float64).reshape(-1, 3)
+    num_points = len(position)
+
+    handle = get_mesh_handle(target)
+    intersector = handle.intersector
+
+    points = np.empty((num_points, 3))
+    normals = np.empty((num_points, 3))
+    poly_id = np.empty(num_points, np.int32)
+    barycentric = np.empty((num_points, 2))
+
+    util_u = om.MScriptUtil()
+    u_ptr = util_u.asFloatPtr()
+    util_v = om.MScriptUtil()
+    v_ptr = util_v.asFloatPtr()
+    point_on_mesh = om.MPointOnMesh()
+    for i in xrange(num_points):
+        intersector.getClosestPoint(om.MPoint(*position[i]), point_on_mesh)
+        point = point_on_mesh.getPoint()
+        normal = point_on_mesh.getNormal()
+        point_on_mesh.getBarycentricCoords(u_ptr, v_ptr)
+
+        points[i] = (point.x, point.y, point.z)
+        normals[i] = (normal.x, normal.y, normal.z)
+        poly_id[i] = point_on_mesh.faceIndex()
+        barycentric[i] = (util_u.getFloat(u_ptr), util_v.getFloat(v_ptr))
+
+    # the intersector returns object space results
+    matrix = array_utils.matrix_to_np(handle.matrix)
+    points = array_utils.transform_points(points, matrix)
+    normals = np.dot(normals, np.linalg.inv(matrix[:3, :3]).T)
+    normals /= np.linalg.norm(normals, axis=1)[:, np.newaxis]
+
+    return points, normals, poly_id, barycentric
 
 
 def get_tangent(normal):
@@ -0,0 +1,235 @@
+"""
+module provides sampling kernels that work on plain numpy arrays.
+the functions don't touch the maya api which means they can be profiled
+and tested outside of maya.
+"""
+
+import math
+
+import numpy as np
+
+from scipy.spatial import cKDTree as kd_tree
+
+
+def voxelize(position, cell_size, origin=None):
+    """ partition the given points into a sparse grid.
+    points are grouped by their cell in a csr like structure: the points of
+    cell i are indices[offsets[i]:offsets[i + 1]]. only occupied cells are
+    stored and points keep their relative order within a cell.
+    :param position np.array: array of shape (n, 3) of points
+    :param cell_size float: edge length of a single cell
+    :param origin np.array: corner of the grid, defaults to the points min
+    :return tuple(np.array, np.array): offsets and indices """
+
+    num_points = len(position)
+    if not num_points:
+        return np.zeros(1, dtype=np.int64), np.empty(0, dtype=np.int64)
+
+    if origin is None:
+        origin = position.min(0)
+
+    # linear cell key for each point
+    cell = np.floor((position - origin) / cell_size).astype(np.int64)
+    cell -= cell.min(0)
+    dim = cell.max(0) + 1
+    key = cell[:, 0] + cell[:, 1] * dim[0] + cell[:, 2] * dim[0] * dim[1]
+
+    # group by key, the stable sort keeps the order within each cell
+    indices = np.argsort(key, kind='mergesort')
+    key = key[indices]
+    offsets = np.flatnonzero(np.r_[True, key[1:] != key[:-1], True])
+    return offsets, indices
+
+
+def grid_sampling(partition):
+    """ randomly pick one point from each cell of the given partition.
+    every point gets a random key, the point with the lowest key wins.
+    :param partition tuple: offsets and indices as returned by voxelize
+    :return np.array: sorted indices of the picked points """
+
+    offsets, indices = partition
+    if not len(indices):
+        return np.empty(0, dtype=np.int64)
+
+    key = np.random.random(len(indices))
+    lowest = np.minimum.reduceat(key, offsets[:-1])
+    winner = key == np.repeat(lowest, np.diff(offsets))
+    return np.sort(indices[winner])
+
+
+def disk_sampling_3d(position, min_radius, partition=None, attempts=30):
+    """ pick a poisson disk distributed subset of the given points.
+    the points are partitioned into a sparse grid with a cell size of
+    min_radius / sqrt(3) so each cell can hold at most one sample.
+    every iteration throws one dart per open cell: candidates are
+    rejected against all accepted samples with a kd tree, conflicts
+    between the candidates themselves are resolved with a random
+    independent set. memory is bound by the number of input points and
+    accepted samples, the bounding box volume doesn't matter.
+    :param position np.array: array of shape (n, 3) of candidate points
+    :param min_radius float: minimum distance between two samples
+    :param partition tuple: offsets and indices as returned by voxelize.
+                            the cell size must not exceed min_radius / sqrt(3)
+    :param attempts int: max number of candidates tried per cell
+    :return np.array: indices of the accepted points """
+
+    num_points = len(position)
+    if not num_points or min_radius <= 0:
+        return np.arange(num_points)
+
+    if partition is None:
+        partition = voxelize(position, min_radius / math.sqrt(3))
+    offsets, indices = partition
+    cell_start = offsets[:-1]
+    cell_count = np.diff(offsets)
+
+    # each cell walks its points starting at a random offset
+    shift = (np.random.random(len(cell_start)) * cell_count).astype(np.int64)
+
+    open_cell = np.ones(len(cell_start), dtype=bool)
+    accepted = []
+    trees = []
+    for attempt in xrange(attempts):
+
+        # one candidate for each cell that has no sample yet
+        cells = np.flatnonzero(open_cell & (cell_count > attempt))
+        if not len(cells):
+            break
+        local = (shift[cells] + attempt) % cell_count[cells]
+        candidates = indices[cell_start[cells] + local]
+
+        # reject candidates too close to an already accepted sample.
+        # each iteration keeps its own tree so nothing is ever rebuilt
+        for tree in trees:
+            distance, _ = tree.query(position[candidates],
+                                     distance_upper_bound=min_radius)
+            valid = distance >= min_radius
+            cells = cells[valid]
+            candidates = candidates[valid]
+        if not len(candidates):
+            continue
+
+        # resolve conflicts between candidates of the same iteration
+        tree = kd_tree(position[candidates], balanced_tree=False)
+        pairs = tree.query_pairs(min_radius, output_type='ndarray')
+        keep = independent_set(len(candidates), pairs)
+
+        accepted.append(candidates[keep])
+        trees.append(kd_tree(position[candidates[keep]], balanced_tree=False))
+        open_cell[cells[keep]] = False
+
+    if not accepted:
+        return np.empty(0, dtype=np.int64)
+    return np.sort(np.concatenate(accepted))
+
+
+def sample_elimination(position, num_samples, area, alpha=8, beta=0.65,
+                       gamma=1.5, batch_size=0.05):
+    """ reduce the given points to num_samples blue noise samples.
+    weighted sample elimination after yuksel 2015: every point gets a
+    weight from its neighbours within 2 * r_max and the points with the
+    highest weight are removed until num_samples points are left.
+    instead of removing one point at a time from a heap, all points among
+    the heaviest batch_size fraction that outweigh their neighbours are
+    removed at once.
+    :param position np.array: array of shape (n, 3) of candidate points,
+                              ideally about 5 times num_samples
+    :param num_samples int: number of samples to keep
+    :param area float: surface area the points are distributed on
+    :param alpha float: weight function exponent
+    :param beta float: weight limiting scale
+    :param gamma float: weight limiting exponent
+    :param batch_size float: fraction of the points considered per pass
+    :return np.array: indices of the remaining points """
+
+    num_points = len(position)
+    if num_samples >= num_points:
+        return np.arange(num_points)
+    if num_samples <= 0:
+        return np.empty(0, dtype=np.int64)
+
+    # max poisson disk radius for the given number of samples on a surface
+    r_max = math.sqrt(area / (2 * math.sqrt(3) * num_samples))
+    r_min = r_max * beta * (1 - (num_samples / float(num_points)) ** gamma)
+
+    tree = kd_tree(position, balanced_tree=False)
+    pairs = tree.query_pairs(2 * r_max, output_type='ndarray')
+    node_a, node_b = pairs[:, 0], pairs[:, 1]
+    distance = np.linalg.norm(position[node_a] - position[node_b], axis=1)
+    edge_weight = (1 - np.maximum(distance, r_min) / (2 * r_max)) ** alpha
+    weight = np.bincount(node_a, edge_weight, num_points)\
+           + np.bincount(node_b, edge_weight, num_points)
+
+    # random priority to break ties between equal weights
+    priority = np.random.permutation(num_points)
+    alive = np.ones(num_points, dtype=bool)
+    num_alive = num_points
+    while num_alive > num_samples:
+
+        # drop edges that lead to eliminated points
+        active = alive[node_a] & alive[node_b]
+        node_a = node_a[active]
+        node_b = node_b[active]
+        edge_weight = edge_weight[active]
+
+        # heavy points with a higher weight than all their neighbours
+        a_lower = (weight[node_a] < weight[node_b])\
+                | ((weight[node_a] == weight[node_b])
+                   & (priority[node_a] < priority[node_b]))
+        is_max = alive.copy()
+        is_max[np.where(a_lower, node_a, node_b)] = False
+        batch = max(1, int(num_alive * batch_size))
+        if batch < num_alive:
+            is_max &= weight >= np.partition(weight[alive], -batch)[-batch]
+        eliminate = np.flatnonzero(is_max)
+
+        excess = num_alive - num_samples
+        if len(eliminate) > excess:
+            heaviest = np.lexsort((priority[eliminate], weight[eliminate]))
+            eliminate = eliminate[heaviest[-excess:]]
+
+        # remove the points and their weight from the neighbours
+        alive[eliminate] = False
+        num_alive -= len(eliminate)
+        removed_a = ~alive[node_a]
+        removed_b = ~alive[node_b]
+        weight -= np.bincount(node_b[removed_a], edge_weight[removed_a], num_points)
+        weight -= np.bincount(node_a[removed_b], edge_weight[removed_b], num_points)
+
+    return np.flatnonzero(alive)
+
+
+def independent_set(num_nodes, edges):
+    """ get a maximal independent set of the given graph.
+    nodes are visited in random order which equals greedy dart throwing
+    but every round is evaluated for all nodes at once.
+    :param num_nodes int: number of nodes in the graph
+    :param edges np.array: array of shape (m, 2) of node index pairs
+    :return np.array: bool mask, True for nodes in the set """
+
+    if not len(edges):
+        return np.ones(num_nodes, dtype=bool)
+
+    priority = np.random.permutation(num_nodes)
+    state = np.zeros(num_nodes, dtype=np.int8) # 0 open, 1 in set, -1 removed
+    node_a, node_b = edges[:, 0], edges[:, 1]
+    while True:
+        undecided = state == 0
+        if not undecided.any():
+            break
+
+        # drop edges that lead to decided nodes
+        active = undecided[node_a] & undecided[node_b]
+        node_a = node_a[active]
+        node_b = node_b[active]
+
+        # a node is selected if it has a lower priority than all its neighbours
+        selected = undecided.copy()
+        selected[np.where(priority[node_a] > priority[node_b], node_a, node_b)] = False
+        state[selected] = 1
+
+        # remove all neighbours of the selected nodes
+        state[node_b[selected[node_a]]] = -1
+        state[node_a[selected[node_b]]] = -1
+
+    return state == 1
@@ -0,0 +1,127 @@
+"""
+module provides vectorized transformation math on numpy arrays.
+matrices follow the maya convention and transform row vectors, a matrix
+stack has the shape (n, 3, 3). angles are in radians unless stated.
+"""
+
+import numpy as np
+
+
+def euler_to_matrix(rotation):
+    """ convert xyz euler angles to rotation matrices.
+    equals MTransformationMatrix.setRotation with kXYZ
+    :param rotation np.array: array of shape (n, 3) of angles
+    :return np.array: array of shape (n, 3, 3) """
+
+    rotation = np.asarray(rotation, np.float64).reshape(-1, 3)
+    cos = np.cos(rotation)
+    sin = np.sin(rotation)
+    cx, cy, cz = cos[:, 0], cos[:, 1], cos[:, 2]
+    sx, sy, sz = sin[:, 0], sin[:, 1], sin[:, 2]
+
+    # rx * ry * rz
+    matrix = np.empty((len(rotation), 3, 3))
+    matrix[:, 0, 0] = cy * cz
+    matrix[:, 0, 1] = cy * sz
+    matrix[:, 0, 2] = -sy
+    matrix[:, 1, 0] = sx * sy * cz - cx * sz
+    matrix[:, 1, 1] = sx * sy * sz + cx * cz
+    matrix[:, 1, 2] = sx * cy
+    matrix[:, 2, 0] = cx * sy * cz + sx * sz
+    matrix[:, 2, 1] = cx * sy * sz - sx * cz
+    matrix[:, 2, 2] = cx * cy
+    return matrix
+
+
+def matrix_to_euler(matrix):
+    """ convert rotation matrices to xyz euler angles
+    :param matrix np.array: array of shape (n, 3, 3)
+    :return np.array: array of shape (n, 3) of angles """
+
+    cos_y = np.hypot(matrix[:, 0, 0], matrix[:, 0, 1])
+    rotation = np.empty((len(matrix), 3))
+    rotation[:, 0] = np.arctan2(matrix[:, 1, 2], matrix[:, 2, 2])
+    rotation[:, 1] = np.arctan2(-matrix[:, 0, 2], cos_y)
+    rotation[:, 2] = np.arctan2(matrix[:, 0, 1], matrix[:, 0, 0])
+
+    # gimbal lock, put everything into x
+    locked = cos_y < 1e-9
+    if locked.any():
+        rotation[locked, 0] = np.arctan2(-matrix[locked, 2, 1], matrix[locked, 1, 1])
+        rotation[locked, 2] = 0
+    return rotation
+
+
+def rotate_into(source, target, weight=1.0):
+    """ get the rotation that turns the source into the target vector.
+    the angle is scaled by the given weight, which equals
+    MQuaternion(source, target, weight)
+    :param source np.array: vector or array of shape (n, 3)
+    :param target np.array: vector or array of shape (n, 3)
+    :param weight float: 0 = no rotation, 1 = full rotation
+    :return np.array: array of shape (n, 3, 3) """
+
+    source, target = np.broadcast_arrays(np.atleast_2d(source).astype(np.float64),
+                                         np.atleast_2d(target).astype(np.float64))
+    source = normalize(source)
+    target = normalize(target)
+
+    axis = np.cross(source, target)
+    sin = np.linalg.norm(axis, axis=1)
+    cos = np.einsum('ij,ij->i', source, target)
+    angle = np.arctan2(sin, cos) * weight
+
+    # parallel vectors have no axis, rotate around any perpendicular one
+    parallel = sin < 1e-12
+    if parallel.any():
+        axis[parallel] = get_tangent(source[parallel])
+
+    return axis_angle_to_matrix(normalize(axis), angle)
+
+
+def axis_angle_to_matrix(axis, angle):
+    """ convert normalized axis and angles to rotation matrices
+    :param axis np.array: array of shape (n, 3)
+    :param angle np.array: array of shape (n,)
+    :return np.array: array of shape (n, 3, 3) """
+
+    x, y, z = axis[:, 0], axis[:, 1], axis[:, 2]
+    cos = np.cos(angle)
+    sin = np.sin(angle)
+    t = 1 - cos
+
+    # transposed rodrigues matrix since maya uses row vectors
+    matrix = np.empty((len(axis), 3, 3))
+    matrix[:, 0, 0] = t * x * x + cos
+    matrix[:, 0, 1] = t * x * y + sin * z
+    matrix[:, 0, 2] = t * x * z - sin * y
+    matrix[:, 1, 0] = t * x * y - sin * z
+    matrix[:, 1, 1] = t * y * y + cos
+    matrix[:, 1, 2] = t * y * z + sin * x
+    matrix[:, 2, 0] = t * x * z + sin * y
+    matrix[:, 2, 1] = t * y * z - sin * x
+    matrix[:, 2, 2] = t * z * z + cos
+    return matrix
+
+
+def get_tangent(normal):
+    """ get normalized tangents for the given normals.
+    vectorized version of mesh_utils.get_tangent
+    :param normal np.array: array of shape (n, 3)
+    :return np.array: array of shape (n, 3) """
+
+    u = np.cross(normal, (0, 0, 1))
+    v = np.cross(normal, (0, 1, 0))
+    u_longer = np.einsum('ij,ij->i', u, u) > np.einsum('ij,ij->i', v, v)
+    tangent = normalize(np.where(u_longer[:, np.newaxis], u, v))
+    return normalize(np.cross(normal, tangent))
+
+
+def normalize(vector):
+    """ normalize the given vectors, zero vectors stay zero
+    :param vector np.array: array of shape (n, 3)
+    :return np.array: array of shape (n, 3) """
+
+    length = np.linalg.norm(vector, axis=1)
+    length[length == 0] = 1
+    return vector / length[:, np.newaxis]
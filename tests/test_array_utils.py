@@ -0,0 +1,38 @@
+import maya.OpenMaya as om
+
+import numpy as np
+
+from test_util import TestCase
+import array_utils
+
+
+class TestArrayUtils(TestCase):
+
+    def test_vector_array(self):
+        """ test converting vector arrays to numpy and back """
+
+        array = np.random.random((100, 3))
+        vector_array = array_utils.np_to_vector_array(array)
+        self.assertEqual(vector_array.length(), 100)
+        self.assertEqual(vector_array[10].y, array[10][1])
+        self.assertTrue(np.array_equal(array_utils.vector_array_to_np(vector_array), array))
+
+        # empty array
+        result = array_utils.vector_array_to_np(om.MVectorArray())
+        self.assertEqual(result.shape, (0, 3))
+
+    def test_int_array(self):
+        """ test converting int arrays to numpy and back """
+
+        array = np.arange(100)
+        int_array = array_utils.np_to_int_array(array)
+        self.assertEqual(int_array.length(), 100)
+        self.assertTrue(np.array_equal(array_utils.int_array_to_np(int_array), array))
+
+    def test_double_array(self):
+        """ test converting double arrays to numpy and back """
+
+        array = np.random.random(100)
+        double_array = array_utils.np_to_double_array(array)
+        self.assertEqual(double_array.length(), 100)
+        self.assertTrue(np.array_equal(array_utils.double_array_to_np(double_array), array))
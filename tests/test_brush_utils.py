@@ -0,0 +1,64 @@
+import numpy as np
+
+from test_util import TestCase
+import brush_utils
+import transform_utils
+
+
+class TestBrushUtils(TestCase):
+
+    def setUp(self):
+        np.random.seed(0)
+
+    def test_falloff_weight(self):
+        """ test linear falloff weights """
+
+        weight = brush_utils.get_falloff_weight([0, 1, 2], 2)
+        self.assertTrue(np.allclose(weight, [1, 0.5, 0]))
+
+        weight = brush_utils.get_falloff_weight([0, 1, 2], 2, False)
+        self.assertTrue(np.allclose(weight, 1))
+
+    def test_scale_points(self):
+        """ test scale, smooth scale and random scale kernels """
+
+        scale = np.random.uniform(0.5, 2, (100, 3))
+        weight = np.random.random(100)
+
+        result = brush_utils.scale_points(scale, 2, weight)
+        self.assertTrue(np.allclose(result, scale * (1 + weight)[:, np.newaxis]))
+
+        result = brush_utils.smooth_scale_points(scale, 1)
+        self.assertTrue(np.allclose(result, scale.mean(axis=0)))
+
+        result = brush_utils.random_scale_points(scale, 0.1, True)
+        delta = result - scale
+        self.assertTrue(np.allclose(delta[:, 0], delta[:, 1]))
+        self.assertTrue(np.abs(delta).max() <= 0.1)
+
+    def test_align_points(self):
+        """ test that the local up axis is rotated into the direction """
+
+        rotation = np.random.uniform(-180, 180, (100, 3))
+        direction = transform_utils.normalize(np.random.normal(size=(100, 3)))
+
+        result = brush_utils.align_points(rotation, direction)
+        matrix = transform_utils.euler_to_matrix(np.radians(result))
+        self.assertTrue(np.allclose(matrix[:, 1, :], direction))
+
+        # no weight means no change
+        result = brush_utils.align_points(rotation, direction, 0)
+        matrix = transform_utils.euler_to_matrix(np.radians(result))
+        self.assertTrue(np.allclose(matrix, transform_utils.euler_to_matrix(np.radians(rotation))))
+
+    def test_random_rotate_points(self):
+        """ test that random rotations stay within the given weight """
+
+        rotation = np.random.uniform(-180, 180, (100, 3))
+        result = brush_utils.random_rotate_points(rotation, 1)
+        before = transform_utils.euler_to_matrix(np.radians(rotation))
+        after = transform_utils.euler_to_matrix(np.radians(result))
+
+        # the up axis can't rotate further than the three random angles
+        cos = np.einsum('ij,ij->i', before[:, 1, :], after[:, 1, :])
+        self.assertTrue(np.degrees(np.arccos(np.clip(cos, -1, 1))).max() <= 15)
@@ -0,0 +1,94 @@
+import numpy as np
+
+from test_util import TestCase
+import bvh
+
+
+class TestBVH(TestCase):
+
+    def setUp(self):
+
+        # a random triangle soup and a bumpy grid
+        np.random.seed(0)
+        p0 = np.random.random((500, 3)) * 10
+        p1 = p0 + np.random.normal(size=(500, 3)) * 0.5
+        p2 = p0 + np.random.normal(size=(500, 3)) * 0.5
+        self.soup = bvh.BVH(p0, p1, p2, 4)
+
+        x, z = np.meshgrid(np.arange(30), np.arange(30))
+        y = np.sin(x * 0.3) * np.cos(z * 0.3)
+        vertices = np.c_[x.ravel(), y.ravel(), z.ravel()].astype(np.float64)
+        quad = (x[:-1, :-1] + z[:-1, :-1] * 30).ravel()
+        tris = np.r_[np.c_[quad, quad + 1, quad + 30], np.c_[quad + 1, quad + 31, quad + 30]]
+        self.grid = bvh.BVH(vertices[tris[:, 0]], vertices[tris[:, 1]], vertices[tris[:, 2]])
+
+    def brute_force_pairs(self, tree, num_queries):
+        """ get all pairs of query and triangle ids """
+
+        query = np.repeat(np.arange(num_queries), len(tree.p0))
+        triangle = np.tile(np.arange(len(tree.p0)), num_queries)
+        return query, triangle
+
+    def test_closest_points(self):
+        """ test closest point queries against a brute force search """
+
+        for tree in (self.soup, self.grid):
+            position = np.random.random((100, 3)) * 32 - 1
+            points, distance, triangle_id, barycentric = tree.closest_points(position)
+
+            query, triangle = self.brute_force_pairs(tree, len(position))
+            u, v = bvh.closest_point_on_triangles(position[query], tree.p0[triangle], tree.p1[triangle], tree.p2[triangle])
+            expected = np.linalg.norm(tree.get_points(triangle, u, v) - position[query], axis=1)
+            expected = expected.reshape(len(position), -1).min(axis=1)
+
+            self.assertTrue(np.allclose(distance, expected))
+            self.assertTrue(np.allclose(np.linalg.norm(points - position, axis=1), distance))
+            self.assertTrue(np.allclose(tree.get_points(triangle_id, barycentric[:, 0], barycentric[:, 1]), points))
+
+            # nothing is found beyond the max distance
+            points, distance, triangle_id, barycentric = tree.closest_points(position, 0.5)
+            self.assertTrue(np.array_equal(triangle_id >= 0, expected <= 0.5))
+            self.assertTrue(np.all(np.isinf(distance[expected > 0.5])))
+
+    def test_closest_point_regions(self):
+        """ test the closest point of each voronoi region of a triangle """
+
+        p0, p1, p2 = np.array([[0, 0, 0]]), np.array([[1, 0, 0]]), np.array([[0, 1, 0]])
+        position = np.array([[-1, -1, 1], [2, -0.5, 0], [-0.5, 2, 0],
+                             [0.5, -1, 0], [-1, 0.5, 0], [1, 1, 0], [0.25, 0.25, 1]])
+        expected = np.array([[0, 0], [1, 0], [0, 1], [0.5, 0], [0, 0.5], [0.5, 0.5], [0.25, 0.25]])
+
+        u, v = bvh.closest_point_on_triangles(position, p0.repeat(7, 0), p1.repeat(7, 0), p2.repeat(7, 0))
+        self.assertTrue(np.allclose(np.c_[u, v], expected))
+
+    def test_intersect(self):
+        """ test ray intersections against a brute force search """
+
+        for tree in (self.soup, self.grid):
+            origin = np.random.random((100, 3)) * 32 - 1
+            direction = np.random.normal(size=(100, 3))
+            points, distance, triangle_id, barycentric = tree.intersect(origin, direction)
+
+            query, triangle = self.brute_force_pairs(tree, len(origin))
+            t, u, v = bvh.intersect_triangles(origin[query], direction[query], tree.p0[triangle], tree.p1[triangle], tree.p2[triangle])
+            expected = t.reshape(len(origin), -1).min(axis=1)
+
+            self.assertTrue(np.allclose(distance, expected))
+            self.assertTrue(np.array_equal(triangle_id >= 0, np.isfinite(expected)))
+            hit = triangle_id >= 0
+            self.assertTrue(np.allclose(points[hit], origin[hit] + direction[hit] * distance[hit, np.newaxis]))
+
+        # rays straight down onto the grid always hit
+        origin = np.c_[np.random.random(100) * 29, np.full(100, 5), np.random.random(100) * 29]
+        points, distance, triangle_id, barycentric = self.grid.intersect(origin, np.tile((0, -1, 0), (100, 1)))
+        self.assertTrue(np.all(triangle_id >= 0))
+        self.assertTrue(np.allclose(points[:, [0, 2]], origin[:, [0, 2]]))
+
+    def test_empty(self):
+        """ test queries on an empty tree """
+
+        tree = bvh.BVH(np.empty((0, 3)), np.empty((0, 3)), np.empty((0, 3)))
+        points, distance, triangle_id, barycentric = tree.closest_points(np.zeros((2, 3)))
+        self.assertTrue(np.all(triangle_id == -1))
+        points, distance, triangle_id, barycentric = tree.intersect(np.zeros((2, 3)), np.ones((2, 3)))
+        self.assertTrue(np.all(triangle_id == -1))
@@ -1,6 +1,8 @@
 import os
 import sys
 
+import numpy as np
+
 import maya.cmds as cmds
 import maya.OpenMaya as om
 
@@ -36,13 +38,13 @@ class TestGeoCache(TestCase):
 
         self.geo_cache.cache_geometry(self.plane)
 
-        self.assertEqual(self.geo_cache.p0.length(), 200)
-        self.assertEqual(self.geo_cache.p1.length(), 200)
-        self.assertEqual(self.geo_cache.p2.length(), 200)
-        self.assertEqual(self.geo_cache.normals.length(), 200)
-        self.assertEqual(self.geo_cache.poly_id.length(), 200)
-        self.assertEqual(self.geo_cache.AB.length(), 200)
-        self.assertEqual(self.geo_cache.AC.length(), 200)
+        self.assertEqual(len(self.geo_cache.p0), 200)
+        self.assertEqual(len(self.geo_cache.p1), 200)
+        self.assertEqual(len(self.geo_cache.p2), 200)
+        self.assertEqual(len(self.geo_cache.normals), 200)
+        self.assertEqual(len(self.geo_cache.poly_id), 200)
+        self.assertEqual(len(self.geo_cache.AB), 200)
+        self.assertEqual(len(self.geo_cache.AC), 200)
 
         for i in range(100):
             self.assertEqual(self.geo_cache.poly_id[i * 2], i)
@@ -50,7 +52,82 @@ class TestGeoCache(TestCase):
 
         self.geo_cache.create_uv_lookup()
 
+    def test_triangle_data(self):
+
+        self.geo_cache.cache_geometry(self.plane)
+
+        # the plane is 10x10 units with 10x10 subdivisions, each triangle
+        # covers half a unit and faces straight up.
+        # note: the cached area omits the factor 1/2
+        self.assertTrue(np.allclose(self.geo_cache.AB, self.geo_cache.p1 - self.geo_cache.p0))
+        self.assertTrue(np.allclose(self.geo_cache.AC, self.geo_cache.p2 - self.geo_cache.p0))
+        self.assertTrue(np.allclose(self.geo_cache.normals, [0, 1, 0]))
+        self.assertTrue(np.allclose(self.geo_cache.area, 1.0))
+        self.assertEqual(len(self.geo_cache), 200)
+
+    def test_sample_triangle_ids(self):
+
+        self.geo_cache.cache_geometry(self.plane)
+
+        np.random.seed(0)
+        triangle_ids = self.geo_cache.sample_triangle_ids(10000)
+        self.assertEqual(len(triangle_ids), 10000)
+        self.assertTrue(triangle_ids.min() >= 0)
+        self.assertTrue(triangle_ids.max() < len(self.geo_cache))
+
+        # all triangles share the same area, each one should be drawn
+        self.assertEqual(len(np.unique(triangle_ids)), len(self.geo_cache))
+
+
+
 
+    def test_bvh_queries(self):
 
+        self.geo_cache.cache_geometry(self.plane)
+
+        # shoot rays straight down onto the plane
+        origin = np.c_[np.linspace(-4.9, 4.9, 20), np.full(20, 5), np.linspace(4.9, -4.9, 20)]
+        direction = np.tile((0, -1, 0), (20, 1))
+        points, normals, poly_id, barycentric = self.geo_cache.intersect(origin, direction)
+        self.assertTrue(np.allclose(points, origin * (1, 0, 1)))
+        self.assertTrue(np.allclose(normals, [0, 1, 0]))
+        self.assertTrue(np.all(poly_id >= 0))
+
+        # rays next to the plane miss
+        points, normals, poly_id, barycentric = self.geo_cache.intersect(origin + (20, 0, 0), direction)
+        self.assertTrue(np.all(poly_id == -1))
+
+        # closest points are projected onto the plane or clamped to its border
+        position = np.c_[np.linspace(-8, 8, 20), np.linspace(-3, 3, 20), np.zeros(20)]
+        points, normals, poly_id, barycentric = self.geo_cache.get_closest_points(position)
+        self.assertTrue(np.allclose(points, np.c_[np.clip(position[:, 0], -5, 5), np.zeros(20), np.zeros(20)]))
+
+        # the bvh is dropped with the cache
+        self.geo_cache.flush_cache()
+        self.assertEqual(self.geo_cache.bvh, None)
+
+    def test_validate_cache(self):
 
+        self.geo_cache.cache_geometry(self.plane)
+        self.assertTrue(self.geo_cache.validate_cache())
+        self.assertFalse(self.geo_cache.dirty)
+
+        # dirtying the mesh without changing it keeps the cache valid
+        cmds.setAttr('pPlaneShape1.castsShadows', False)
+        self.assertTrue(self.geo_cache.validate_cache())
+
+        # moving a vertex invalidates the cache
+        cmds.move(0, 1, 0, 'pPlane1.vtx[0]', r=True)
+        self.assertTrue(self.geo_cache.dirty)
+        self.assertFalse(self.geo_cache.validate_cache())
 
+        # so does moving the mesh
+        self.geo_cache.cache_geometry(self.plane)
+        self.assertTrue(self.geo_cache.validate_cache())
+        cmds.setAttr('pPlane1.translateX', 1)
+        self.assertFalse(self.geo_cache.validate_cache())
+
+        # and changing the topology
+        self.geo_cache.cache_geometry(self.plane)
+        cmds.polySmooth('pPlane1')
+        self.assertFalse(self.geo_cache.validate_cache())
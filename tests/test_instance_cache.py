@@ -0,0 +1,64 @@
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+from test_util import TestCase
+import instance_cache
+
+
+class TestInstanceCache(TestCase):
+
+    def setUp(self):
+
+        np.random.seed(0)
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'scene_spore', 'sporeShape.spore')
+        self.columns = [('position', np.random.random((100, 3))),
+                        ('instance_id', np.arange(100, dtype=np.int32)),
+                        ('u_coord', np.random.random(100))]
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_write_read(self):
+        """ test that all columns are restored with their type and shape """
+
+        checksum = instance_cache.write_cache(self.path, self.columns)
+        self.assertEqual(instance_cache.get_checksum(self.path), checksum)
+
+        columns = instance_cache.read_cache(self.path, checksum)
+        self.assertEqual(sorted(columns), ['instance_id', 'position', 'u_coord'])
+        for name, array in self.columns:
+            self.assertEqual(columns[name].dtype, array.dtype)
+            self.assertTrue(np.array_equal(columns[name], array))
+
+        # the columns are copy on write and never change the file
+        columns['position'][:] = 0
+        columns = instance_cache.read_cache(self.path, checksum)
+        self.assertTrue(np.array_equal(columns['position'], self.columns[0][1]))
+
+    def test_empty(self):
+        """ test writing a cache without points """
+
+        columns = [(name, array[:0]) for name, array in self.columns]
+        checksum = instance_cache.write_cache(self.path, columns)
+        columns = instance_cache.read_cache(self.path, checksum)
+        self.assertEqual(columns['position'].shape, (0, 3))
+        self.assertEqual(columns['u_coord'].shape, (0, ))
+
+    def test_invalid(self):
+        """ test that modified and foreign files are rejected """
+
+        checksum = instance_cache.write_cache(self.path, self.columns)
+        self.columns[0][1][0] = 1
+        self.assertNotEqual(instance_cache.write_cache(self.path, self.columns), checksum)
+        self.assertRaises(IOError, instance_cache.read_cache, self.path, checksum)
+
+        with open(self.path, 'wb') as cache_file:
+            cache_file.write('\0' * 1024)
+        self.assertRaises(IOError, instance_cache.read_cache, self.path)
+
+        self.assertRaises(ValueError, instance_cache.write_cache, self.path,
+                          [('position', np.zeros((2, 3))), ('scale', np.zeros((3, 3)))])
@@ -4,6 +4,8 @@ import sys
 import maya.cmds as cmds
 import maya.OpenMaya as om
 
+import numpy as np
+
 from test_util import TestCase
 import instance_data
 import node_utils
@@ -53,6 +55,25 @@ class TestInstanceData(TestCase):
             self.assertEqual(i, self.instance_data.unique_id[i])
 
 
+    def test_append_numpy(self):
+        """ test appending numpy arrays beyond the initial capacity """
+
+        for i in xrange(10):
+            vector = np.ones((i + 1, 3)) * i
+            ids = np.arange(i + 1)
+            self.instance_data.append_points(vector, vector, vector, ids,
+                                             np.ones(i + 1), vector, vector,
+                                             ids, ids, ids, vector)
+        self.instance_data_validation(55)
+        self.assertEqual(self.instance_data.position[-1][0], 9)
+        self.assertEqual(self.instance_data.instance_id[-1], 9)
+
+        # changes are written to the instanceData attribute on set_state
+        self.instance_data.set_state()
+        array_attr_fn = om.MFnArrayAttrsData(self.instance_data.get_data_object())
+        self.assertEqual(array_attr_fn.vectorArray('position').length(), 55)
+        self.assertEqual(array_attr_fn.intArray('objectIndex')[54], 9)
+
     def test_set_points(self):
         """ test the set_points method """
 
@@ -143,6 +164,44 @@ class TestInstanceData(TestCase):
                                             color[i])
         self.instance_data_validation(length)
 
+    def test_insert_points(self):
+        """ test that scattered rows are merged back to their indexes """
+
+        length = 20
+        position, scale, rotation, instance_id, visibility, normal, tangent, u_coord, v_coord, poly_id, color = create_test_data(length)
+        self.instance_data.append_points(position, scale, rotation, instance_id,
+                                         visibility, normal, tangent, u_coord,
+                                         v_coord, poly_id, color)
+        instance_id = self.instance_data.instance_id.copy()
+
+        index = np.array([0, 3, 4, 9, 19])
+        values = self.instance_data.get_points(index)
+        for i in index[::-1]:
+            self.instance_data.visibility[i] = 0
+        self.instance_data.clean_up()
+        self.instance_data_validation(length - len(index))
+
+        self.assertTrue(self.instance_data.insert_points(index, **values))
+        self.instance_data_validation(length)
+        self.assertTrue(np.array_equal(self.instance_data.instance_id, instance_id))
+
+        # test unsorted and out of range indexes
+        self.assertFalse(self.instance_data.insert_points([3, 1], **self.instance_data.get_points([0, 1])))
+        self.assertFalse(self.instance_data.insert_points([0, 30], **self.instance_data.get_points([0, 1])))
+        self.instance_data_validation(length)
+
+    def test_detach_columns(self):
+        """ test that loaded columns stop sharing memory with their source """
+
+        position = np.random.random((10, 3))
+        self.instance_data.load_columns({'position': position})
+        self.assertTrue(np.shares_memory(self.instance_data.position, position))
+
+        self.instance_data.detach_columns()
+        self.assertFalse(np.shares_memory(self.instance_data.position, position))
+        self.assertTrue(np.array_equal(self.instance_data.position, position))
+        self.instance_data_validation(10)
+
     def test_clean_up(self):
 
         # test nothing to do on empty instance data
@@ -156,6 +215,22 @@ class TestInstanceData(TestCase):
                                          v_coord, poly_id, color)
         for i in range(10, 20):
             self.instance_data.visibility[i] = 0
+        self.assertTrue(self.instance_data.clean_up())
+        self.instance_data_validation(10)
+        for i in range(10):
+            self.assertEqual(self.instance_data.instance_id[i], i)
+
+        # test cleanup of scattered points keeps the order
+        length = 20
+        position, scale, rotation, instance_id, visibility, normal, tangent, u_coord, v_coord, poly_id, color = create_test_data(length)
+        self.instance_data.append_points(position, scale, rotation, instance_id,
+                                         visibility, normal, tangent, u_coord,
+                                         v_coord, poly_id, color)
+        self.instance_data.visibility[10::2] = 0
+        self.instance_data.clean_up()
+        self.instance_data_validation(20)
+        self.assertEqual(list(self.instance_data.instance_id[10:]), range(1, 20, 2))
+        self.instance_data.visibility[10:] = 0
         self.instance_data.clean_up()
         self.instance_data_validation(10)
 
@@ -168,6 +243,79 @@ class TestInstanceData(TestCase):
         # test cleanup with nothing to do
         self.assertFalse(self.instance_data.clean_up())
 
+    def test_get_closest_points(self):
+        """ test radius queries with instance id filter and distances """
+
+        length = 20
+        position, scale, rotation, instance_id, visibility, normal, tangent, u_coord, v_coord, poly_id, color = create_test_data(length)
+        self.instance_data.append_points(position, scale, rotation, instance_id,
+                                         visibility, normal, tangent, u_coord,
+                                         v_coord, poly_id, color)
+
+        # points are placed at (i, i, i) with instance id i
+        neighbours = self.instance_data.get_closest_points((5, 5, 5), 2)
+        self.assertEqual(sorted(neighbours), [4, 5, 6])
+
+        neighbours, distance = self.instance_data.get_closest_points((5, 5, 5), 2, [4, 6], True)
+        self.assertEqual(sorted(neighbours), [4, 6])
+        self.assertTrue(np.allclose(distance, np.sqrt(3)))
+
+        neighbours = self.instance_data.get_closest_points(om.MPoint(5, 5, 5), 2, [10])
+        self.assertEqual(len(neighbours), 0)
+
+    def test_stroke(self):
+        """ test that set_state is deferred during a stroke """
+
+        num_spores_plug = om.MFnDependencyNode(self.node).findPlug('numSpores')
+        position, scale, rotation, instance_id, visibility, normal, tangent, u_coord, v_coord, poly_id, color = create_test_data(10)
+
+        self.instance_data.begin_stroke(30)
+        for i in xrange(3):
+            self.instance_data.append_points(position, scale, rotation, instance_id,
+                                             visibility, normal, tangent, u_coord,
+                                             v_coord, poly_id, color)
+            self.instance_data.set_state()
+        self.assertEqual(num_spores_plug.asInt(), 0)
+
+        # all pending dabs are applied at once
+        self.instance_data.flush_state()
+        self.assertEqual(num_spores_plug.asInt(), 30)
+
+        # and always at the end of the stroke
+        self.instance_data.append_points(position, scale, rotation, instance_id,
+                                         visibility, normal, tangent, u_coord,
+                                         v_coord, poly_id, color)
+        self.instance_data.set_state()
+        self.assertEqual(num_spores_plug.asInt(), 30)
+        self.instance_data.end_stroke()
+        self.assertEqual(num_spores_plug.asInt(), 40)
+
+        # outside of a stroke set_state is applied immediately
+        self.instance_data.visibility[:] = 0
+        self.instance_data.clean_up()
+        self.instance_data.set_state()
+        self.assertEqual(num_spores_plug.asInt(), 0)
+
+    def test_generation(self):
+        """ test that only modified columns get a new generation """
+
+        position, scale, rotation, instance_id, visibility, normal, tangent, u_coord, v_coord, poly_id, color = create_test_data(10)
+        self.instance_data.append_points(position, scale, rotation, instance_id,
+                                         visibility, normal, tangent, u_coord,
+                                         v_coord, poly_id, color)
+        generation = dict((name, self.instance_data.get_generation(name))
+                          for name, attr, array_type in instance_data.COLUMNS)
+
+        self.instance_data.set_points([1, 2], scale=self.instance_data.scale[[1, 2]] * 2)
+        for name, attr, array_type in instance_data.COLUMNS:
+            changed = self.instance_data.get_generation(name) != generation[name]
+            self.assertEqual(changed, name == 'scale')
+
+        # writing the arrays to maya does not count as a modification
+        generation = self.instance_data.get_generation('scale')
+        self.instance_data.set_state()
+        self.assertEqual(self.instance_data.get_generation('scale'), generation)
+
     def test_add(self):
         instance_data_2 = instance_data.InstanceData(self.node)
         instance_data_2.initialize_data()
@@ -194,11 +342,11 @@ class TestInstanceData(TestCase):
         self.assertEqual(len(self.instance_data), predicted_length)
         for i in xrange(len(self.instance_data)):
             self.assertEqual(self.instance_data.unique_id[i], i)
-            self.assertEqual(self.instance_data.position[i].x,
+            self.assertEqual(self.instance_data.position[i][0],
                              self.instance_data.np_position[i][0])
-            self.assertEqual(self.instance_data.position[i].y,
+            self.assertEqual(self.instance_data.position[i][1],
                              self.instance_data.np_position[i][1])
-            self.assertEqual(self.instance_data.position[i].z,
+            self.assertEqual(self.instance_data.position[i][2],
                              self.instance_data.np_position[i][2])
 
 
@@ -224,11 +372,11 @@ def create_test_data(length):
         self.assertEqual(len(self.instance_data), predicted_length)
         for i in xrange(len(self.instance_data)):
             self.assertEqual(self.instance_data.unique_id[i], i)
-            self.assertEqual(self.instance_data.position[i].x,
+            self.assertEqual(self.instance_data.position[i][0],
                              self.instance_data.np_position[i][0])
-            self.assertEqual(self.instance_data.position[i].y,
+            self.assertEqual(self.instance_data.position[i][1],
                              self.instance_data.np_position[i][1])
-            self.assertEqual(self.instance_data.position[i].z,
+            self.assertEqual(self.instance_data.position[i][2],
                              self.instance_data.np_position[i][2])
 
 
@@ -0,0 +1,73 @@
+import numpy as np
+
+import maya.cmds as cmds
+import maya.OpenMaya as om
+
+from test_util import TestCase
+import mesh_utils
+import node_utils
+
+
+class TestMeshUtils(TestCase):
+
+    def setUp(self):
+
+        cmds.file(new=True, f=True)
+
+        # a moved and tilted plane to check the world space results
+        plane = cmds.polyPlane(sx=10, sy=10, w=10, h=10)
+        cmds.setAttr('{}.translate'.format(plane[0]), 1, 2, 3)
+        cmds.setAttr('{}.rotateX'.format(plane[0]), 90)
+        self.plane_name = plane[0]
+        self.plane = node_utils.get_dagpath_from_name(plane[0])
+
+    def tearDown(self):
+        mesh_utils.clear_mesh_handles()
+        cmds.file(new=True, f=True)
+
+    def test_project_points(self):
+        """ test batched closest point queries against single queries """
+
+        np.random.seed(0)
+        position = np.random.uniform(-6, 6, (50, 3)) + (1, 2, 3)
+        points, normals, poly_id, barycentric = mesh_utils.project_points(self.plane, position)
+
+        self.assertEqual(points.shape, (50, 3))
+        self.assertEqual(normals.shape, (50, 3))
+        self.assertEqual(poly_id.shape, (50,))
+        self.assertEqual(barycentric.shape, (50, 2))
+
+        # the plane is rotated into the xy plane at z = 3
+        self.assertTrue(np.allclose(points[:, 2], 3, atol=1e-5))
+        self.assertTrue(np.allclose(np.abs(normals[:, 2]), 1, atol=1e-5))
+        self.assertTrue(np.all((poly_id >= 0) & (poly_id < 100)))
+        self.assertTrue(np.all(barycentric >= -1e-5))
+        self.assertTrue(np.all(barycentric.sum(axis=1) <= 1 + 1e-5))
+
+        for i in xrange(len(position)):
+            point, normal = mesh_utils.get_closest_point_and_normal(
+                om.MPoint(*position[i]), self.plane)
+            self.assertTrue(np.allclose(points[i], (point.x, point.y, point.z), atol=1e-4))
+            self.assertTrue(np.allclose(normals[i], (normal.x, normal.y, normal.z), atol=1e-4))
+
+    def test_mesh_handle(self):
+        """ test that mesh handles are reused until the mesh changes """
+
+        handle = mesh_utils.get_mesh_handle(self.plane)
+        self.assertTrue(mesh_utils.get_mesh_handle(self.plane) is handle)
+        self.assertTrue(mesh_utils.get_mesh_fn(self.plane) is handle.mesh_fn)
+
+        # moving the mesh invalidates the world space intersector
+        cmds.setAttr('{}.translateZ'.format(self.plane_name), 5)
+        self.assertFalse(handle.is_valid())
+        handle = mesh_utils.get_mesh_handle(self.plane)
+        self.assertTrue(handle.is_valid())
+        point, normal = mesh_utils.get_closest_point_and_normal(om.MPoint(1, 2, 0), self.plane)
+        self.assertAlmostEqual(point.z, 5, 5)
+
+        # so does changing the topology
+        cmds.polySmooth(self.plane_name)
+        self.assertFalse(handle.is_valid())
+
+        mesh_utils.clear_mesh_handles()
+        self.assertEqual(handle.callbacks.length(), 0)
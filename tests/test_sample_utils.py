@@ -0,0 +1,97 @@
+import numpy as np
+
+from test_util import TestCase
+import sample_utils
+
+
+class TestSampleUtils(TestCase):
+
+    def setUp(self):
+        np.random.seed(0)
+
+    def test_voxelize(self):
+        """ test that each point ends up in the cell it belongs to """
+
+        position = np.random.random((1000, 3)) * 10
+        offsets, indices = sample_utils.voxelize(position, 2.0, np.zeros(3))
+
+        self.assertEqual(offsets[0], 0)
+        self.assertEqual(offsets[-1], len(position))
+        self.assertEqual(len(np.unique(indices)), len(position))
+        self.assertTrue(len(offsets) - 1 <= 125)
+
+        cells = set()
+        for i in xrange(len(offsets) - 1):
+            cell = np.floor(position[indices[offsets[i]:offsets[i + 1]]] / 2.0)
+            self.assertTrue((cell == cell[0]).all())
+            cells.add(tuple(cell[0]))
+        self.assertEqual(len(cells), len(offsets) - 1)
+
+        # empty input
+        offsets, indices = sample_utils.voxelize(np.empty((0, 3)), 1.0)
+        self.assertEqual(list(offsets), [0])
+        self.assertEqual(len(indices), 0)
+
+    def test_grid_sampling(self):
+        """ test that exactly one point per cell is picked """
+
+        position = np.random.random((5000, 3)) * 10
+        partition = sample_utils.voxelize(position, 1.0)
+        ids = sample_utils.grid_sampling(partition)
+
+        offsets, indices = partition
+        self.assertEqual(len(ids), len(offsets) - 1)
+        for i in xrange(len(offsets) - 1):
+            cell = indices[offsets[i]:offsets[i + 1]]
+            self.assertEqual(np.in1d(cell, ids).sum(), 1)
+
+    def test_disk_sampling_3d(self):
+        """ test the min distance between poisson disk samples """
+
+        position = np.random.random((20000, 3)) * [20, 2, 20]
+        min_radius = 0.5
+        ids = sample_utils.disk_sampling_3d(position, min_radius)
+
+        self.assertTrue(len(ids) > 0)
+        self.assertEqual(len(np.unique(ids)), len(ids))
+
+        samples = position[ids]
+        for i in xrange(len(samples)):
+            distance = np.linalg.norm(samples - samples[i], axis=1)
+            distance[i] = min_radius
+            self.assertTrue(distance.min() >= min_radius)
+
+        # every rejected point must be covered by a sample
+        rejected = np.setdiff1d(np.arange(len(position)), ids)
+        tree = sample_utils.kd_tree(samples)
+        distance, _ = tree.query(position[rejected])
+        self.assertTrue(distance.max() <= min_radius)
+
+    def test_independent_set(self):
+        """ test that no two nodes of an edge are both selected """
+
+        edges = np.array([[0, 1], [1, 2], [2, 3], [3, 0], [4, 5]])
+        selected = sample_utils.independent_set(7, edges)
+
+        self.assertFalse((selected[edges[:, 0]] & selected[edges[:, 1]]).any())
+        self.assertTrue(selected[6])
+        self.assertEqual(selected[[4, 5]].sum(), 1)
+
+    def test_sample_elimination(self):
+        """ test sample count and spacing of the eliminated samples """
+
+        num_samples = 1000
+        position = np.random.random((num_samples * 5, 3)) * [10, 0, 10]
+        ids = sample_utils.sample_elimination(position, num_samples, 100)
+
+        self.assertEqual(len(ids), num_samples)
+        self.assertEqual(len(np.unique(ids)), num_samples)
+
+        # random points clump, eliminated samples should be far apart
+        r_max = np.sqrt(100 / (2 * np.sqrt(3) * num_samples))
+        distance, _ = sample_utils.kd_tree(position[ids]).query(position[ids], k=2)
+        self.assertTrue(distance[:, 1].min() > r_max)
+
+        # nothing to eliminate
+        ids = sample_utils.sample_elimination(position[:10], num_samples, 100)
+        self.assertEqual(len(ids), 10)
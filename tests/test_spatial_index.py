@@ -0,0 +1,79 @@
+import numpy as np
+
+from test_util import TestCase
+import spatial_index
+
+
+class TestSpatialIndex(TestCase):
+
+    def setUp(self):
+        np.random.seed(0)
+        self.position = np.random.random((5000, 3)) * [100, 5, 100]
+        self.grid = spatial_index.HashGrid(self.position, 2.0, min_overflow=100)
+
+    def brute_force(self, center, radius, valid=None):
+        """ get the expected query result """
+
+        inside = np.linalg.norm(self.position - center, axis=1) <= radius
+        if valid is not None:
+            inside &= valid
+        return np.flatnonzero(inside)
+
+    def assert_query(self, valid=None):
+        """ compare some random queries against a brute force search """
+
+        for i in xrange(20):
+            center = np.random.random(3) * [100, 5, 100]
+            radius = np.random.uniform(0.1, 10)
+            ids = np.sort(self.grid.query(self.position, center, radius))
+            self.assertTrue(np.array_equal(ids, self.brute_force(center, radius, valid)))
+
+    def test_query(self):
+        """ test radius queries against a brute force search """
+
+        self.assert_query()
+
+        # the radius exceeds the grid
+        ids = self.grid.query(self.position, (50, 0, 50), 1000)
+        self.assertEqual(len(ids), len(self.position))
+
+        ids, distance = self.grid.query(self.position, (50, 0, 50), 5, True)
+        self.assertTrue(np.allclose(distance, np.linalg.norm(self.position[ids] - (50, 0, 50), axis=1)))
+
+    def test_move(self):
+        """ test queries after moving points """
+
+        for i in xrange(10):
+            ids = np.random.choice(len(self.position), 50, replace=False)
+            self.position[ids] += np.random.normal(size=(50, 3))
+            self.grid.move(ids)
+            self.assert_query()
+
+        # enough moved points to merge the overflow
+        self.position[:1000] += 1
+        self.grid.move(np.arange(1000))
+        self.assert_query()
+        self.assertEqual(len(self.grid.overflow), 0)
+
+    def test_insert_remove(self):
+        """ test queries after inserting and removing points """
+
+        new_position = np.random.random((500, 3)) * [100, 5, 100]
+        self.grid.insert(np.arange(len(self.position), len(self.position) + 500))
+        self.position = np.r_[self.position, new_position]
+        self.assert_query()
+
+        valid = np.ones(len(self.position), dtype=bool)
+        ids = np.random.choice(len(self.position), 1000, replace=False)
+        valid[ids] = False
+        self.grid.remove(ids)
+        self.assert_query(valid)
+
+        # removed points stay removed when the grid is rebuilt
+        self.grid.move(np.arange(1000, 2000))
+        self.assert_query(valid)
+        self.assertEqual(len(self.grid.overflow), 0)
+
+        # empty grid
+        grid = spatial_index.HashGrid(np.empty((0, 3)), 1.0)
+        self.assertEqual(len(grid.query(np.empty((0, 3)), (0, 0, 0), 1.0)), 0)
@@ -0,0 +1,76 @@
+import os
+import sys
+import shutil
+import tempfile
+
+import maya.cmds as cmds
+import maya.OpenMaya as om
+
+import numpy as np
+
+from test_util import TestCase
+import node_utils
+
+
+class TestSporeNode(TestCase):
+
+    def setUp(self):
+
+        cmds.file(new=True, f=True)
+        self.load_plugin('spore')
+
+        plane = cmds.polyPlane()
+        cone = cmds.polyCone()
+        cmds.select(plane[0], cone[0])
+        self.spore = cmds.spore()[0]
+
+        self.directory = tempfile.mkdtemp()
+        self.scene = os.path.join(self.directory, 'scene.ma')
+
+    def tearDown(self):
+        cmds.file(new=True, f=True)
+        shutil.rmtree(self.directory)
+
+    def get_state(self):
+        """ evaluate the spore node and return its instance data object """
+
+        cmds.dgeval('{}.instanceData'.format(self.spore))
+        node = node_utils.get_mobject_from_name(self.spore)
+        obj_handle = om.MObjectHandle(node)
+        return sys._global_spore_tracking_dir[obj_handle.hashCode()]._state
+
+    def save_and_reopen(self):
+        cmds.file(rename=self.scene)
+        cmds.file(save=True, type='mayaAscii')
+        cmds.file(self.scene, open=True, force=True)
+        return self.get_state()
+
+    def check_clear(self):
+        """ add points, save, clear, save and check nothing comes back """
+
+        state = self.get_state()
+        position = np.random.random((10, 3))
+        index = np.zeros(10, np.int32)
+        state.append_points(position, np.ones((10, 3)), position, index,
+                            np.ones(10, np.int32), position, position,
+                            np.zeros(10), np.zeros(10), index, position)
+        state.set_state()
+
+        state = self.save_and_reopen()
+        self.assertEqual(len(state), 10)
+
+        state.clear()
+        state = self.save_and_reopen()
+        self.assertEqual(len(state), 0)
+
+    def test_save_cleared(self):
+        """ test that clearing a node is saved to the storage attributes """
+
+        self.check_clear()
+
+    def test_save_cleared_external(self):
+        """ test that clearing a node is saved to the external cache file """
+
+        cmds.setAttr('{}.externalCache'.format(self.spore), True)
+        self.check_clear()
+        self.assertTrue(cmds.getAttr('{}.cacheFile'.format(self.spore)))
@@ -0,0 +1,50 @@
+import numpy as np
+
+from test_util import TestCase
+import transform_utils
+
+
+class TestTransformUtils(TestCase):
+
+    def setUp(self):
+        np.random.seed(0)
+
+    def test_euler_roundtrip(self):
+        """ test converting euler angles to matrices and back """
+
+        rotation = np.random.uniform(-np.pi, np.pi, (100, 3))
+        matrix = transform_utils.euler_to_matrix(rotation)
+        result = transform_utils.matrix_to_euler(matrix)
+
+        self.assertTrue(np.allclose(transform_utils.euler_to_matrix(result), matrix))
+
+        # rotating 90 degrees around x turns y into z
+        matrix = transform_utils.euler_to_matrix([[np.pi / 2, 0, 0]])
+        self.assertTrue(np.allclose(np.dot([0, 1, 0], matrix[0]), [0, 0, 1]))
+
+    def test_rotate_into(self):
+        """ test that the source vector is rotated into the target """
+
+        source = np.random.normal(size=(100, 3))
+        target = np.random.normal(size=(100, 3))
+        matrix = transform_utils.rotate_into(source, target)
+        result = np.einsum('ni,nij->nj', transform_utils.normalize(source), matrix)
+        self.assertTrue(np.allclose(result, transform_utils.normalize(target)))
+
+        # half weight
+        matrix = transform_utils.rotate_into((0, 1, 0), (1, 0, 0), 0.5)
+        result = np.dot([0, 1, 0], matrix[0])
+        self.assertTrue(np.allclose(result, [0.5 ** 0.5, 0.5 ** 0.5, 0]))
+
+        # opposite vectors
+        matrix = transform_utils.rotate_into((0, 1, 0), (0, -1, 0))
+        self.assertTrue(np.allclose(np.dot([0, 1, 0], matrix[0]), [0, -1, 0]))
+
+    def test_get_tangent(self):
+        """ test that tangents are normalized and perpendicular """
+
+        normal = transform_utils.normalize(np.random.normal(size=(100, 3)))
+        tangent = transform_utils.get_tangent(normal)
+
+        self.assertTrue(np.allclose(np.linalg.norm(tangent, axis=1), 1))
+        self.assertTrue(np.allclose(np.einsum('ij,ij->i', normal, tangent), 0))
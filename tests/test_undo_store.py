@@ -0,0 +1,43 @@
+import numpy as np
+
+from test_util import TestCase
+import undo_store
+
+
+class TestUndoStore(TestCase):
+
+    def test_add(self):
+        """ test adding, getting and removing records """
+
+        store = undo_store.UndoStore(1024)
+        record = {'index': np.arange(10), 'old': {'scale': np.ones((10, 3))}}
+        key = store.add(record)
+        self.assertTrue(store.get(key) is record)
+        self.assertEqual(store.num_bytes, record['index'].nbytes + 240)
+
+        store.remove(key)
+        self.assertEqual(store.get(key), None)
+        self.assertEqual(store.num_bytes, 0)
+
+        # removing unknown records is ignored
+        store.remove(key)
+        store.remove(None)
+
+    def test_memory_limit(self):
+        """ test that the oldest records are dropped """
+
+        store = undo_store.UndoStore(1000)
+        first = store.add({'index': np.zeros(50)})
+        second = store.add({'index': np.zeros(50)})
+        self.assertEqual(len(store), 2)
+
+        third = store.add({'index': np.zeros(50)})
+        self.assertFalse(first in store)
+        self.assertTrue(second in store)
+        self.assertTrue(third in store)
+        self.assertEqual(store.num_bytes, 800)
+
+        # the newest record is kept even if it exceeds the limit
+        last = store.add({'index': np.zeros(500)})
+        self.assertEqual(len(store), 1)
+        self.assertTrue(last in store)